@@ -0,0 +1,160 @@
+# bar_aggregator.py
+
+import numpy as np
+import pandas as pd
+
+from candle_buffer import CANDLE_COLUMNS, CandleRingBuffer, to_epoch_ms
+from fvg_scanner import FVGTracker
+from kline_archive import INTERVAL_MS
+from swing_detector import SwingDetector
+
+DEFAULT_TIMEFRAMES = ('5m', '15m', '1h', '4h', '1d')
+PRICE_COLUMNS = ('open_time', 'open', 'high', 'low', 'close')
+
+
+class BarAggregator:
+    """
+    کندل‌های ۱ دقیقه‌ای بسته شده را به صورت افزایشی به کندل‌های تایم‌فریم بالاتر تبدیل می‌کند.
+    کندل‌ها مانند بایننس بر اساس زمان UTC (از epoch) تراز می‌شوند؛ یک کندل وقتی بسته می‌شود که
+    کندل ۱ دقیقه‌ای آخر بازه‌اش برسد، یا (در صورت وجود gap یا ری‌استارت) اولین کندل بازه بعدی دیده شود.
+    کندل‌های بسته شده هر تایم‌فریم در یک CandleRingBuffer جداگانه نگهداری می‌شوند.
+    """
+    def __init__(self, timeframes=DEFAULT_TIMEFRAMES, capacity=500, columns=None):
+        self.columns = dict(columns or CANDLE_COLUMNS)
+        self.sum_columns = [name for name in self.columns if name not in PRICE_COLUMNS]
+        self.timeframes = tuple(timeframes)
+        self.tf_ms = {tf: INTERVAL_MS[tf] for tf in self.timeframes}
+        self.bars = {tf: CandleRingBuffer(capacity, self.columns) for tf in self.timeframes}
+        self._partial = {tf: None for tf in self.timeframes}
+        self._swing_detectors = {tf: {} for tf in self.timeframes}
+        self._fvg_trackers = {}
+        self.last_open_time = None
+
+    def _new_bar(self, tf, open_time, candle):
+        bar = {name: candle.get(name, 0) for name in self.columns}
+        bar['open_time'] = open_time - open_time % self.tf_ms[tf]
+        return bar
+
+    def _fold(self, bar, candle):
+        bar['high'] = max(bar['high'], candle['high'])
+        bar['low'] = min(bar['low'], candle['low'])
+        bar['close'] = candle['close']
+        for name in self.sum_columns:
+            bar[name] += candle.get(name, 0)
+
+    def _close(self, tf, closed):
+        bar = self._partial[tf]
+        self._partial[tf] = None
+        self.bars[tf].append(bar)
+        for detector in self._swing_detectors[tf].values():
+            detector.update(bar)
+        if tf in self._fvg_trackers:
+            self._fvg_trackers[tf].update(bar)
+        closed[tf] = _as_candle(bar)
+
+    def update(self, candle):
+        """
+        یک کندل ۱ دقیقه‌ای بسته شده را اعمال می‌کند و کندل‌های بسته شده در این مرحله را
+        به صورت دیکشنری {تایم‌فریم: کندل} برمی‌گرداند (open_time کندل‌ها زمان شروع بازه است).
+        """
+        open_time = to_epoch_ms(candle['open_time'])
+        if self.last_open_time is not None and open_time <= self.last_open_time:
+            return {}
+        self.last_open_time = open_time
+
+        closed = {}
+        for tf, tf_ms in self.tf_ms.items():
+            bar = self._partial[tf]
+            if bar is not None and open_time - bar['open_time'] >= tf_ms:
+                self._close(tf, closed)  # بازه قبلی به دلیل gap ناقص مانده است
+                bar = None
+            if bar is None:
+                self._partial[tf] = self._new_bar(tf, open_time, candle)
+            else:
+                self._fold(bar, candle)
+            if (open_time + INTERVAL_MS['1m']) % tf_ms == 0:
+                self._close(tf, closed)
+        return closed
+
+    def seed_from_frame(self, df):
+        """
+        کندل‌های بسته شده ۱ دقیقه‌ای یک DataFrame (مثلا تاریخچه REST) را به صورت برداری
+        در تمام تایم‌فریم‌ها تجمیع می‌کند. فقط برای مقداردهی اولیه یک aggregator خالی است.
+        """
+        if df is None or df.empty:
+            return
+        df = df.sort_values('open_time')
+        open_times = df['open_time'].map(to_epoch_ms).to_numpy(dtype=np.int64)
+        values = {name: df[name].to_numpy(dtype=float) if name in df.columns else np.zeros(len(df))
+                  for name in self.columns if name != 'open_time'}
+
+        for tf, tf_ms in self.tf_ms.items():
+            buckets = open_times - open_times % tf_ms
+            starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+            ends = np.r_[starts[1:], len(buckets)] - 1
+            aggregated = {
+                'open_time': buckets[starts],
+                'open': values['open'][starts],
+                'high': np.maximum.reduceat(values['high'], starts),
+                'low': np.minimum.reduceat(values['low'], starts),
+                'close': values['close'][ends],
+            }
+            for name in self.sum_columns:
+                aggregated[name] = np.add.reduceat(values[name], starts)
+
+            buffer = self.bars[tf]
+            n_closed = len(starts) - 1
+            if (open_times[-1] + INTERVAL_MS['1m']) % tf_ms == 0:
+                n_closed += 1
+            for i in range(max(0, n_closed - buffer.capacity), n_closed):
+                buffer.append({name: arr[i] for name, arr in aggregated.items()})
+            if n_closed < len(starts):
+                self._partial[tf] = {name: arr[-1].item() for name, arr in aggregated.items()}
+            for key in self._swing_detectors[tf]:
+                self._swing_detectors[tf][key] = SwingDetector(*key).seed_from_frame(buffer.to_frame())
+            if tf in self._fvg_trackers:
+                self._fvg_trackers[tf] = FVGTracker().seed_from_frame(buffer.to_frame())
+        self.last_open_time = int(open_times[-1])
+
+    def swing_detector(self, tf, left, right=None):
+        """
+        SwingDetector مشترک یک تایم‌فریم با پارامترهای (left, right). در اولین درخواست از کندل‌های
+        بسته شده موجود مقداردهی می‌شود و از آن به بعد با بسته شدن هر کندل به‌روز می‌شود.
+        """
+        key = (left, left if right is None else right)
+        detector = self._swing_detectors[tf].get(key)
+        if detector is None:
+            detector = SwingDetector(*key).seed_from_frame(self.bars[tf].to_frame())
+            self._swing_detectors[tf][key] = detector
+        return detector
+
+    def fvg_tracker(self, tf):
+        """FVGTracker مشترک یک تایم‌فریم (گپ‌های باز کندل‌های بسته شده) که با هر کندل بسته شده به‌روز می‌شود."""
+        if tf not in self._fvg_trackers:
+            self._fvg_trackers[tf] = FVGTracker().seed_from_frame(self.bars[tf].to_frame())
+        return self._fvg_trackers[tf]
+
+    def partial(self, tf):
+        """کندل در حال تشکیل یک تایم‌فریم (یا None)."""
+        bar = self._partial[tf]
+        return _as_candle(bar) if bar is not None else None
+
+    def frame(self, tf, include_partial=True):
+        """
+        DataFrame کندل‌های یک تایم‌فریم با همان ساختار CandleRingBuffer.to_frame.
+        با include_partial کندل در حال تشکیل هم (مانند resample روی ۱ دقیقه‌ای‌ها) اضافه می‌شود.
+        """
+        df = self.bars[tf].to_frame()
+        bar = self._partial[tf]
+        if not include_partial or bar is None:
+            return df
+        row = dict(bar)
+        row['open_time'] = pd.Timestamp(bar['open_time'], unit='ms', tz='UTC')
+        partial_df = pd.DataFrame([row], index=pd.DatetimeIndex([row['open_time']], name='timestamp'))
+        return pd.concat([df, partial_df[df.columns]]) if not df.empty else partial_df[list(self.columns)]
+
+
+def _as_candle(bar):
+    candle = dict(bar)
+    candle['open_time'] = pd.Timestamp(bar['open_time'], unit='ms', tz='UTC').to_pydatetime()
+    return candle
@@ -0,0 +1,102 @@
+# candle_buffer.py
+
+from datetime import datetime
+import numpy as np
+import pandas as pd
+
+# ستون‌های پیش‌فرض هر کندل در بافر (زمان به صورت میلی‌ثانیه UTC ذخیره می‌شود)
+CANDLE_COLUMNS = {
+    'open_time': np.int64, 'open': np.float64, 'high': np.float64, 'low': np.float64,
+    'close': np.float64, 'volume': np.float64, 'quote_asset_volume': np.float64,
+    'number_of_trades': np.int64, 'taker_buy_base_asset_volume': np.float64,
+    'taker_buy_quote_asset_volume': np.float64,
+}
+
+
+def to_epoch_ms(value):
+    """زمان (datetime، Timestamp یا عدد میلی‌ثانیه) را به میلی‌ثانیه UTC تبدیل می‌کند."""
+    if isinstance(value, (datetime, pd.Timestamp)):
+        return int(pd.Timestamp(value).value // 1_000_000)
+    return int(value)
+
+
+class CandleRingBuffer:
+    """
+    بافر حلقوی ستونی با ظرفیت ثابت برای کندل‌ها.
+    هر مقدار دو بار (در i و i + capacity) نوشته می‌شود تا آخرین n کندل همیشه یک برش پیوسته
+    از حافظه باشد؛ بنابراین افزودن O(1) است و view ستون‌ها بدون کپی برگردانده می‌شوند.
+    view ها فقط تا افزودن کندل بعدی معتبرند؛ to_frame یک DataFrame مستقل می‌سازد که تا کندل بعدی کش می‌شود.
+    """
+    def __init__(self, capacity, columns=None):
+        self.capacity = capacity
+        self.columns = dict(columns or CANDLE_COLUMNS)
+        self._data = {name: np.zeros(2 * capacity, dtype=dtype) for name, dtype in self.columns.items()}
+        self.total = 0          # تعداد کل کندل‌های اضافه شده از ابتدا (برای شناسایی تغییر نسخه)
+        self._frame = None
+        self._frame_version = -1
+
+    def __len__(self):
+        return min(self.total, self.capacity)
+
+    def __iter__(self):
+        """برای سازگاری با کدهای قدیمی که روی deque از دیکشنری‌ها پیمایش می‌کردند."""
+        for i in range(len(self)):
+            yield self.candle_at(i)
+
+    @property
+    def last_open_time(self):
+        return int(self._data['open_time'][(self.total - 1) % self.capacity]) if self.total else None
+
+    def append(self, candle):
+        """
+        یک کندل (دیکشنری) را اضافه می‌کند. کندل‌های تکراری یا قدیمی‌تر از آخرین کندل نادیده گرفته می‌شوند.
+        در صورت افزوده شدن True برمی‌گرداند.
+        """
+        open_time = to_epoch_ms(candle['open_time'])
+        if self.total and open_time <= self.last_open_time:
+            return False
+        pos = self.total % self.capacity
+        for name, arr in self._data.items():
+            value = open_time if name == 'open_time' else candle.get(name, 0)
+            arr[pos] = value
+            arr[pos + self.capacity] = value
+        self.total += 1
+        return True
+
+    def extend_from_frame(self, df):
+        """کندل‌های یک DataFrame (مثلا تاریخچه REST) را برای مقداردهی اولیه به بافر اضافه می‌کند."""
+        for candle in df.tail(self.capacity).to_dict('records'):
+            self.append(candle)
+
+    def view(self, name, n=None):
+        """آخرین n مقدار یک ستون را به صورت یک برش پیوسته و فقط‌خواندنی (بدون کپی) برمی‌گرداند."""
+        size = len(self) if n is None else min(n, len(self))
+        end = self.total % self.capacity + self.capacity
+        view = self._data[name][end - size:end]
+        view.flags.writeable = False
+        return view
+
+    def candle_at(self, i):
+        """کندل i ام (از قدیمی به جدید، اندیس منفی مجاز) را به صورت دیکشنری برمی‌گرداند."""
+        size = len(self)
+        if i < 0:
+            i += size
+        if not 0 <= i < size:
+            raise IndexError("candle index out of range")
+        pos = self.total % self.capacity + self.capacity - size + i
+        candle = {name: arr[pos].item() for name, arr in self._data.items()}
+        candle['open_time'] = pd.Timestamp(candle['open_time'], unit='ms', tz='UTC').to_pydatetime()
+        return candle
+
+    def to_frame(self):
+        """
+        DataFrame کندل‌ها با ایندکس زمانی (timestamp) و ستون open_time.
+        در هر نسخه (هر کندل جدید) حداکثر یک بار ساخته می‌شود؛ مصرف‌کنندگان نباید آن را تغییر دهند.
+        """
+        if self._frame_version != self.total:
+            data = {name: self.view(name).copy() for name in self.columns}
+            open_time = pd.to_datetime(data['open_time'], unit='ms', utc=True)
+            data['open_time'] = open_time
+            self._frame = pd.DataFrame(data, index=pd.DatetimeIndex(open_time, name='timestamp'))
+            self._frame_version = self.total
+        return self._frame
@@ -1,72 +1,288 @@
+import numpy as np
 import pandas as pd
 import requests
+import random
+import threading
 import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from requests.adapters import HTTPAdapter
 
-def fetch_futures_klines(symbol, interval='1m', start_time_dt=None, end_time_dt=None, proxies=None):
+from kline_archive import INTERVAL_MS, KLINE_DTYPE, default_archive
+from kline_decoder import KlineBatch, decode_kline_rows, json_loads
+
+
+KLINES_URL = "https://fapi.binance.com/fapi/v1/klines"
+KLINES_PAGE_LIMIT = 1500  # حداکثر محدودیت API بایننس
+ARCHIVE_FLUSH_ROWS = 15_000  # تعداد کندل بسته شده قبل از هر ذخیره‌سازی میانی در آرشیو
+
+# شکاف‌های داخلی آرشیو که API هم کندلی برایشان نداشته است (مثلا توقف صرافی) تا دوباره درخواست نشوند
+_empty_gaps = set()   # {(symbol, interval, شروع، پایان)}
+
+
+def _klines_request_weight(limit):
+    """وزن درخواست klines بر اساس مقدار limit (طبق مستندات بایننس فیوچرز)."""
+    if limit < 100: return 1
+    if limit < 500: return 2
+    if limit <= 1000: return 5
+    return 10
+
+
+class WeightBudget:
+    """
+    بودجه مشترک وزن درخواست‌های REST بایننس برای کل برنامه.
+    مقدار مصرف شده از هدر X-MBX-USED-WEIGHT-1M خوانده می‌شود و درخواست‌ها
+    به جای یک sleep ثابت، فقط زمانی متوقف می‌شوند که بودجه دقیقه جاری تمام شده باشد.
+    """
+    def __init__(self, limit_per_minute=2400, safety_ratio=0.8):
+        self.capacity = int(limit_per_minute * safety_ratio)
+        self._lock = threading.Lock()
+        self._window = None
+        self._used = 0
+        self._blocked_until = 0.0
+
+    def _roll_window(self, now):
+        window = int(now // 60)
+        if window != self._window:
+            self._window = window
+            self._used = 0
+
+    def acquire(self, weight):
+        """تا زمانی که بودجه کافی برای درخواست وجود نداشته باشد، صبر می‌کند."""
+        while True:
+            with self._lock:
+                now = time.time()
+                self._roll_window(now)
+                if now >= self._blocked_until and self._used + weight <= self.capacity:
+                    self._used += weight
+                    return
+                wait = max(self._blocked_until - now, (self._window + 1) * 60 - now)
+            time.sleep(min(max(wait, 0.05), 60))
+
+    def update_from_response(self, response):
+        """مقدار واقعی وزن مصرف شده و محدودیت‌های 429/418 را از پاسخ سرور اعمال می‌کند."""
+        with self._lock:
+            self._roll_window(time.time())
+            used = response.headers.get('X-MBX-USED-WEIGHT-1M') or response.headers.get('X-MBX-USED-WEIGHT')
+            if used and used.isdigit():
+                self._used = max(self._used, int(used))
+            if response.status_code in (418, 429):
+                retry_after = response.headers.get('Retry-After', '60')
+                retry_after = int(retry_after) if retry_after.isdigit() else 60
+                self._blocked_until = max(self._blocked_until, time.time() + retry_after)
+                print(f"[WeightBudget] Binance rate limit hit ({response.status_code}). Pausing REST calls for {retry_after}s.")
+
+
+# بودجه وزن، سشن HTTP و استخر ترد به صورت مشترک بین تمام فراخوانی‌ها (از جمله trend_analyzer) استفاده می‌شوند
+rest_weight_budget = WeightBudget()
+_session = requests.Session()
+_session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=16))
+_page_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="KlinePage")
+
+
+def _request_klines_page(params, proxies=None):
+    """یک صفحه کندل را با رعایت بودجه وزن مشترک دریافت کرده و مستقیما به آرایه ستونی دیکود می‌کند."""
+    rest_weight_budget.acquire(_klines_request_weight(params['limit']))
+    response = _session.get(KLINES_URL, params=params, timeout=30, proxies=proxies)
+    rest_weight_budget.update_from_response(response)
+    response.raise_for_status()
+    return decode_kline_rows(json_loads(response.content))
+
+
+def _is_retryable(error):
+    """خطاهای شبکه، 5xx و محدودیت نرخ قابل تکرار هستند؛ خطاهای 4xx دیگر (مثلا نماد اشتباه) خیر."""
+    if isinstance(error, requests.exceptions.HTTPError) and error.response is not None:
+        status = error.response.status_code
+        return status >= 500 or status in (418, 429)
+    return isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout, ValueError))
+
+
+def _request_klines_page_with_retry(params, proxies=None, max_retries=4, backoff_seconds=1.0):
+    """یک صفحه را دریافت کرده و در صورت خطای موقت، با backoff نمایی دوباره تلاش می‌کند."""
+    for attempt in range(max_retries + 1):
+        try:
+            return _request_klines_page(params, proxies)
+        except Exception as e:
+            if attempt == max_retries or not _is_retryable(e):
+                raise
+            delay = backoff_seconds * (2 ** attempt) * (1 + random.random() * 0.25)
+            print(f"Retrying {params['symbol']} page at {params['startTime']} in {delay:.1f}s "
+                  f"(attempt {attempt + 1}/{max_retries}): {e}")
+            time.sleep(delay)
+
+
+def iter_futures_klines(symbol, interval, start_time_ms, end_time_ms, proxies=None, as_frame=False,
+                        max_in_flight=4, max_retries=4):
+    """
+    کندل‌های بازه [start_time_ms, end_time_ms] را به صورت جریانی و صفحه به صفحه (به ترتیب زمانی) برمی‌گرداند.
+    هر تکه یک آرایه ساختاریافته NumPy (یا در صورت as_frame یک DataFrame) با حداکثر ۱۵۰۰ کندل است.
+    حداکثر max_in_flight صفحه همزمان در حال دریافت هستند، بنابراین حافظه مصرفی به اندازه تکه‌ها محدود می‌ماند.
+    اگر صفحه‌ای پس از تمام تلاش‌ها دریافت نشود، خطا پس از تحویل تمام تکه‌های قبلی منتشر می‌شود.
+    """
+    convert = (lambda records: KlineBatch(records).to_frame()) if as_frame else (lambda records: records)
+    interval_ms = INTERVAL_MS.get(interval)
+
+    if interval_ms is None:
+        # برای اینتروال‌های با طول متغیر (1w, 1M) صفحات به ترتیب دریافت می‌شوند
+        while start_time_ms < end_time_ms:
+            params = {'symbol': symbol, 'interval': interval, 'startTime': start_time_ms,
+                      'endTime': end_time_ms, 'limit': KLINES_PAGE_LIMIT}
+            records = _request_klines_page_with_retry(params, proxies, max_retries)
+            if len(records) == 0:
+                return
+            yield convert(records)
+            start_time_ms = int(records['open_time'][-1]) + 1
+        return
+
+    # بازه به پنجره‌های مستقل ۱۵۰۰ کندلی تقسیم شده و پنجره‌ها به صورت همزمان دریافت می‌شوند
+    span = interval_ms * KLINES_PAGE_LIMIT
+    pending = deque()
+    try:
+        for w_start in range(start_time_ms, end_time_ms + 1, span):
+            params = {'symbol': symbol, 'interval': interval, 'startTime': w_start,
+                      'endTime': min(w_start + span - 1, end_time_ms), 'limit': KLINES_PAGE_LIMIT}
+            pending.append(_page_executor.submit(_request_klines_page_with_retry, params, proxies, max_retries))
+            if len(pending) >= max_in_flight:
+                yield convert(pending.popleft().result())
+        while pending:
+            yield convert(pending.popleft().result())
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+def _report_fetch_error(symbol, error):
+    if isinstance(error, requests.exceptions.ProxyError):
+        print(f"Proxy Error for {symbol}: {error}. Please check your proxy settings and ensure it is running.")
+    elif isinstance(error, requests.exceptions.RequestException):
+        print(f"Error fetching data for {symbol} from Binance: {error}")
+    else:
+        print(f"An unexpected error occurred in fetch_futures_klines for {symbol}: {error}")
+
+
+def _missing_ranges(open_times, start_time_ms, end_time_ms, interval_ms, max_rows, empty_gaps=()):
+    """
+    بازه‌هایی از [start_time_ms, end_time_ms] که در آرشیو نیستند (قبل از ابتدا، شکاف‌های داخلی و بعد از انتهای آن)
+    به صورت (شروع، پایان، ذخیره در آرشیو، ذخیره تدریجی). فقط بازه‌هایی ذخیره می‌شوند که به کندل‌های موجود
+    آرشیو متصل باشند یا یک شکاف داخلی را پر کنند، تا در آرشیو شکاف جدیدی ایجاد نشود.
+    """
+    if len(open_times) == 0:
+        return [(start_time_ms, end_time_ms, True, True)]
+    ranges = []
+    first_open, last_open = int(open_times[0]), int(open_times[-1])
+    if start_time_ms < first_open:
+        # بازه ابتدایی فقط در صورت دریافت کامل و اتصال به اولین کندل آرشیو ذخیره می‌شود
+        head_end = min(first_open - 1, end_time_ms)
+        ranges.append((start_time_ms, head_end, head_end == first_open - 1, False))
+
+    # شکاف‌های داخلی آرشیو (مثلا کندل‌های گم‌شده یک دانلود ناقص) که با بازه درخواستی هم‌پوشانی دارند
+    for i in np.flatnonzero(np.diff(open_times) > interval_ms):
+        gap_start = max(int(open_times[i]) + interval_ms, start_time_ms)
+        gap_end = min(int(open_times[i + 1]) - 1, end_time_ms)
+        if gap_start <= gap_end and (gap_start, gap_end) not in empty_gaps:
+            ranges.append((gap_start, gap_end, True, False))
+
+    tail_start = last_open + interval_ms
+    if tail_start <= end_time_ms:
+        if start_time_ms <= tail_start or (start_time_ms - tail_start) // interval_ms < max_rows:
+            # ادامه آرشیو از اولین کندل بعد از آن (حتی اگر قبل از start_time_ms باشد) تا شکافی ایجاد نشود
+            ranges.append((tail_start, end_time_ms, True, True))
+        else:
+            # فاصله تا آرشیو بیشتر از ظرفیت آن است؛ بازه درخواستی فقط برای همین فراخوانی دریافت می‌شود
+            ranges.append((start_time_ms, end_time_ms, False, False))
+    return ranges
+
+
+def _expected_kline_count(start_time_ms, end_time_ms, interval_ms, now_ms):
+    """تعداد کندل‌های (بسته یا در حال تشکیل) بایننس که open_time آن‌ها در بازه درخواستی است."""
+    first = -(-start_time_ms // interval_ms) * interval_ms
+    last = min(end_time_ms, now_ms) // interval_ms * interval_ms
+    return max((last - first) // interval_ms + 1, 0)
+
+
+def fetch_futures_klines(symbol, interval='1m', start_time_dt=None, end_time_dt=None, proxies=None, use_archive=True):
     """
     داده‌های تاریخی کندل را از فیوچرز بایننس دریافت می‌کند.
     این نسخه اصلاح شده و قابلیت استفاده از پروکسی را دارد.
+    ابتدا آرشیو محلی بررسی می‌شود و فقط بخش‌هایی که در آرشیو نیستند از API دریافت می‌شوند.
     """
-    url = "https://fapi.binance.com/fapi/v1/klines"
-    limit = 1500  # حداکثر محدودیت API بایننس
-
     start_time_ms = int(start_time_dt.timestamp() * 1000)
     end_time_ms = int(end_time_dt.timestamp() * 1000)
-    
-    all_data = []
-    
+
     print(f"Fetching {symbol} klines from {start_time_dt.strftime('%Y-%m-%d')} to {end_time_dt.strftime('%Y-%m-%d')}...")
-    
-    while start_time_ms < end_time_ms:
-        params = {
-            'symbol': symbol,
-            'interval': interval,
-            'startTime': start_time_ms,
-            'endTime': end_time_ms,
-            'limit': limit
-        }
+
+    interval_ms = INTERVAL_MS.get(interval)
+    if not use_archive or interval_ms is None:
+        chunks = []
         try:
-            # استفاده از پروکسی در درخواست در صورت وجود
-            response = requests.get(url, params=params, timeout=30, proxies=proxies)
-            response.raise_for_status()
-            data = response.json()
-            
-            if not data:
-                break
-            
-            all_data.extend(data)
-            
-            last_candle_time = data[-1][0]
-            start_time_ms = last_candle_time + 1
-            
-            time.sleep(0.3)
-
-        except requests.exceptions.ProxyError as e:
-            print(f"Proxy Error for {symbol}: {e}. Please check your proxy settings and ensure it is running.")
+            for chunk in iter_futures_klines(symbol, interval, start_time_ms, end_time_ms, proxies):
+                chunks.append(chunk)
+        except Exception as e:
+            _report_fetch_error(symbol, e)
             return pd.DataFrame()
-        except requests.exceptions.RequestException as e:
-            print(f"Error fetching data for {symbol} from Binance: {e}")
+        records = np.concatenate(chunks) if chunks else np.empty(0, dtype=KLINE_DTYPE)
+        if len(records) == 0:
+            print(f"No data could be fetched for {symbol} in the specified range.")
             return pd.DataFrame()
+        print(f"Successfully fetched {len(records)} klines for {symbol}.")
+        return KlineBatch(records).to_frame()
+
+    # --- فقط بازه‌های گم‌شده (ابتدا، شکاف‌های داخلی و انتهای آرشیو) از API درخواست می‌شوند ---
+    archived = default_archive.load(symbol, interval)
+    empty_gaps = {(gap_start, gap_end) for sym, tf, gap_start, gap_end in _empty_gaps if (sym, tf) == (symbol, interval)}
+    missing_ranges = _missing_ranges(archived['open_time'], start_time_ms, end_time_ms, interval_ms,
+                                     default_archive.max_rows, empty_gaps)
+
+    fetched_count = 0
+    extra_records = []   # کندل‌های در حال تشکیل و بازه‌های ذخیره نشده که فقط در خروجی همین فراخوانی هستند
+    is_partial = False
+    now_ms = int(time.time() * 1000)
+    for range_start, range_end, persist, persist_progressively in missing_ranges:
+        buffered = []
+        range_count = 0
+        try:
+            for records in iter_futures_klines(symbol, interval, range_start, range_end, proxies):
+                range_count += len(records)
+                fetched_count += len(records)
+                # کندل‌های در حال تشکیل ذخیره نمی‌شوند ولی در خروجی همین فراخوانی حضور دارند
+                is_closed = records['close_time'] < now_ms
+                extra_records.append(records[~is_closed])
+                buffered.append(records[is_closed])
+                if persist_progressively and sum(len(r) for r in buffered) >= ARCHIVE_FLUSH_ROWS:
+                    default_archive.merge(symbol, interval, np.concatenate(buffered))
+                    buffered = []
+            if range_count == 0 and persist and not persist_progressively:
+                _empty_gaps.add((symbol, interval, range_start, range_end))
         except Exception as e:
-            print(f"An unexpected error occurred in fetch_futures_klines for {symbol}: {e}")
-            return pd.DataFrame()
+            _report_fetch_error(symbol, e)
+            is_partial = True
+            if not persist_progressively:
+                buffered = []
+        finally:
+            # صفحات دریافت شده تا لحظه خطا حفظ می‌شوند تا فراخوانی بعدی از همان نقطه ادامه دهد
+            if buffered and persist:
+                default_archive.merge(symbol, interval, np.concatenate(buffered))
+            elif buffered:
+                extra_records.append(np.concatenate(buffered))
+
+    result = default_archive.select(symbol, interval, start_time_ms, end_time_ms)
+    if extra_records:
+        result = np.concatenate([result] + extra_records)
+        result = result[(result['open_time'] >= start_time_ms) & (result['open_time'] <= end_time_ms)]
+        _, first_idx = np.unique(result['open_time'], return_index=True)
+        result = result[first_idx]
 
-    if not all_data:
+    if len(result) == 0:
         print(f"No data could be fetched for {symbol} in the specified range.")
         return pd.DataFrame()
 
-    print(f"Successfully fetched {len(all_data)} klines for {symbol}.")
-    
-    df = pd.DataFrame(all_data, columns=[
-        'open_time', 'open', 'high', 'low', 'close', 'volume', 'close_time',
-        'quote_asset_volume', 'number_of_trades', 'taker_buy_base_asset_volume',
-        'taker_buy_quote_asset_volume', 'ignore'
-    ])
-    
-    df['open_time'] = pd.to_datetime(df['open_time'], unit='ms', utc=True)
-    numeric_cols = ['open', 'high', 'low', 'close', 'volume', 'quote_asset_volume', 'taker_buy_base_asset_volume']
-    for col in numeric_cols:
-        df[col] = pd.to_numeric(df[col], errors='coerce')
-    
-    return df[['open_time', 'open', 'high', 'low', 'close', 'volume', 'taker_buy_base_asset_volume']]
\ No newline at end of file
+    # بررسی پیوستگی: کندل‌هایی که حتی پس از پر کردن شکاف‌ها در پاسخ API هم نبوده‌اند (مثلا توقف صرافی)
+    missing = _expected_kline_count(start_time_ms, end_time_ms, interval_ms, now_ms) - len(result)
+    if is_partial:
+        print(f"⚠️ Download for {symbol} was interrupted. Returning {len(result)} klines available so far.")
+    elif missing > 0:
+        print(f"⚠️ {missing} {interval} klines for {symbol} are not available from Binance in the specified range.")
+    else:
+        print(f"Successfully fetched {fetched_count} new klines for {symbol} ({len(result)} total with archive).")
+    return KlineBatch(result).to_frame()
@@ -0,0 +1,190 @@
+# footprint.py
+
+from collections import deque
+import numpy as np
+
+from kline_decoder import json_loads
+
+
+class FootprintBar:
+    """
+    فوت‌پرینت یک کندل: حجم خرید (taker buy) و فروش (taker sell) به تفکیک هر بین قیمتی به اندازه tick_size.
+    معاملات ابتدا فقط در لیست‌های موقت ذخیره می‌شوند و هنگام خواندن (یا بسته شدن کندل) با np.bincount
+    به صورت یک‌جا در آرایه‌ها جمع می‌شوند؛ بنابراین هزینه هر معامله در مسیر داغ فقط یک append است.
+    """
+    def __init__(self, open_time, tick_size):
+        self.open_time = open_time          # میلی‌ثانیه UTC
+        self.tick_size = tick_size
+        self.base = 0
+        self.buy = np.zeros(0)
+        self.sell = np.zeros(0)
+        self.trade_count = 0
+        self._prices, self._qtys, self._sells = [], [], []
+
+    def add_trade(self, price, qty, is_sell):
+        self._prices.append(price)
+        self._qtys.append(qty)
+        self._sells.append(is_sell)
+        self.trade_count += 1
+
+    def _fold(self):
+        if not self._prices:
+            return
+        bins = np.floor(np.asarray(self._prices) / self.tick_size).astype(np.int64)
+        qtys = np.asarray(self._qtys)
+        sells = np.asarray(self._sells, dtype=bool)
+        self._prices, self._qtys, self._sells = [], [], []
+
+        lo, hi = int(bins.min()), int(bins.max())
+        if len(self.buy):
+            lo, hi = min(lo, self.base), max(hi, self.base + len(self.buy) - 1)
+        size = hi - lo + 1
+        # bincount روی ورودی خالی آرایه صحیح برمی‌گرداند؛ بنابراین نوع خروجی صریحا float تعیین می‌شود
+        buy = np.bincount(bins[~sells] - lo, weights=qtys[~sells], minlength=size).astype(np.float64, copy=False)
+        sell = np.bincount(bins[sells] - lo, weights=qtys[sells], minlength=size).astype(np.float64, copy=False)
+        if len(self.buy):
+            offset = self.base - lo
+            buy[offset:offset + len(self.buy)] += self.buy
+            sell[offset:offset + len(self.sell)] += self.sell
+        self.base, self.buy, self.sell = lo, buy, sell
+
+    def volumes(self):
+        """(قیمت پایین هر بین، حجم خرید، حجم فروش) به صورت سه آرایه هم‌اندازه."""
+        self._fold()
+        prices = (self.base + np.arange(len(self.buy))) * self.tick_size
+        return prices, self.buy, self.sell
+
+    @property
+    def buy_volume(self):
+        self._fold()
+        return float(self.buy.sum())
+
+    @property
+    def sell_volume(self):
+        self._fold()
+        return float(self.sell.sum())
+
+    @property
+    def volume(self):
+        return self.buy_volume + self.sell_volume
+
+    @property
+    def delta(self):
+        """دلتای واقعی کندل (حجم خرید تهاجمی منهای حجم فروش تهاجمی)."""
+        return self.buy_volume - self.sell_volume
+
+    @property
+    def poc(self):
+        """قیمت (وسط) پرحجم‌ترین بین کندل."""
+        prices, buy, sell = self.volumes()
+        if len(prices) == 0:
+            return None
+        return float(prices[int(np.argmax(buy + sell))] + self.tick_size / 2)
+
+    def delta_between(self, low, high):
+        """دلتای معاملات انجام شده در بازه قیمتی [low, high] (مثلا زیر یک سطح شکار شده)."""
+        prices, buy, sell = self.volumes()
+        mask = (prices + self.tick_size > low) & (prices <= high)
+        return float(buy[mask].sum() - sell[mask].sum())
+
+
+class FootprintBuilder:
+    """
+    معاملات استریم @aggTrade یک نماد را در کندل‌های فوت‌پرینت (پیش‌فرض ۱ دقیقه‌ای) جمع می‌کند.
+    فقط آخرین max_bars کندل نگهداری می‌شود تا مصرف حافظه محدود بماند.
+    handler در ترد پردازش MarketDataGateway اجرا می‌شود؛ همان تردی که کندل‌های مانیتور را پردازش می‌کند.
+    """
+    def __init__(self, symbol, tick_size, interval_ms=60_000, max_bars=120):
+        self.symbol = symbol
+        self.tick_size = tick_size
+        self.interval_ms = interval_ms
+        self.bars = deque(maxlen=max_bars)
+        self.current = None
+        self.stream = f"{symbol.lower()}@aggTrade"
+        self.gateway = None
+
+    def add_trade(self, price, qty, is_buyer_maker, trade_time):
+        """یک معامله را اضافه می‌کند. is_buyer_maker=True یعنی فروشنده تهاجمی (taker sell) بوده است."""
+        open_time = trade_time - trade_time % self.interval_ms
+        bar = self.current
+        if bar is None or open_time != bar.open_time:
+            if bar is not None and open_time < bar.open_time:
+                return  # معامله دیررس از کندل قبلی (پس از بسته شدن آن) نادیده گرفته می‌شود
+            if bar is not None:
+                bar._fold()
+                self.bars.append(bar)
+            bar = self.current = FootprintBar(open_time, self.tick_size)
+        bar.add_trade(price, qty, is_buyer_maker)
+
+    def on_stream_event(self, data):
+        """رویداد aggTrade دریافتی از MarketDataGateway."""
+        if data.get('e') == 'aggTrade':
+            self.add_trade(float(data['p']), float(data['q']), data['m'], int(data['T']))
+
+    def bar_for(self, open_time_ms):
+        """کندل فوت‌پرینت با زمان شروع مشخص (کندل جاری یا یکی از کندل‌های بسته شده اخیر) یا None."""
+        if self.current is not None and self.current.open_time == open_time_ms:
+            return self.current
+        for bar in reversed(self.bars):
+            if bar.open_time == open_time_ms:
+                return bar
+            if bar.open_time < open_time_ms:
+                break
+        return None
+
+    def subscribe(self, gateway):
+        self.gateway = gateway
+        gateway.subscribe(self.stream, self.on_stream_event)
+
+    def unsubscribe(self):
+        if self.gateway is not None:
+            self.gateway.unsubscribe(self.stream, self.on_stream_event)
+            self.gateway = None
+
+
+def _synthetic_recording(n_trades, start_ms=1_700_000_000_000, trades_per_second=3_000, seed=0):
+    """یک ضبط مصنوعی از پیام‌های خام combined-stream برای aggTrade (در نبود فایل ضبط شده)."""
+    rng = np.random.default_rng(seed)
+    prices = 60_000 + np.cumsum(rng.standard_normal(n_trades)) * 0.5
+    qtys = rng.exponential(0.05, n_trades)
+    times = start_ms + (np.arange(n_trades) * 1000 // trades_per_second)
+    makers = rng.random(n_trades) < 0.5
+    return [
+        ('{"stream":"btcusdt@aggTrade","data":{"e":"aggTrade","E":%d,"s":"BTCUSDT","a":%d,"p":"%.1f","q":"%.3f",'
+         '"f":%d,"l":%d,"T":%d,"m":%s}}' % (t, i, p, q, i, i, t, 'true' if m else 'false')).encode()
+        for i, (p, q, t, m) in enumerate(zip(prices, qtys, times, makers))
+    ]
+
+
+def run_benchmark(recording_path=None, n_trades=500_000, tick_size=1.0):
+    """
+    توان عملیاتی مسیر کامل (پارس پیام خام + افزودن به فوت‌پرینت) را روی یک ضبط از پیام‌ها اندازه می‌گیرد.
+    recording_path فایلی با یک پیام خام combined-stream در هر خط است؛ در غیر این صورت یک ضبط مصنوعی ساخته می‌شود.
+    """
+    import time
+    if recording_path:
+        with open(recording_path, 'rb') as f:
+            messages = [line.strip() for line in f if line.strip()]
+        source = recording_path
+    else:
+        messages = _synthetic_recording(n_trades)
+        source = "synthetic"
+
+    builder = FootprintBuilder('BTCUSDT', tick_size)
+    t0 = time.perf_counter()
+    for message in messages:
+        builder.on_stream_event(json_loads(message)['data'])
+    for bar in list(builder.bars) + [builder.current]:
+        bar.volumes()
+    elapsed = time.perf_counter() - t0
+
+    rate = len(messages) / elapsed
+    print(f"Replayed {len(messages):,} aggTrade messages ({source}) into {len(builder.bars) + 1} footprint bars:")
+    print(f"  elapsed    : {elapsed * 1000:10.1f} ms")
+    print(f"  throughput : {rate:10,.0f} trades/s")
+    print(f"  per trade  : {elapsed / len(messages) * 1e6:10.2f} us")
+
+
+if __name__ == "__main__":
+    import sys
+    run_benchmark(sys.argv[1] if len(sys.argv) > 1 else None)
@@ -0,0 +1,181 @@
+# fvg_scanner.py
+
+from collections import deque
+import numpy as np
+import pandas as pd
+
+from candle_buffer import to_epoch_ms
+
+# وضعیت هر FVG
+OPEN = 0
+MITIGATED = 1    # قیمت وارد گپ شده ولی آن را کامل پر نکرده است
+FILLED = 2
+
+STATUS_NAMES = {OPEN: "Open", MITIGATED: "Mitigated", FILLED: "Filled"}
+
+BULLISH = 1
+BEARISH = -1
+
+_DIRECTIONS = {'Bullish': BULLISH, 'Buy': BULLISH, 'Bearish': BEARISH, 'Sell': BEARISH}
+
+
+def _direction_code(direction):
+    return _DIRECTIONS[direction] if isinstance(direction, str) else direction
+
+
+def detect_fvgs(highs, lows):
+    """
+    گپ‌های سه کندلی (FVG) را با مقایسه آرایه‌ای پیدا می‌کند.
+    گپ صعودی وقتی است که low کندل سوم بالای high کندل اول باشد و گپ نزولی برعکس.
+    خروجی: (اندیس کندل اول، جهت، سقف گپ، کف گپ) به صورت چهار آرایه هم‌اندازه.
+    """
+    if len(highs) < 3:
+        empty = np.zeros(0)
+        return empty.astype(np.int64), empty.astype(np.int8), empty, empty
+    bull = lows[2:] > highs[:-2]
+    bear = highs[2:] < lows[:-2]
+    first = np.flatnonzero(bull | bear)
+    is_bull = bull[first]
+    directions = np.where(is_bull, BULLISH, BEARISH).astype(np.int8)
+    tops = np.where(is_bull, lows[first + 2], lows[first])
+    bottoms = np.where(is_bull, highs[first], highs[first + 2])
+    return first, directions, tops, bottoms
+
+
+def fvg_status(first, directions, tops, bottoms, highs, lows):
+    """
+    وضعیت هر گپ نسبت به کندل‌های بعد از کندل سوم آن (تا انتهای آرایه)، با کمینه/بیشینه تجمعی از انتها.
+    گپ صعودی با رسیدن low به سقف گپ Mitigated و با رسیدن به کف آن Filled می‌شود؛ گپ نزولی برعکس.
+    """
+    future_low = np.append(np.minimum.accumulate(lows[::-1])[::-1], np.inf)[first + 3]
+    future_high = np.append(np.maximum.accumulate(highs[::-1])[::-1], -np.inf)[first + 3]
+    bull = directions == BULLISH
+    filled = np.where(bull, future_low <= bottoms, future_high >= tops)
+    mitigated = np.where(bull, future_low <= tops, future_high >= bottoms)
+    return np.where(filled, FILLED, np.where(mitigated, MITIGATED, OPEN)).astype(np.int8)
+
+
+def scan_fvgs(df, direction=None, include_filled=False):
+    """
+    FVG های یک بازه کندل (DataFrame با ایندکس زمانی) به صورت لیست دیکشنری، از قدیمی به جدید.
+    وضعیت هر گپ فقط با کندل‌های همین بازه تعیین می‌شود؛ گپ‌های پر شده به صورت پیش‌فرض حذف می‌شوند.
+    """
+    highs = df['high'].to_numpy(dtype=float)
+    lows = df['low'].to_numpy(dtype=float)
+    first, directions, tops, bottoms = detect_fvgs(highs, lows)
+    status = fvg_status(first, directions, tops, bottoms, highs, lows)
+    keep = np.ones(len(first), dtype=bool)
+    if direction is not None:
+        keep &= directions == _direction_code(direction)
+    if not include_filled:
+        keep &= status != FILLED
+    return [_as_gap(df.index[first[k]], df.index[first[k] + 1], directions[k], tops[k], bottoms[k], status[k])
+            for k in np.flatnonzero(keep)]
+
+
+def _as_gap(start_time, time, direction, top, bottom, status):
+    return {
+        'direction': 'Bullish' if direction == BULLISH else 'Bearish',
+        'top': float(top), 'bottom': float(bottom),
+        'start_time': start_time,      # زمان کندل اول الگو
+        'time': time,                  # زمان کندل میانی (کندل ایجاد کننده گپ)
+        'status': STATUS_NAMES[int(status)]
+    }
+
+
+class FVGTracker:
+    """
+    لیست زنده FVG های باز (Open یا Mitigated) یک تایم‌فریم که با بسته شدن هر کندل به‌روز می‌شود.
+    گپ‌ها در آرایه‌های هم‌اندیس NumPy نگهداری می‌شوند تا بررسی پر شدن همه گپ‌ها با هر کندل
+    یک مقایسه برداری باشد؛ گپ‌های Filled حذف و حداکثر capacity گپ جدید نگهداری می‌شود.
+    """
+    def __init__(self, capacity=200):
+        self.capacity = capacity
+        self.start_times = np.zeros(0, dtype=np.int64)
+        self.times = np.zeros(0, dtype=np.int64)
+        self.directions = np.zeros(0, dtype=np.int8)
+        self.tops = np.zeros(0)
+        self.bottoms = np.zeros(0)
+        self.status = np.zeros(0, dtype=np.int8)
+        self._last_bars = deque(maxlen=2)
+
+    def __len__(self):
+        return len(self.tops)
+
+    def _keep(self, mask):
+        idx = np.flatnonzero(mask)[-self.capacity:]
+        self.start_times, self.times = self.start_times[idx], self.times[idx]
+        self.directions, self.status = self.directions[idx], self.status[idx]
+        self.tops, self.bottoms = self.tops[idx], self.bottoms[idx]
+
+    def update(self, bar):
+        """یک کندل بسته شده (دیکشنری با open_time، high و low) را اعمال و گپ جدید احتمالی را برمی‌گرداند."""
+        open_time, high, low = to_epoch_ms(bar['open_time']), float(bar['high']), float(bar['low'])
+        if len(self.tops):
+            bull = self.directions == BULLISH
+            filled = np.where(bull, low <= self.bottoms, high >= self.tops)
+            mitigated = np.where(bull, low <= self.tops, high >= self.bottoms)
+            self.status[mitigated & (self.status == OPEN)] = MITIGATED
+            if filled.any():
+                self._keep(~filled)
+
+        new_gap = None
+        if len(self._last_bars) == 2:
+            (t1, h1, l1), (t2, _, _) = self._last_bars
+            if low > h1:
+                new_gap = (t1, t2, BULLISH, low, h1)
+            elif high < l1:
+                new_gap = (t1, t2, BEARISH, l1, high)
+        self._last_bars.append((open_time, high, low))
+        if new_gap is not None:
+            self._append(*new_gap, OPEN)
+            return self._gap_at(len(self.tops) - 1)
+        return None
+
+    def _append(self, start_time, time, direction, top, bottom, status):
+        self.start_times = np.append(self.start_times, start_time)
+        self.times = np.append(self.times, time)
+        self.directions = np.append(self.directions, np.int8(direction))
+        self.tops = np.append(self.tops, top)
+        self.bottoms = np.append(self.bottoms, bottom)
+        self.status = np.append(self.status, np.int8(status))
+        if len(self.tops) > self.capacity:
+            self._keep(np.ones(len(self.tops), dtype=bool))
+
+    def seed_from_frame(self, df):
+        """گپ‌های باز کندل‌های بسته شده یک DataFrame را به صورت برداری پیدا می‌کند (برای tracker خالی)."""
+        if df is None or df.empty:
+            return self
+        open_times = df['open_time'] if 'open_time' in df.columns else df.index
+        times = np.array([to_epoch_ms(t) for t in open_times], dtype=np.int64)
+        highs = df['high'].to_numpy(dtype=float)
+        lows = df['low'].to_numpy(dtype=float)
+        first, directions, tops, bottoms = detect_fvgs(highs, lows)
+        status = fvg_status(first, directions, tops, bottoms, highs, lows)
+        live = np.flatnonzero(status != FILLED)[-self.capacity:]
+        self.start_times, self.times = times[first[live]], times[first[live] + 1]
+        self.directions, self.status = directions[live], status[live]
+        self.tops, self.bottoms = tops[live], bottoms[live]
+        self._last_bars.clear()
+        for i in range(max(0, len(times) - 2), len(times)):
+            self._last_bars.append((int(times[i]), float(highs[i]), float(lows[i])))
+        return self
+
+    def _gap_at(self, i):
+        return _as_gap(pd.Timestamp(self.start_times[i], unit='ms', tz='UTC'),
+                       pd.Timestamp(self.times[i], unit='ms', tz='UTC'),
+                       self.directions[i], self.tops[i], self.bottoms[i], self.status[i])
+
+    def open_gaps(self, direction=None, since=None, include_mitigated=True):
+        """
+        گپ‌های پر نشده (از قدیمی به جدید)، در صورت نیاز فقط یک جهت ('Bullish'/'Bearish' یا 'Buy'/'Sell')
+        و فقط الگوهایی که کندل اولشان از زمان since به بعد است (مثلا «داخل لگ CHOCH»).
+        """
+        mask = np.ones(len(self.tops), dtype=bool)
+        if direction is not None:
+            mask &= self.directions == _direction_code(direction)
+        if since is not None:
+            mask &= self.start_times >= to_epoch_ms(since)
+        if not include_mitigated:
+            mask &= self.status == OPEN
+        return [self._gap_at(i) for i in np.flatnonzero(mask)]
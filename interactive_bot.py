@@ -176,6 +176,7 @@ class InteractiveBot:
             trend = state.get('htf_trend')
             levels = state.get('untouched_levels')
             klines = state.get('klines_1m') # Assuming klines_1m is a DataFrame
+            atr = state.get('atr_1m') # مقدار به‌روز ATR که MasterMonitor به صورت افزایشی منتشر می‌کند
             level_tests = state.get('level_test_counts', {})
             
             if not trend or not levels or trend == "INSUFFICIENT_DATA":
@@ -184,8 +185,14 @@ class InteractiveBot:
             
             message += f"\n--- **{symbol}** (روند: **{trend}**) ---\n"
             
-            if klines is not None and not klines.empty and len(klines) > 14:
+            developing = state.get('developing_profile') or {}
+            if developing.get('poc'):
+                message += (f"📊 پروفایل امروز: dPOC `{developing['poc']:,.2f}` | "
+                            f"dVAH `{developing['vah']:,.2f}` | dVAL `{developing['val']:,.2f}`\n")
+            
+            if not atr and klines is not None and not klines.empty and len(klines) > 14:
                 atr = calculate_atr(klines)
+            if atr:
                 last_price = state.get('last_price')
                 if last_price and atr < last_price * 0.001:
                     message += "⚠️ **هشدار**: نوسانات بازار در حال حاضر پایین است.\n"
@@ -0,0 +1,97 @@
+# kline_archive.py
+
+import os
+import threading
+import numpy as np
+
+# طول هر اینتروال بر حسب میلی‌ثانیه (فقط اینتروال‌های با طول ثابت قابل آرشیو هستند)
+INTERVAL_MS = {
+    '1m': 60_000, '3m': 180_000, '5m': 300_000, '15m': 900_000, '30m': 1_800_000,
+    '1h': 3_600_000, '2h': 7_200_000, '4h': 14_400_000, '6h': 21_600_000,
+    '8h': 28_800_000, '12h': 43_200_000, '1d': 86_400_000,
+}
+
+# ساختار ستونی هر کندل در آرشیو (همان ستون‌های پاسخ بایننس، بدون ستون ignore)
+KLINE_DTYPE = np.dtype([
+    ('open_time', 'i8'), ('open', 'f8'), ('high', 'f8'), ('low', 'f8'), ('close', 'f8'),
+    ('volume', 'f8'), ('close_time', 'i8'), ('quote_asset_volume', 'f8'),
+    ('number_of_trades', 'i8'), ('taker_buy_base_asset_volume', 'f8'),
+    ('taker_buy_quote_asset_volume', 'f8'),
+])
+
+
+class KlineArchive:
+    """
+    آرشیو محلی و ستونی کندل‌ها به ازای هر نماد و اینتروال.
+    فقط کندل‌های بسته‌شده ذخیره می‌شوند تا در اجراهای بعدی فقط بخش جدید از API دریافت شود.
+    """
+    def __init__(self, root_dir=None, max_rows=100_000):
+        self.root_dir = root_dir or os.getenv('KLINE_ARCHIVE_DIR', 'kline_archive')
+        self.max_rows = max_rows
+        self._cache = {}
+        self._locks = {}
+        self._global_lock = threading.Lock()
+
+    def _lock_for(self, symbol, interval):
+        with self._global_lock:
+            return self._locks.setdefault((symbol.upper(), interval), threading.Lock())
+
+    def _path(self, symbol, interval):
+        return os.path.join(self.root_dir, f"{symbol.upper()}_{interval}.npy")
+
+    def _load_unlocked(self, symbol, interval):
+        key = (symbol.upper(), interval)
+        if key not in self._cache:
+            path = self._path(symbol, interval)
+            records = np.empty(0, dtype=KLINE_DTYPE)
+            if os.path.exists(path):
+                try:
+                    loaded = np.load(path, allow_pickle=False)
+                    if loaded.dtype == KLINE_DTYPE:
+                        records = loaded
+                    else:
+                        print(f"[KlineArchive] Schema mismatch in {path}. Ignoring archived data.")
+                except (OSError, ValueError) as e:
+                    print(f"[KlineArchive] Could not read {path}: {e}. Ignoring archived data.")
+            self._cache[key] = records
+        return self._cache[key]
+
+    def load(self, symbol, interval):
+        """تمام کندل‌های آرشیو شده یک نماد و اینتروال را (مرتب بر اساس زمان) برمی‌گرداند."""
+        with self._lock_for(symbol, interval):
+            return self._load_unlocked(symbol, interval)
+
+    def merge(self, symbol, interval, records):
+        """کندل‌های جدید را با آرشیو ادغام کرده، تکراری‌ها را حذف و نتیجه را روی دیسک ذخیره می‌کند."""
+        if len(records) == 0:
+            return self.load(symbol, interval)
+
+        with self._lock_for(symbol, interval):
+            existing = self._load_unlocked(symbol, interval)
+            combined = np.concatenate([existing, records])
+            # برای open_time های تکراری، آخرین نسخه (جدیدترین دریافت) حفظ می‌شود
+            _, last_idx = np.unique(combined['open_time'][::-1], return_index=True)
+            combined = combined[len(combined) - 1 - last_idx]
+            if len(combined) > self.max_rows:
+                combined = combined[-self.max_rows:]
+
+            os.makedirs(self.root_dir, exist_ok=True)
+            path = self._path(symbol, interval)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'wb') as f:
+                np.save(f, combined, allow_pickle=False)
+            os.replace(tmp_path, path)
+
+            self._cache[(symbol.upper(), interval)] = combined
+            return combined
+
+    def select(self, symbol, interval, start_ms, end_ms):
+        """کندل‌های آرشیو شده در بازه [start_ms, end_ms] را برمی‌گرداند."""
+        records = self.load(symbol, interval)
+        lo = np.searchsorted(records['open_time'], start_ms, side='left')
+        hi = np.searchsorted(records['open_time'], end_ms, side='right')
+        return records[lo:hi]
+
+
+# یک نمونه مشترک برای کل برنامه
+default_archive = KlineArchive()
@@ -0,0 +1,117 @@
+# kline_decoder.py
+
+import json
+import numpy as np
+import pandas as pd
+
+from kline_archive import KLINE_DTYPE
+
+# در صورت نصب بودن orjson از آن استفاده می‌شود، در غیر این صورت json استاندارد
+try:
+    import orjson as _fast_json
+    json_loads = _fast_json.loads
+except ImportError:
+    json_loads = json.loads
+
+FRAME_COLUMNS = ['open_time', 'open', 'high', 'low', 'close', 'volume', 'quote_asset_volume', 'number_of_trades',
+                 'taker_buy_base_asset_volume', 'taker_buy_quote_asset_volume']
+
+
+def kline_dtype(float_dtype='f8'):
+    """ساختار ستونی کندل با دقت اعشاری دلخواه (f8 یا f4). ستون‌های زمان و تعداد معاملات همیشه int64 هستند."""
+    if np.dtype(float_dtype) == np.float64:
+        return KLINE_DTYPE
+    return np.dtype([(name, KLINE_DTYPE[name] if KLINE_DTYPE[name].kind == 'i' else float_dtype)
+                     for name in KLINE_DTYPE.names])
+
+
+class KlineBatch:
+    """
+    نتیجه دیکود یک پاسخ kline به صورت یک آرایه ساختاریافته NumPy.
+    records آرایه اصلی است و to_frame یک DataFrame بدون کپی روی همان حافظه می‌سازد.
+    """
+    def __init__(self, records):
+        self.records = records
+
+    def __len__(self):
+        return len(self.records)
+
+    def column(self, name):
+        return self.records[name]
+
+    def to_frame(self, columns=FRAME_COLUMNS):
+        df = pd.DataFrame({name: self.records[name] for name in columns}, copy=False)
+        df['open_time'] = pd.to_datetime(df['open_time'], unit='ms', utc=True)
+        return df
+
+
+def decode_kline_rows(rows, float_dtype='f8'):
+    """
+    لیست کندل‌های بایننس (لیستی از لیست‌ها) را مستقیما در یک آرایه ساختاریافته از پیش تخصیص یافته می‌ریزد.
+    هر ستون با یک پیمایش np.fromiter پر می‌شود و هیچ DataFrame یا آرایه object میانی ساخته نمی‌شود.
+    """
+    dtype = kline_dtype(float_dtype)
+    n = len(rows)
+    records = np.empty(n, dtype=dtype)
+    if n == 0:
+        return records
+    for i, name in enumerate(dtype.names):
+        records[name] = np.fromiter((row[i] for row in rows), dtype=dtype[name], count=n)
+    return records
+
+
+def decode_klines(payload, float_dtype='f8'):
+    """بدنه خام پاسخ (bytes یا str) یا لیست از قبل پارس شده را به یک KlineBatch تبدیل می‌کند."""
+    rows = json_loads(payload) if isinstance(payload, (bytes, bytearray, memoryview, str)) else payload
+    return KlineBatch(decode_kline_rows(rows, float_dtype))
+
+
+def _legacy_decode(payload):
+    """مسیر قبلی ساخت DataFrame از لیست رشته‌ها (فقط برای مقایسه در بنچمارک)."""
+    df = pd.DataFrame(json.loads(payload), columns=[
+        'open_time', 'open', 'high', 'low', 'close', 'volume', 'close_time',
+        'quote_asset_volume', 'number_of_trades', 'taker_buy_base_asset_volume',
+        'taker_buy_quote_asset_volume', 'ignore'
+    ])
+    df['open_time'] = pd.to_datetime(df['open_time'], unit='ms', utc=True)
+    numeric_cols = ['open', 'high', 'low', 'close', 'volume', 'quote_asset_volume', 'number_of_trades',
+                    'taker_buy_base_asset_volume', 'taker_buy_quote_asset_volume']
+    for col in numeric_cols:
+        df[col] = pd.to_numeric(df[col], errors='coerce')
+    return df[FRAME_COLUMNS]
+
+
+def run_benchmark(n_rows=14_400, repeats=20):
+    """مقایسه زمان دیکود مسیر قدیمی و دیکودر ستونی روی یک پاسخ مصنوعی با n_rows کندل."""
+    import time
+    rng = np.random.default_rng(0)
+    start = 1_700_000_000_000
+    closes = 30_000 + rng.standard_normal(n_rows).cumsum()
+    rows = [[start + i * 60_000, f"{c:.2f}", f"{c + 5:.2f}", f"{c - 5:.2f}", f"{c + 1:.2f}",
+             f"{rng.random() * 100:.3f}", start + i * 60_000 + 59_999, f"{c * 50:.2f}", int(rng.integers(1, 5000)),
+             f"{rng.random() * 50:.3f}", f"{c * 25:.2f}", "0"] for i, c in enumerate(closes)]
+    payload = json.dumps(rows).encode()
+
+    def timeit(fn):
+        best = float('inf')
+        for _ in range(repeats):
+            t0 = time.perf_counter()
+            fn()
+            best = min(best, time.perf_counter() - t0)
+        return best * 1000
+
+    legacy_ms = timeit(lambda: _legacy_decode(payload))
+    batch_ms = timeit(lambda: decode_klines(payload))
+    frame_ms = timeit(lambda: decode_klines(payload).to_frame())
+    f4_ms = timeit(lambda: decode_klines(payload, float_dtype='f4').to_frame())
+    parser = getattr(json_loads, '__module__', 'json')
+    print(f"Decoding {n_rows} klines (best of {repeats}, JSON parser: {parser}):")
+    print(f"  legacy list-of-lists DataFrame : {legacy_ms:8.2f} ms")
+    print(f"  columnar records               : {batch_ms:8.2f} ms")
+    print(f"  columnar records + frame view  : {frame_ms:8.2f} ms")
+    print(f"  columnar float32 + frame view  : {f4_ms:8.2f} ms")
+    print(f"  speedup (frame view vs legacy) : {legacy_ms / frame_ms:8.2f}x")
+
+
+if __name__ == "__main__":
+    run_benchmark()
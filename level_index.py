@@ -0,0 +1,71 @@
+# level_index.py
+
+import numpy as np
+
+# وضعیت هر سطح در LevelIndex
+UNTOUCHED = 0
+TOUCHED = 1
+EVALUATED = 2
+
+STATUS_NAMES = {UNTOUCHED: "Untouched", TOUCHED: "Touched", EVALUATED: "Evaluated"}
+
+
+class LevelIndex:
+    """
+    ایندکس مرتب سطوح کلیدی یک نماد.
+    قیمت سطوح در یک آرایه مرتب NumPy نگهداری می‌شود تا پرس‌وجوهایی مثل «سطوح داخل بازه
+    [low, high]» یا «نزدیک‌ترین سطح بالا/پایین قیمت» با جستجوی دودویی در O(log n) انجام شوند.
+    وضعیت و تعداد تست هر سطح هم به صورت آرایه‌های هم‌اندیس با قیمت‌ها ذخیره می‌شوند.
+    """
+    def __init__(self, key_levels):
+        self.levels = sorted(key_levels, key=lambda lvl: lvl['level'])
+        self.prices = np.array([lvl['level'] for lvl in self.levels], dtype=np.float64)
+        self.status = np.full(len(self.levels), UNTOUCHED, dtype=np.int8)
+        self.test_counts = np.zeros(len(self.levels), dtype=np.int32)
+
+    def __len__(self):
+        return len(self.levels)
+
+    def range(self, low, high):
+        """اندیس‌های سطوح داخل بازه بسته [low, high]."""
+        lo = np.searchsorted(self.prices, low, side='left')
+        hi = np.searchsorted(self.prices, high, side='right')
+        return np.arange(lo, hi)
+
+    def nearest_above(self, price, inclusive=False):
+        """نزدیک‌ترین سطح بالای قیمت (دیکشنری سطح یا None)."""
+        i = np.searchsorted(self.prices, price, side='left' if inclusive else 'right')
+        return self.levels[i] if i < len(self.levels) else None
+
+    def nearest_below(self, price, inclusive=False):
+        """نزدیک‌ترین سطح پایین قیمت (دیکشنری سطح یا None)."""
+        i = np.searchsorted(self.prices, price, side='right' if inclusive else 'left') - 1
+        return self.levels[i] if i >= 0 else None
+
+    def touch(self, low, high, eligible_status=UNTOUCHED):
+        """
+        سطوح داخل بازه کندل [low, high] که وضعیتشان eligible_status است را Touched کرده،
+        تعداد تست آن‌ها را یک واحد افزایش می‌دهد و اندیس‌هایشان را برمی‌گرداند.
+        """
+        idx = self.range(low, high)
+        idx = idx[self.status[idx] == eligible_status]
+        self.status[idx] = TOUCHED
+        self.test_counts[idx] += 1
+        return idx
+
+    def with_status(self, status):
+        """اندیس سطوحی که وضعیتشان status است."""
+        return np.flatnonzero(self.status == status)
+
+    def index_of(self, price):
+        """اندیس اولین سطح با قیمت دقیقا برابر price (یا None)."""
+        i = np.searchsorted(self.prices, price, side='left')
+        return int(i) if i < len(self.prices) and self.prices[i] == price else None
+
+    def test_count(self, price, default=0):
+        i = self.index_of(price)
+        return int(self.test_counts[i]) if i is not None else default
+
+    def test_counts_by_price(self):
+        """تعداد تست‌ها به صورت {قیمت سطح: تعداد} (قالب قبلی level_test_counts در state)."""
+        return {float(price): int(count) for price, count in zip(self.prices, self.test_counts)}
@@ -1,4 +1,5 @@
 import os, time, threading, pytz
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 import pandas as pd
 from dotenv import load_dotenv
@@ -11,8 +12,10 @@ from master_monitor import MasterMonitor
 from state_manager import StateManager
 from position_manager import PositionManager 
 from trend_analyzer import generate_master_trend_report
+from trend_filter import fetch_trend_history
 from setup_manager import SetupManager
 from interactive_bot import InteractiveBot
+from market_data_gateway import MarketDataGateway
 
 
 
@@ -27,19 +30,28 @@ def shutdown_all_monitors():
             monitor.stop()
     active_monitors.clear()
 
-def perform_daily_reinitialization(symbols, state_manager, position_manager, setup_manager):
+def perform_daily_reinitialization(symbols, state_manager, position_manager, setup_manager, gateway=None,
+                                   footprint_symbols=()):
     shutdown_all_monitors()
     ny_timezone = pytz.timezone("America/New_York")
     analysis_end_time_ny = datetime.now(ny_timezone).replace(hour=0, minute=0, second=0, microsecond=0)
     print(f"\n===== STARTING NY-BASED DAILY INITIALIZATION FOR {analysis_end_time_ny.date()} =====")
     
     start_of_ny_day_utc = analysis_end_time_ny.astimezone(timezone.utc)
+
+    # --- دریافت همزمان تاریخچه تمام ارزها (محدود به بودجه وزن مشترک API) ---
+    # ۱۴ روز تاریخچه تا پروفایل حجمی هفته گذشته بدون دانلود جداگانه از همین داده ساخته شود
+    analysis_start_time_utc = datetime.now(timezone.utc) - timedelta(days=14)
+    analysis_end_time_utc = datetime.now(timezone.utc)
+    with ThreadPoolExecutor(max_workers=max(1, min(4, len(symbols))), thread_name_prefix="HistoryFetch") as pool:
+        histories = dict(zip(symbols, pool.map(
+            lambda s: fetch_futures_klines(s, '1m', analysis_start_time_utc, analysis_end_time_utc), symbols
+        )))
     
     for symbol in symbols:
         print(f"\n----- Initializing for {symbol} -----")
         try:
-            analysis_start_time_utc = datetime.now(timezone.utc) - timedelta(days=10)
-            df_full_history = fetch_futures_klines(symbol, '1m', analysis_start_time_utc, datetime.now(timezone.utc))
+            df_full_history = histories[symbol]
             
             if df_full_history.empty:
                 print(f"Could not fetch data for {symbol}. Skipping.")
@@ -65,7 +77,7 @@ def perform_daily_reinitialization(symbols, state_manager, position_manager, set
 
             # --- [تغییر] ستون open_time از قبل به datetime تبدیل شده است ---
             df_full_history['ny_date'] = df_full_history['open_time'].dt.tz_convert('America/New_York').dt.date
-            untouched_levels = find_untouched_levels(df_full_history, date_col='ny_date')
+            untouched_levels = find_untouched_levels(df_full_history, date_col='ny_date', symbol=symbol)
             state_manager.update_symbol_state(symbol, 'untouched_levels', untouched_levels)
             print(f"  -> Found {len(untouched_levels)} untouched levels.")
             
@@ -75,8 +87,11 @@ def perform_daily_reinitialization(symbols, state_manager, position_manager, set
                 daily_trend=htf_trend,
                 position_manager=position_manager,
                 state_manager=state_manager,
-                setup_manager=setup_manager
+                setup_manager=setup_manager,
+                gateway=gateway,
+                enable_footprint=symbol in footprint_symbols
             )
+            master_monitor.seed_history(df_full_history, trend_history=fetch_trend_history(symbol))
             active_monitors[symbol] = master_monitor
             master_monitor.run()
 
@@ -91,6 +106,8 @@ def bot_logic_main_loop():
         "symbols": os.getenv("SYMBOLS", "BTCUSDT,ETHUSDT").split(','),
         "bot_token": os.getenv("BOT_TOKEN"),
         "chat_ids": os.getenv("CHAT_IDS", "").split(','),
+        # نمادهایی که استریم aggTrade و فوت‌پرینت برایشان فعال است (مثلا "BTCUSDT")
+        "footprint_symbols": [s for s in os.getenv("FOOTPRINT_SYMBOLS", "").split(',') if s],
         "risk_config": {"RISK_PER_TRADE_PERCENT": 1.0, "DAILY_DRAWDOWN_LIMIT_PERCENT": 3.0, "RR_RATIOS": [1, 2, 3]}
     }
     if not APP_CONFIG["bot_token"] or not APP_CONFIG["chat_ids"][0]:
@@ -100,6 +117,10 @@ def bot_logic_main_loop():
     
     state_manager = StateManager(APP_CONFIG['symbols'])
     setup_manager = SetupManager(state_manager=state_manager)
+
+    # --- یک اتصال combined-stream مشترک برای تمام نمادها به جای یک سوکت و ترد برای هر نماد ---
+    market_gateway = MarketDataGateway()
+    market_gateway.start()
     
     # --- [تغییر] ساختاردهی مجدد و تمیزتر برای حل مشکل وابستگی چرخه‌ای ---
     position_manager = PositionManager(
@@ -118,7 +139,8 @@ def bot_logic_main_loop():
         position_manager=position_manager,
         setup_manager=setup_manager,
         # --- [تغییر] ارسال تابع اصلی تحلیل به ربات برای اجرای دستور /reinit ---
-        reinit_func=lambda: perform_daily_reinitialization(APP_CONFIG['symbols'], state_manager, position_manager, setup_manager)
+        reinit_func=lambda: perform_daily_reinitialization(APP_CONFIG['symbols'], state_manager, position_manager, setup_manager, market_gateway,
+                                                           APP_CONFIG['footprint_symbols'])
     )
 
     # --- [تغییر] اجرای ربات تلگرام در یک ترد جداگانه ---
@@ -137,14 +159,15 @@ def bot_logic_main_loop():
                     print(f"\n☀️ New day detected ({now_ny.date()}). Re-initializing...")
                 
                 last_check_date_ny = now_ny.date()
-                perform_daily_reinitialization(APP_CONFIG['symbols'], state_manager, position_manager, setup_manager)
+                perform_daily_reinitialization(APP_CONFIG['symbols'], state_manager, position_manager, setup_manager,
+                                               market_gateway, APP_CONFIG['footprint_symbols'])
                 notify_startup(APP_CONFIG['bot_token'], APP_CONFIG['chat_ids'], APP_CONFIG['symbols'])
                 print(f"\n✅ All systems re-initialized for NY trading day: {last_check_date_ny}.")
                 first_run = False
                 
             time.sleep(60)
         except KeyboardInterrupt:
-            print('\nBot logic loop stopped by user.'); shutdown_all_monitors(); break
+            print('\nBot logic loop stopped by user.'); shutdown_all_monitors(); market_gateway.stop(); break
         except Exception as e:
             print(f"An error occurred in main loop: {e}"); import traceback; traceback.print_exc(); time.sleep(60)
 
@@ -0,0 +1,159 @@
+# market_context.py
+
+from functools import cached_property
+
+import numpy as np
+
+from fvg_scanner import FVGTracker
+from mtf_bars import AGGREGATIONS, RESAMPLE_RULES
+from swing_detector import SwingDetector
+
+
+class MarketContext:
+    """
+    وضعیت بازار یک نماد در لحظه بسته شدن یک کندل ۱ دقیقه‌ای.
+    MasterMonitor برای هر کندل یک نمونه می‌سازد و همان نمونه به تمام ستاپ‌ها داده می‌شود؛
+    مقادیر مشتق شده (DataFrame ها، کندل‌های تایم‌فریم بالاتر، سوینگ‌ها و ...) فقط هنگام اولین
+    درخواست محاسبه و برای بقیه ستاپ‌ها کش می‌شوند. مقادیر برگشتی مشترک هستند و نباید تغییر داده شوند.
+    """
+    def __init__(self, symbol, candles_1m, kline_1m, atr, key_levels=None, daily_trend=None,
+                 bar_aggregator=None, closed_bars=None, session_indicators=None, developing_profile=None,
+                 footprint=None, trend_filter=None, ichimoku_1m=None,
+                 volume_stats=None):
+        self.symbol = symbol
+        self.candles_1m = candles_1m
+        self.kline_1m = kline_1m
+        self.atr = atr
+        self.key_levels = key_levels or []
+        self.daily_trend = daily_trend
+        self.bar_aggregator = bar_aggregator
+        self.closed_bars = closed_bars or {}
+        self._session_indicators = session_indicators
+        self.developing_profile = developing_profile or {}
+        self.trend_filter = trend_filter  # trend_filter.TrendFilter نماد (یا None)
+        self.ichimoku_1m = ichimoku_1m    # streaming_indicators.StreamingIchimoku کندل‌های ۱ دقیقه (یا None)
+        self.volume_stats = volume_stats  # streaming_indicators.RollingStats حجم کندل‌های بافر (یا None)
+        self.footprint = footprint  # footprint.FootprintBar کندل جاری (در صورت فعال بودن aggTrade) یا None
+        self._memo = {}
+
+    # --- آرایه‌های ستونی (view های فقط‌خواندنی روی بافر، بدون کپی) ---
+
+    @cached_property
+    def open_time_ms(self):
+        return self.candles_1m.view('open_time')
+
+    @cached_property
+    def open(self):
+        return self.candles_1m.view('open')
+
+    @cached_property
+    def high(self):
+        return self.candles_1m.view('high')
+
+    @cached_property
+    def low(self):
+        return self.candles_1m.view('low')
+
+    @cached_property
+    def close(self):
+        return self.candles_1m.view('close')
+
+    @cached_property
+    def volume(self):
+        return self.candles_1m.view('volume')
+
+    # --- مقادیر مشتق شده ---
+
+    @cached_property
+    def price_data(self):
+        """DataFrame کندل‌های ۱ دقیقه‌ای با ایندکس زمانی (همان CandleRingBuffer.to_frame)."""
+        return self.candles_1m.to_frame()
+
+    @cached_property
+    def levels(self):
+        """سطوح کلیدی به صورت {نوع سطح (حروف کوچک): قیمت}، به همراه dpoc/dvah/dval روز جاری."""
+        levels = {lvl['level_type'].lower(): lvl['level'] for lvl in self.key_levels}
+        for name, price in self.developing_profile.items():
+            if price:
+                levels[f"d{name}"] = price
+        return levels
+
+    @cached_property
+    def level_prices(self):
+        """قیمت تمام سطوح کلیدی و سطوح پروفایل در حال تشکیل به صورت آرایه مرتب (برای جستجوی دودویی)."""
+        prices = [lvl['level'] for lvl in self.key_levels]
+        prices += [price for price in self.developing_profile.values() if price]
+        return np.sort(np.asarray(prices, dtype=np.float64))
+
+    @property
+    def kline_5m(self):
+        """کندل ۵ دقیقه‌ای که با این کندل بسته شده است (یا None)."""
+        return self.closed_bars.get('5m')
+
+    @property
+    def session_indicators(self):
+        if callable(self._session_indicators):
+            self._session_indicators = self._session_indicators()
+        return self._session_indicators if self._session_indicators is not None else {}
+
+    def bars(self, timeframe, include_partial=True):
+        """
+        کندل‌های یک تایم‌فریم بالاتر (شامل کندل در حال تشکیل) از aggregator مانیتور.
+        اگر aggregator در دسترس نباشد، از کندل‌های ۱ دقیقه‌ای resample می‌شود.
+        """
+        def compute():
+            if self.bar_aggregator is not None:
+                return self.bar_aggregator.frame(timeframe, include_partial)
+            df = self.price_data
+            agg = {col: how for col, how in AGGREGATIONS.items() if col in df.columns}
+            return df.resample(RESAMPLE_RULES[timeframe], origin='epoch').agg(agg).dropna(subset=['open'])
+        return self.memo(('bars', timeframe, include_partial), compute)
+
+    def swings(self, timeframe, left, right=None):
+        """
+        SwingDetector سوینگ‌های تایید شده یک تایم‌فریم (مشترک بین ستاپ‌ها و کندل‌ها، از aggregator مانیتور).
+        بدون aggregator، سوینگ‌ها یک بار برای این کندل از روی bars(timeframe) محاسبه می‌شوند.
+        """
+        if self.bar_aggregator is not None:
+            return self.bar_aggregator.swing_detector(timeframe, left, right)
+        return self.memo(('swings', timeframe, left, right),
+                         lambda: SwingDetector.from_frame(self.bars(timeframe, include_partial=False), left, right))
+
+    def fvgs(self, timeframe):
+        """FVGTracker گپ‌های باز یک تایم‌فریم (از aggregator مانیتور یا در نبود آن، محاسبه یک‌باره برای این کندل)."""
+        if self.bar_aggregator is not None:
+            return self.bar_aggregator.fvg_tracker(timeframe)
+        return self.memo(('fvgs', timeframe),
+                         lambda: FVGTracker().seed_from_frame(self.bars(timeframe, include_partial=False)))
+
+    def memo(self, key, compute):
+        """
+        مقدار key را یک بار با compute() محاسبه و برای بقیه مصرف‌کنندگان همین کندل کش می‌کند
+        (مثلا سوینگ‌های ۵ دقیقه با lookback مشخص).
+        """
+        if key not in self._memo:
+            self._memo[key] = compute()
+        return self._memo[key]
+
+    def setup_kwargs(self):
+        """آرگومان‌های متد check ستاپ‌ها (کلیدهای قبلی برای سازگاری، به همراه خود context)."""
+        return {
+            'symbol': self.symbol,
+            'price_data': self.price_data,
+            'levels': self.levels,
+            'key_levels': self.key_levels,
+            'atr': self.atr,
+            'session_indicators': self.session_indicators,
+            'kline_1m': self.kline_1m,
+            'kline_5m': self.kline_5m,
+            'daily_trend': self.daily_trend,
+            'kline_history': self.candles_1m,
+            'bar_aggregator': self.bar_aggregator,
+            'closed_bars': self.closed_bars,
+            'developing_profile': self.developing_profile,
+            'footprint': self.footprint,
+            'trend_filter': self.trend_filter,
+            'ichimoku_1m': self.ichimoku_1m,
+            'volume_stats': self.volume_stats,
+            'context': self,
+        }
@@ -0,0 +1,286 @@
+# market_data_gateway.py
+
+import asyncio
+import json
+import queue
+import random
+import ssl
+import threading
+import time
+import traceback
+from collections import defaultdict
+
+from websockets.asyncio.client import connect
+
+from kline_decoder import json_loads
+
+
+class _CombinedStreamConnection:
+    """
+    یک اتصال combined-stream بایننس که چند استریم را همزمان دریافت می‌کند و روی حلقه asyncio دروازه اجرا می‌شود.
+    استریم‌ها در حین اتصال با پیام‌های SUBSCRIBE/UNSUBSCRIBE (به صورت دسته‌ای) اضافه و حذف می‌شوند.
+    """
+    CONTROL_MIN_INTERVAL = 0.15   # بایننس حداکثر ۱۰ پیام کنترلی در ثانیه برای هر اتصال می‌پذیرد
+    SYNC_DEBOUNCE_SECONDS = 0.2   # تغییرات پشت سر هم (مثلا هنگام /reinit) در یک پیام ارسال می‌شوند
+    INITIAL_BACKOFF = 1.0
+    MAX_BACKOFF = 60.0
+
+    def __init__(self, gateway, conn_id):
+        self.gateway = gateway
+        self.conn_id = conn_id
+        self.assigned = set()          # استریم‌های مطلوب (تحت قفل gateway تغییر می‌کند)
+        self._server_streams = set()   # استریم‌هایی که روی اتصال فعلی فعال هستند
+        self.ws = None
+        self.task = None
+        self._wake = None
+        self._sync_handle = None
+        self._sync_lock = None         # همگام‌سازی‌ها (از جمله همگام‌سازی هنگام اتصال) پشت سر هم اجرا می‌شوند
+        self._request_id = 0
+
+    def _desired_streams(self):
+        with self.gateway._lock:
+            return set(self.assigned)
+
+    def request_sync(self):
+        """(روی حلقه asyncio) همگام‌سازی اشتراک‌ها را با کمی تاخیر زمان‌بندی می‌کند."""
+        if self._wake is not None:
+            self._wake.set()
+        if self.ws is not None and self._sync_handle is None:
+            loop = asyncio.get_running_loop()
+            self._sync_handle = loop.call_later(
+                self.SYNC_DEBOUNCE_SECONDS, lambda: loop.create_task(self._sync_subscriptions())
+            )
+
+    async def _send_control(self, ws, method, streams):
+        self._request_id += 1
+        await ws.send(json.dumps({'method': method, 'params': sorted(streams), 'id': self._request_id}))
+        await asyncio.sleep(self.CONTROL_MIN_INTERVAL)
+
+    async def _sync_subscriptions(self):
+        self._sync_handle = None
+        async with self._sync_lock:
+            ws = self.ws
+            if ws is None:
+                return
+            desired = self._desired_streams()
+            previous = self._server_streams
+            to_add, to_remove = desired - previous, previous - desired
+            if not to_add and not to_remove:
+                return
+            # وضعیت قبل از ارسال ثبت می‌شود تا درخواست‌های هم‌زمان پیام تکراری نفرستند
+            self._server_streams = desired
+            try:
+                if to_add:
+                    await self._send_control(ws, 'SUBSCRIBE', to_add)
+                if to_remove:
+                    await self._send_control(ws, 'UNSUBSCRIBE', to_remove)
+            except Exception as e:
+                if self.ws is ws:
+                    self._server_streams = previous
+                print(f"[Gateway#{self.conn_id}] Failed to update subscriptions: {e}")
+
+    async def run(self):
+        self._wake = asyncio.Event()
+        self._sync_lock = asyncio.Lock()
+        backoff = self.INITIAL_BACKOFF
+        while not self.gateway._stopping:
+            streams = self._desired_streams()
+            if not streams:
+                await self._wake.wait()
+                self._wake.clear()
+                continue
+
+            url = f"{self.gateway.base_url}?streams={'/'.join(sorted(streams))}"
+            try:
+                async with connect(url, ssl=self.gateway.ssl_context, ping_interval=20, ping_timeout=10,
+                                   max_queue=4096, open_timeout=15) as ws:
+                    self.ws, self._server_streams = ws, streams
+                    backoff = self.INITIAL_BACKOFF
+                    print(f"[Gateway#{self.conn_id}] Connected with {len(streams)} streams.")
+                    # استریم‌هایی که بین ساخت URL و برقراری اتصال تغییر کرده‌اند
+                    await self._sync_subscriptions()
+                    async for message in ws:
+                        self.gateway._enqueue(message)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[Gateway#{self.conn_id}] WebSocket Error: {e}")
+            finally:
+                self.ws = None
+                if self._sync_handle is not None:
+                    self._sync_handle.cancel()
+                    self._sync_handle = None
+
+            if not self.gateway._stopping:
+                delay = min(backoff, self.MAX_BACKOFF) * (0.5 + random.random())
+                backoff = min(backoff * 2, self.MAX_BACKOFF)
+                print(f"[Gateway#{self.conn_id}] WebSocket disconnected. Reconnecting in {delay:.1f} seconds...")
+                await asyncio.sleep(delay)
+
+
+class MarketDataGateway:
+    """
+    دروازه واحد داده‌های بازار: تمام استریم‌های تمام نمادها روی یک (یا چند) اتصال
+    combined-stream دریافت شده و بر اساس نام استریم بین مشترکین (مانیتورها) توزیع می‌شوند.
+    تمام اتصال‌ها روی یک حلقه asyncio در یک ترد اجرا می‌شوند و پیام‌ها در یک ترد پردازش جداگانه
+    به handlerها تحویل داده می‌شوند؛ بنابراین تعداد تردها و سوکت‌ها با افزایش نمادها ثابت می‌ماند.
+    """
+    MAX_STREAMS_PER_CONNECTION = 200
+    DROP_WARNING_INTERVAL = 10.0   # حداقل فاصله (ثانیه) بین دو هشدار حذف پیام
+
+    def __init__(self, base_url='wss://fstream.binance.com/stream', max_pending_messages=10_000):
+        self.base_url = base_url
+        self.ssl_context = ssl.create_default_context()
+        self.ssl_context.check_hostname = False
+        self.ssl_context.verify_mode = ssl.CERT_NONE
+        self._handlers = defaultdict(list)
+        self._stream_connection = {}
+        self._connections = []
+        self._lock = threading.Lock()
+        # صف بدون سقف تا ترتیب پیام‌ها حفظ شود؛ max_pending_messages فقط برای پیام‌های قابل حذف (aggTrade) اعمال می‌شود
+        self.max_pending_messages = max_pending_messages
+        self._messages = queue.Queue()
+        self._dropped_messages = 0
+        self._last_drop_warning = 0.0
+        self._loop = None
+        self._loop_thread = None
+        self._dispatch_thread = None
+        self._stopping = False
+
+    # --- API عمومی (قابل فراخوانی از هر ترد) ---
+
+    def subscribe(self, stream, handler):
+        """handler(data) را برای استریم (مثلا btcusdt@kline_1m) ثبت کرده و در صورت نیاز استریم را فعال می‌کند."""
+        stream = stream.lower()
+        with self._lock:
+            self._handlers[stream].append(handler)
+            if stream in self._stream_connection:
+                return
+            conn = self._connection_with_capacity()
+            conn.assigned.add(stream)
+            self._stream_connection[stream] = conn
+        self._notify(conn)
+
+    def unsubscribe(self, stream, handler=None):
+        """یک handler (یا تمام handlerهای) یک استریم را حذف می‌کند؛ استریم بدون مشترک غیرفعال می‌شود."""
+        stream = stream.lower()
+        with self._lock:
+            handlers = self._handlers.get(stream, [])
+            if handler is None:
+                handlers.clear()
+            elif handler in handlers:
+                handlers.remove(handler)
+            if handlers:
+                return
+            self._handlers.pop(stream, None)
+            conn = self._stream_connection.pop(stream, None)
+            if conn:
+                conn.assigned.discard(stream)
+        if conn:
+            self._notify(conn)
+
+    def start(self):
+        if self._loop_thread and self._loop_thread.is_alive():
+            return
+        self._stopping = False
+        self._loop = asyncio.new_event_loop()
+        self._loop_thread = threading.Thread(target=self._loop.run_forever, daemon=True, name="MarketDataLoop")
+        self._loop_thread.start()
+        self._dispatch_thread = threading.Thread(target=self._dispatch_forever, daemon=True, name="MarketDataDispatch")
+        self._dispatch_thread.start()
+        with self._lock:
+            connections = list(self._connections)
+        for conn in connections:
+            self._start_connection(conn)
+        print("[Gateway] Market data gateway started.")
+
+    def stop(self):
+        self._stopping = True
+        if self._loop:
+            for conn in list(self._connections):
+                if conn.task:
+                    self._loop.call_soon_threadsafe(conn.task.cancel)
+            self._loop.call_soon_threadsafe(self._loop.stop)
+        self._messages.put(None)
+
+    # --- منطق داخلی ---
+
+    def _connection_with_capacity(self):
+        for conn in self._connections:
+            if len(conn.assigned) < self.MAX_STREAMS_PER_CONNECTION:
+                return conn
+        conn = _CombinedStreamConnection(self, len(self._connections) + 1)
+        self._connections.append(conn)
+        if self._loop is not None and not self._stopping:
+            self._start_connection(conn)
+        return conn
+
+    def _start_connection(self, conn):
+        def _create():
+            conn.task = self._loop.create_task(conn.run())
+        self._loop.call_soon_threadsafe(_create)
+
+    def _notify(self, conn):
+        if self._loop is not None and not self._stopping:
+            self._loop.call_soon_threadsafe(conn.request_sync)
+
+    def _enqueue(self, message):
+        """
+        پیام را به صف پردازش اضافه می‌کند. وقتی پردازش عقب افتاده باشد فقط پیام‌های aggTrade حذف می‌شوند؛
+        پیام‌های kline (به خصوص کندل‌های بسته شده) هرگز حذف نمی‌شوند تا بافرها و اندیکاتورها از هم جدا نشوند.
+        """
+        if self._messages.qsize() >= self.max_pending_messages and _is_droppable(message):
+            self._dropped_messages += 1
+            now = time.monotonic()
+            if now - self._last_drop_warning >= self.DROP_WARNING_INTERVAL:
+                print(f"[Gateway] Processing pipeline is falling behind. Dropped {self._dropped_messages} "
+                      f"aggTrade messages so far.")
+                self._last_drop_warning = now
+            return
+        self._messages.put_nowait(message)
+
+    def _dispatch_forever(self):
+        while True:
+            message = self._messages.get()
+            if message is None:
+                return
+            try:
+                payload = json_loads(message)
+                stream = payload.get('stream')
+                if stream:
+                    self._dispatch(stream, payload.get('data', {}))
+            except Exception as e:
+                print(f"[Gateway] Unexpected error while dispatching message: {e}")
+                traceback.print_exc()
+
+    def _dispatch(self, stream, data):
+        with self._lock:
+            handlers = list(self._handlers.get(stream, ()))
+        for handler in handlers:
+            try:
+                handler(data)
+            except Exception as e:
+                print(f"[Gateway] Handler error for stream '{stream}': {e}")
+                traceback.print_exc()
+
+
+def _is_droppable(message):
+    """
+    پیام aggTrade است (نام استریم در ابتدای پیام combined-stream آمده و نیازی به پارس JSON نیست؛
+    بایننس نام استریم را با همان حروف اشتراک، که در دروازه کوچک می‌شوند، برمی‌گرداند).
+    """
+    return '@aggtrade"' in message[:64].lower()
+
+
+_default_gateway = None
+_default_gateway_lock = threading.Lock()
+
+
+def get_default_gateway():
+    """یک دروازه مشترک و در حال اجرا برای کل برنامه برمی‌گرداند (در صورت نیاز آن را می‌سازد)."""
+    global _default_gateway
+    with _default_gateway_lock:
+        if _default_gateway is None:
+            _default_gateway = MarketDataGateway()
+            _default_gateway.start()
+        return _default_gateway
@@ -1,16 +1,19 @@
 # master_monitor.py
 # نسخه نهایی، کامل و یکپارچه شده با حفظ تمام توابع شما
 
-import json
 import threading
-import websocket
-import ssl
-import time
 import traceback
 import pandas as pd
-from collections import deque
-from datetime import datetime, timezone
-from indicators import calculate_atr
+from datetime import datetime, timedelta, timezone
+from bar_aggregator import BarAggregator
+from candle_buffer import CandleRingBuffer
+from footprint import FootprintBuilder
+from level_index import EVALUATED, TOUCHED, LevelIndex
+from market_context import MarketContext
+from market_data_gateway import get_default_gateway
+from streaming_indicators import RollingStats, RollingSum, SessionIndicatorEngine, StreamingATR, StreamingIchimoku
+from trend_filter import TrendFilter
+from volume_profile import DevelopingProfile, default_profile_engine
 
 # --- توابع کمکی شما که حفظ شده‌اند ---
 
@@ -32,10 +35,15 @@ def check_pin_bar(candle, direction):
     elif direction == 'Sell': return is_pin_bar_body and upper_wick > body * 2
     return False
 
+def _ny_session_key(open_time):
+    """تاریخ روز معاملاتی نیویورک که کندل در آن قرار دارد."""
+    return pd.Timestamp(open_time).tz_convert('America/New_York').date()
+
 # --- کلاس اصلی مانیتور ---
 
 class MasterMonitor:
-    def __init__(self, symbol, key_levels, daily_trend, setup_manager, position_manager, state_manager):
+    def __init__(self, symbol, key_levels, daily_trend, setup_manager, position_manager, state_manager, gateway=None,
+                 enable_footprint=False):
         self.symbol = symbol
         self.key_levels = key_levels
         self.daily_trend = daily_trend
@@ -43,49 +51,62 @@ class MasterMonitor:
         self.position_manager = position_manager
         self.state_manager = state_manager
         
-        self.candles_1m = deque(maxlen=300)
-        self.current_5m_buffer = []
+        self.candles_1m = CandleRingBuffer(capacity=300)
+        self.atr_1m = StreamingATR(period=14)
+        self.ichimoku_1m = StreamingIchimoku()  # Tenkan/Kijun/Senkou کندل‌های ۱ دقیقه با به‌روزرسانی O(1)
+        self.bar_aggregator = BarAggregator()  # کندل‌های 5m/15m/1h/4h/1d هم‌تراز با بایننس
+        self.developing_profile = None         # پروفایل حجمی روز جاری نیویورک (dPOC/dVAH/dVAL)
+        self.session_engine = SessionIndicatorEngine(window=14)  # VWAP، باندها و دلتای سشن جاری
+        self.cvd_24h = RollingSum(window=24 * 60)  # دلتای تجمعی ۲۴ ساعت اخیر از کندل‌های زنده
+        self.volume_stats = RollingStats(window=self.candles_1m.capacity)  # میانگین/انحراف معیار حجم کندل‌های بافر
+        self.trend_filter = TrendFilter(symbol)    # روند اصلی (4H/1D) با امتیاز کش شده
         
-        # این متغیرها برای منطق قدیمی شما حفظ شده‌اند
-        self.active_levels = {lvl['level']: "Untouched" for lvl in self.key_levels}
-        self.level_test_counts = {lvl['level']: 0 for lvl in self.key_levels}
+        # وضعیت و تعداد تست سطوح (برای منطق قدیمی شما) در یک ایندکس مرتب نگهداری می‌شود
+        self.level_index = LevelIndex(self.key_levels)
         
-        self.ws = None
-        self.wst = None
+        self.gateway = gateway or get_default_gateway()
+        self.kline_stream = f"{self.symbol.lower()}@kline_1m"
+        # فوت‌پرینت (حجم خرید/فروش به تفکیک قیمت) از استریم aggTrade؛ فقط برای نمادهای انتخاب شده
+        self.enable_footprint = enable_footprint
+        self.footprint = None
         self.stop_requested = threading.Event()
 
-    # --- توابع مربوط به وب‌ساکت ---
-
-    def on_message(self, ws, message):
-        try:
-            data = json.loads(message)
-            if data.get('e') == 'kline' and data['k']['x']:
-                self.process_candle(data['k'])
-        except Exception as e:
-            print(f"[{self.symbol}] Unexpected error in on_message: {e}")
-            traceback.print_exc()
-
-    def on_error(self, ws, error):
-        print(f"[{self.symbol}] WebSocket Error: {error}")
+    def seed_history(self, df_history, trend_history=None):
+        """
+        بافر کندل‌ها را با تاریخچه REST (فقط کندل‌های بسته شده) مقداردهی می‌کند
+        تا ستاپ‌ها بلافاصله پس از شروع به اندازه کافی داده داشته باشند.
+        trend_history کندل‌های بلندمدت (4H, 1D) برای فیلتر روند است؛ در غیر این صورت از همین تاریخچه ساخته می‌شوند.
+        """
+        if df_history is None or df_history.empty:
+            return
+        now = datetime.now(timezone.utc)
+        closed = df_history[df_history['open_time'] + timedelta(minutes=1) <= now]
+        self.candles_1m.extend_from_frame(closed)
+        self.atr_1m.seed_from_frame(closed)
+        self.ichimoku_1m.seed(closed['high'], closed['low'])
+        self.volume_stats.seed(closed['volume'])
+        self.bar_aggregator.seed_from_frame(closed)
+        if trend_history is None:
+            trend_history = (self.bar_aggregator.frame('4h', include_partial=False),
+                             self.bar_aggregator.frame('1d', include_partial=False))
+        self.trend_filter.seed(*trend_history, df_1m=closed)
+        self.state_manager.update_symbol_state(self.symbol, 'atr_1m', self.atr_1m.value)
+        if 'taker_buy_base_asset_volume' in closed.columns:
+            self.cvd_24h.seed(2 * closed['taker_buy_base_asset_volume'] - closed['volume'])
+        if not closed.empty:
+            # فقط کندل‌های روز معاملاتی جاری نیویورک در پروفایل و اندیکاتورهای سشن قرار می‌گیرند
+            session_key = _ny_session_key(closed['open_time'].iloc[-1])
+            session_candles = closed[closed['open_time'].dt.tz_convert('America/New_York').dt.date == session_key]
+            for candle in session_candles.to_dict('records'):
+                self._update_session_state(candle)
+        print(f"[{self.symbol}] Seeded monitor with {len(self.candles_1m)} historical 1m candles.")
 
-    def on_close(self, ws, close_status_code, close_msg):
-        print(f"[{self.symbol}] WebSocket Connection Closed. Status: {close_status_code}")
+    # --- دریافت داده از MarketDataGateway ---
 
-    def _run_forever(self):
-        ws_url = f'wss://fstream.binance.com/ws/{self.symbol.lower()}@kline_1m'
-        while not self.stop_requested.is_set():
-            print(f"[{self.symbol}] Connecting to WebSocket...")
-            try:
-                self.ws = websocket.WebSocketApp(
-                    ws_url, on_message=self.on_message, on_error=self.on_error, on_close=self.on_close
-                )
-                self.ws.run_forever(sslopt={"cert_reqs": ssl.CERT_NONE}, ping_interval=20, ping_timeout=10)
-            except Exception as e:
-                print(f"[{self.symbol}] WebSocket run_forever() failed: {e}")
-
-            if not self.stop_requested.is_set():
-                print(f"[{self.symbol}] WebSocket disconnected. Retrying in 10 seconds...")
-                time.sleep(10)
+    def on_stream_event(self, data):
+        """رویداد kline دریافتی از MarketDataGateway را پردازش می‌کند."""
+        if data.get('e') == 'kline' and data['k']['x']:
+            self.process_candle(data['k'])
 
     def process_candle(self, kline_data):
         """
@@ -96,41 +117,46 @@ class MasterMonitor:
                 'open_time': datetime.fromtimestamp(int(kline_data['t']) / 1000, tz=timezone.utc),
                 'open': float(kline_data['o']), 'high': float(kline_data['h']),
                 'low': float(kline_data['l']), 'close': float(kline_data['c']),
-                'volume': float(kline_data['v'])
+                'volume': float(kline_data['v']), 'quote_asset_volume': float(kline_data['q']),
+                'number_of_trades': int(kline_data['n']),
+                'taker_buy_base_asset_volume': float(kline_data['V']),
+                'taker_buy_quote_asset_volume': float(kline_data['Q'])
             }
-            self.candles_1m.append(kline_1m)
-            self.current_5m_buffer.append(kline_1m)
+            if not self.candles_1m.append(kline_1m):
+                return  # کندل تکراری (مثلا پس از اتصال مجدد) دوباره پردازش نمی‌شود
+            atr_value = self.atr_1m.update(kline_1m['high'], kline_1m['low'], kline_1m['close'])
+            self.state_manager.update_symbol_state(self.symbol, 'atr_1m', atr_value)
+            self.ichimoku_1m.update(kline_1m['high'], kline_1m['low'])
+            self.volume_stats.update(kline_1m['volume'])
+            footprint = self.footprint.bar_for(int(kline_data['t'])) if self.footprint else None
+            if footprint is not None and footprint.trade_count == 0:
+                footprint = None
+            self._update_session_state(kline_1m, footprint)
+            delta = 2 * kline_1m['taker_buy_base_asset_volume'] - kline_1m['volume']
+            self.state_manager.update_symbol_state(self.symbol, 'cvd_24h', self.cvd_24h.update(delta))
+            self.state_manager.update_symbol_state(self.symbol, 'session_cvd', self.session_engine.cumulative_delta)
             self.state_manager.update_symbol_state(self.symbol, 'last_price', kline_1m['close'])
             
-            kline_5m = None
-            if (kline_1m['open_time'].minute + 1) % 5 == 0:
-                if self.current_5m_buffer:
-                    kline_5m = self._aggregate_candles(self.current_5m_buffer)
-                    self.current_5m_buffer = []
-
-            price_data_df = pd.DataFrame(list(self.candles_1m))
-            if len(price_data_df) < 20: return
+            # کندل‌های تایم‌فریم بالاتر که با این کندل بسته شده‌اند (مثلا {'5m': {...}})
+            closed_bars = self.bar_aggregator.update(kline_1m)
+            kline_5m = closed_bars.get('5m')
+            self.trend_filter.update(kline_1m, closed_bars)
 
-            atr_value = calculate_atr(price_data_df, period=14)
+            if len(self.candles_1m) < 20: return
             if atr_value is None or atr_value == 0: return
 
-            levels_dict = {lvl['level_type'].lower(): lvl['level'] for lvl in self.key_levels}
-            session_indicators_data = {} # در آینده کامل می‌شود
-
-            # --- [اصلاح اصلی] --- افزودن پارامتر kline_history
-            kwargs = {
-                'symbol': self.symbol, 
-                'price_data': price_data_df,
-                'levels': levels_dict, 
-                'atr': atr_value,
-                'session_indicators': session_indicators_data,
-                'kline_1m': kline_1m, 
-                'kline_5m': kline_5m,
-                'daily_trend': self.daily_trend,
-                'kline_history': self.candles_1m  # <<< پارامتر الزامی اضافه شد
-            }
-            
-            signal_package = self.setup_manager.check_all_setups(**kwargs)
+            # وضعیت بازار در این کندل یک بار ساخته شده و بین تمام ستاپ‌ها مشترک است؛
+            # DataFrame ها، کندل‌های تایم‌فریم بالاتر و سایر مقادیر مشتق شده فقط یک بار محاسبه می‌شوند
+            context = MarketContext(
+                symbol=self.symbol, candles_1m=self.candles_1m, kline_1m=kline_1m, atr=atr_value,
+                key_levels=self.key_levels, daily_trend=self.daily_trend,
+                bar_aggregator=self.bar_aggregator, closed_bars=closed_bars,
+                developing_profile=self.developing_profile.profile(),
+                session_indicators=self.session_engine.snapshot(), footprint=footprint,
+                trend_filter=self.trend_filter, ichimoku_1m=self.ichimoku_1m,
+                volume_stats=self.volume_stats
+            )
+            signal_package = self.setup_manager.check_all_setups(**context.setup_kwargs())
             
             if signal_package:
                 signal_package['symbol'] = self.symbol
@@ -166,33 +192,45 @@ class MasterMonitor:
             traceback.print_exc()
 
 
-    def _aggregate_candles(self, candles):
-        if not candles: return None
-        return {'open_time': candles[-1]['open_time'], 'high': max(c['high'] for c in candles),
-                'low': min(c['low'] for c in candles), 'open': candles[0]['open'],
-                'close': candles[-1]['close'], 'volume': sum(c['volume'] for c in candles)}
-
 # در فایل: master_monitor.py
 
+    def _ensure_developing_profile(self, reference_price):
+        if self.developing_profile is None:
+            tick_size = default_profile_engine.tick_size_for(self.symbol, reference_price)
+            self.developing_profile = DevelopingProfile(tick_size)
+        return self.developing_profile
+
+    def _update_session_state(self, candle, footprint=None):
+        """
+        کندل را به پروفایل حجمی و اندیکاتورهای سشن (VWAP و دلتا) روز جاری اضافه می‌کند؛
+        هر دو با شروع روز معاملاتی جدید نیویورک ریست می‌شوند. پروفایل در state منتشر می‌شود.
+        اگر فوت‌پرینت کندل موجود باشد، حجم واقعی هر قیمت به جای پخش یکنواخت حجم در پروفایل قرار می‌گیرد.
+        """
+        session_key = _ny_session_key(candle['open_time'])
+        self._ensure_developing_profile(candle['high'])
+        if self.developing_profile.session_key != session_key:
+            self.developing_profile.reset(session_key)
+        if self.session_engine.session_key != session_key:
+            self.session_engine.reset(session_key)
+        if footprint is not None:
+            self.developing_profile.add_footprint(footprint)
+        else:
+            self.developing_profile.add_candle(candle['high'], candle['low'], candle['volume'])
+        self.session_engine.update(candle['high'], candle['low'], candle['close'], candle['volume'],
+                                   candle['taker_buy_base_asset_volume'])
+        self.state_manager.update_symbol_state(self.symbol, 'developing_profile', self.developing_profile.profile())
+
     def _check_level_proximity(self, candle):
         """
         برخورد قیمت با سطوح کلیدی را به صورت هوشمند بررسی کرده و یک نوتیفیکیشن واحد با ذکر قیمت ارسال می‌کند.
         """
-        touched_levels_in_candle = []
-        
-        # مرحله ۱: تمام سطوحی که توسط این کندل لمس شده‌اند را پیدا کن
-        for level_data in self.key_levels:
-            level_price = level_data['level']
-            
-            if candle['low'] <= level_price <= candle['high']:
-                if self.active_levels.get(level_price) == "Untouched":
-                    touched_levels_in_candle.append(level_data)
-                    self.active_levels[level_price] = "Touched"
-                    self.level_test_counts[level_price] = self.level_test_counts.get(level_price, 0) + 1
+        # مرحله ۱: سطوح دست‌نخورده داخل بازه کندل با جستجوی دودویی پیدا شده و Touched می‌شوند
+        touched_idx = self.level_index.touch(candle['low'], candle['high'])
+        touched_levels_in_candle = [self.level_index.levels[i] for i in touched_idx]
 
         # مرحله ۲: اگر سطحی لمس شده بود، یک پیام واحد و گروهی با ذکر قیمت ارسال کن
         if touched_levels_in_candle:
-            self.state_manager.update_symbol_state(self.symbol, 'level_test_counts', dict(self.level_test_counts))
+            self.state_manager.update_symbol_state(self.symbol, 'level_test_counts', self.level_index.test_counts_by_price())
 
             # --- [تغییر اصلی اینجاست] ---
             # افزودن قیمت هر سطح به متن پیام با فرمت خواسته شده
@@ -204,10 +242,8 @@ class MasterMonitor:
 
     def _evaluate_level_interaction(self, candle_5m):
         trend = self.state_manager.get_symbol_state(self.symbol, 'htf_trend', 'SIDEWAYS')
-        for level_price, status in list(self.active_levels.items()):
-            if status != "Touched": continue
-            level_data = next((l for l in self.key_levels if l['level'] == level_price), None)
-            if not level_data: continue
+        for i in self.level_index.with_status(TOUCHED):
+            level_data = self.level_index.levels[i]
             
             trade_direction = None
             if "BULLISH" in trend:
@@ -222,16 +258,14 @@ class MasterMonitor:
                     f"📍 **تاییدیه پین‌بار**: یک پین‌بار {trade_direction} در سطح {level_data['level_type']} برای {self.symbol} مشاهده شد."
                 )
                 self.create_signal_proposal(level_data, trade_direction, candle_5m)
-                self.active_levels[level_price] = "Evaluated" # تغییر وضعیت برای جلوگیری از بررسی مجدد
+                self.level_index.status[i] = EVALUATED # تغییر وضعیت برای جلوگیری از بررسی مجدد
 
     def create_signal_proposal(self, level_data, direction, confirmation_candle):
         utc_now = datetime.now(timezone.utc)
-        test_count = self.level_test_counts.get(level_data['level'], 1)
+        test_count = self.level_index.test_count(level_data['level'], default=1)
         session = get_trading_session(utc_now.hour)
         
-        df_1m = pd.DataFrame(list(self.candles_1m))
-        if df_1m.empty: return
-        atr_1m = calculate_atr(df_1m, period=14)
+        atr_1m = self.atr_1m.value
         if atr_1m is None or atr_1m == 0: return
         
         entry_price = confirmation_candle['high'] + (atr_1m * 0.25) if direction == 'Buy' else confirmation_candle['low'] - (atr_1m * 0.25)
@@ -254,15 +288,25 @@ class MasterMonitor:
             self.position_manager.on_new_proposal(signal_package)
 
     def run(self):
-        """اتصال وب‌ساکت را در یک ترد جداگانه اجرا می‌کند."""
+        """مانیتور را در MarketDataGateway مشترک ثبت می‌کند (بدون ساخت سوکت یا ترد جداگانه)."""
         self.stop_requested.clear()
-        self.wst = threading.Thread(target=self._run_forever, daemon=True, name=f"MonitorThread-{self.symbol}")
-        self.wst.start()
-        print(f'[MasterMonitor] WebSocket monitor started for {self.symbol}.')
+        self.gateway.subscribe(self.kline_stream, self.on_stream_event)
+        print(f'[MasterMonitor] Subscribed {self.symbol} to the shared market data gateway.')
+        if self.enable_footprint and self.footprint is None:
+            if len(self.candles_1m) == 0:
+                print(f"[{self.symbol}] No candle history to size footprint bins. Footprint disabled.")
+                return
+            # فوت‌پرینت با همان tick پروفایل روزانه ساخته می‌شود تا مستقیما در آن قابل جمع باشد
+            profile = self._ensure_developing_profile(float(self.candles_1m.view('close')[-1]))
+            self.footprint = FootprintBuilder(self.symbol, profile.tick_size)
+            self.footprint.subscribe(self.gateway)
+            print(f'[MasterMonitor] Subscribed {self.symbol} footprint to {self.footprint.stream}.')
 
     def stop(self):
-        """اتصال وب‌ساکت را متوقف می‌کند."""
+        """اشتراک مانیتور در دروازه داده را لغو می‌کند."""
         print(f"Stopping monitor for {self.symbol}...")
         self.stop_requested.set()
-        if self.ws:
-            self.ws.close()
\ No newline at end of file
+        self.gateway.unsubscribe(self.kline_stream, self.on_stream_event)
+        if self.footprint is not None:
+            self.footprint.unsubscribe()
+            self.footprint = None
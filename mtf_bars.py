@@ -0,0 +1,65 @@
+# mtf_bars.py
+
+import pandas as pd
+from datetime import datetime, timedelta, timezone
+from fetch_futures_binance import fetch_futures_klines
+
+# نگاشت اینتروال‌های بایننس به قانون resample در پانداس
+RESAMPLE_RULES = {'5m': '5min', '15m': '15min', '1h': '1h', '4h': '4h', '1d': '24h'}
+
+AGGREGATIONS = {
+    'open': 'first', 'high': 'max', 'low': 'min', 'close': 'last',
+    'volume': 'sum', 'quote_asset_volume': 'sum', 'number_of_trades': 'sum',
+    'taker_buy_base_asset_volume': 'sum', 'taker_buy_quote_asset_volume': 'sum'
+}
+
+
+class MultiTimeframeBars:
+    """
+    کندل‌های تایم‌فریم بالاتر (15m/1h/4h/1d) را از کندل‌های ۱ دقیقه‌ای موجود در حافظه می‌سازد
+    تا نیازی به دانلود جداگانه هر تایم‌فریم از API نباشد.
+    کندل‌ها مانند بایننس بر اساس زمان UTC تراز می‌شوند و آخرین کندل هر تایم‌فریم ممکن است ناقص باشد.
+    """
+    def __init__(self, symbol, df_1m):
+        self.symbol = symbol
+        df = df_1m.sort_values('open_time').drop_duplicates(subset=['open_time'], keep='last')
+        self.df_1m = df.set_index('open_time')
+        self._cache = {}
+
+    @property
+    def last_price(self):
+        return float(self.df_1m['close'].iloc[-1]) if not self.df_1m.empty else None
+
+    @property
+    def first_time(self):
+        return self.df_1m.index[0] if not self.df_1m.empty else None
+
+    def covers(self, start_dt):
+        """آیا کندل‌های ۱ دقیقه‌ای موجود، بازه‌ای از start_dt تا اکنون را پوشش می‌دهند؟"""
+        return self.first_time is not None and self.first_time <= pd.Timestamp(start_dt)
+
+    def get(self, timeframe):
+        """کندل‌های یک تایم‌فریم را (با ستون open_time مانند خروجی fetch_futures_klines) برمی‌گرداند."""
+        if timeframe == '1m':
+            return self.df_1m.reset_index()
+        if timeframe not in self._cache:
+            agg = {col: how for col, how in AGGREGATIONS.items() if col in self.df_1m.columns}
+            bars = self.df_1m.resample(RESAMPLE_RULES[timeframe], origin='epoch').agg(agg).dropna(subset=['open'])
+            self._cache[timeframe] = bars.reset_index()
+        return self._cache[timeframe]
+
+    def get_range(self, timeframe, start_dt, end_dt):
+        """کندل‌هایی که زمان شروعشان در بازه [start_dt, end_dt) قرار دارد."""
+        bars = self.get(timeframe)
+        return bars[(bars['open_time'] >= pd.Timestamp(start_dt)) & (bars['open_time'] < pd.Timestamp(end_dt))]
+
+    def long_range(self, timeframe, days):
+        """
+        سری طولانی‌مدت یک تایم‌فریم (مثلا 4h برای ۶۶ روز) که از ۱ دقیقه‌ای‌های موجود قابل ساخت نیست.
+        این سری از آرشیو محلی خوانده شده و فقط کندل‌های جدید آن از API دریافت می‌شوند.
+        """
+        key = (timeframe, days)
+        if key not in self._cache:
+            now = datetime.now(timezone.utc)
+            self._cache[key] = fetch_futures_klines(self.symbol, timeframe, now - timedelta(days=days), now)
+        return self._cache[key]
@@ -0,0 +1,118 @@
+# poi_scanner.py
+
+import numpy as np
+
+from swing_detector import SWING_HIGH, SWING_LOW
+
+
+def last_swing_levels(highs, lows, is_swing_high, is_swing_low, lag=1):
+    """
+    برای هر کندل i قیمت آخرین سوینگ سقف/کف در کندل‌های قبل از i - lag + 1 (یا NaN) را برمی‌گرداند.
+    lag=1 یعنی همه کندل‌های قبلی و lag=2 یعنی کندل قبلی هم در نظر گرفته نمی‌شود.
+    با یک maximum.accumulate روی اندیس سوینگ‌ها (forward fill) و بدون برش تکراری محاسبه می‌شود.
+    """
+    def carry(values, flags):
+        n = len(values)
+        last = np.maximum.accumulate(np.where(flags, np.arange(n), -1))
+        shifted = np.full(n, -1)
+        shifted[lag:] = last[:n - lag]
+        return np.where(shifted >= 0, values[np.maximum(shifted, 0)], np.nan)
+    return carry(highs, np.asarray(is_swing_high, dtype=bool)), carry(lows, np.asarray(is_swing_low, dtype=bool))
+
+
+def _reason_labels(label):
+    # ترتیب دلایل مانند sorted(...) در پیاده‌سازی قبلی: BOS، Liquidity Sweep، OB
+    return {
+        (True, False): f"POI {label}: BOS + Liquidity Sweep",
+        (False, True): f"POI {label}: Liquidity Sweep + OB",
+        (True, True): f"POI {label}: BOS + Liquidity Sweep + OB",
+    }
+
+
+def find_pois(index, opens, highs, lows, closes, swing_high, swing_low, start=1, label='5m'):
+    """
+    POI های کندل‌های start به بعد: Liquidity Sweep آخرین سوینگ که با BOS یا Order Block هم‌جهت تایید شده باشد.
+    swing_high/swing_low قیمت آخرین سوینگ معتبر برای هر کندل هستند (NaN یعنی سوینگی وجود ندارد).
+    همه شرط‌ها با عملیات آرایه‌ای روی کل بازه بررسی می‌شوند و فقط کندل‌های دارای POI به دیکشنری تبدیل می‌شوند.
+    """
+    start = max(start, 1)
+    if len(closes) <= start:
+        return []
+    s = slice(start, None)
+    p = slice(start - 1, -1)
+    o, h, l, c = opens[s], highs[s], lows[s], closes[s]
+    sh, sl = swing_high[s], swing_low[s]
+
+    with np.errstate(invalid='ignore'):
+        sweep_bear = (h > sh) & (c < sh)
+        sweep_bull = ~sweep_bear & (l < sl) & (c > sl)
+        bos_bull = c > sh
+        bos_bear = ~bos_bull & (c < sl)
+    ob_bull = (c > highs[p]) & (opens[p] > closes[p])
+    ob_bear = ~ob_bull & (c < lows[p]) & (opens[p] < closes[p])
+
+    bullish = sweep_bull
+    has_bos = np.where(bullish, bos_bull, bos_bear)
+    has_ob = np.where(bullish, ob_bull, ob_bear)
+    hits = np.flatnonzero((sweep_bear | sweep_bull) & (has_bos | has_ob))
+
+    labels = _reason_labels(label)
+    pois = []
+    for k in hits:
+        is_bull = bool(bullish[k])
+        pois.append({
+            'type': labels[(bool(has_bos[k]), bool(has_ob[k]))],
+            'entry_price': float(h[k] if is_bull else l[k]),
+            'stop_loss': float(l[k] if is_bull else h[k]),
+            'discovery_time': index[start + k],
+            'direction': 'Bullish' if is_bull else 'Bearish'
+        })
+    return pois
+
+
+def scan_pois(df_htf, lag=1, label='5m', start=1):
+    """
+    یک پیمایش کامل (بدون حلقه پانداس) روی DataFrame دارای ستون‌های is_swing_high/is_swing_low.
+    معادل برداری حلقه قبلی _find_poi_with_or_logic در SmartMoneySetup.
+    """
+    highs = df_htf['high'].to_numpy(dtype=float)
+    lows = df_htf['low'].to_numpy(dtype=float)
+    swing_high, swing_low = last_swing_levels(highs, lows, df_htf['is_swing_high'].to_numpy(),
+                                              df_htf['is_swing_low'].to_numpy(), lag)
+    return find_pois(df_htf.index, df_htf['open'].to_numpy(dtype=float), highs, lows,
+                     df_htf['close'].to_numpy(dtype=float), swing_high, swing_low, start, label)
+
+
+class POIScanner:
+    """
+    حالت افزایشی: فقط کندل‌های بسته شده‌ای که از فراخوانی قبلی اضافه شده‌اند بررسی می‌شوند.
+    سوینگ‌ها از SwingDetector مشترک (سوینگ‌های تایید شده تا این لحظه) خوانده می‌شوند.
+    در اولین فراخوانی فقط backfill کندل آخر بررسی می‌شود.
+    """
+    def __init__(self, lag=1, label='5m', backfill=3):
+        self.lag = lag
+        self.label = label
+        self.backfill = backfill
+        self.last_time = None
+
+    def update(self, df_htf, swings):
+        """POI های جدید کندل‌های df_htf (فقط کندل‌های بسته شده) که بعد از last_time هستند."""
+        if df_htf.empty:
+            return []
+        n = len(df_htf)
+        start = n - self.backfill if self.last_time is None else int(df_htf.index.searchsorted(self.last_time, side='right'))
+        start = max(start, 1)
+        self.last_time = df_htf.index[-1]
+        if start >= n:
+            return []
+
+        swing_high = np.full(n, np.nan)
+        swing_low = np.full(n, np.nan)
+        for i in range(start, n):
+            cutoff = df_htf.index[i - self.lag + 1]
+            high, low = swings.last_before(SWING_HIGH, cutoff), swings.last_before(SWING_LOW, cutoff)
+            swing_high[i] = np.nan if high is None else high
+            swing_low[i] = np.nan if low is None else low
+        return find_pois(df_htf.index, df_htf['open'].to_numpy(dtype=float), df_htf['high'].to_numpy(dtype=float),
+                         df_htf['low'].to_numpy(dtype=float), df_htf['close'].to_numpy(dtype=float),
+                         swing_high, swing_low, start, self.label)
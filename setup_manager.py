@@ -2,6 +2,8 @@
 
 import traceback
 
+from setup_triggers import TriggerEvaluator
+
 # ۱. ایمپورت کردن تمام کلاس‌های ستاپ فعال از پوشه setups
 from setups.key_level_trend_setup import KeyLevelTrendSetup
 from setups.ichimoku_setup import IchimokuSetup
@@ -9,6 +11,7 @@ from setups.liq_sweep_setup import LiqSweepSetup
 from setups.pinbar_setup import PinbarSetup # <<< ایمپورت کردن ستاپ جدید پین‌بار
 from setups.smart_money_setup import SmartMoneySetup
 from setups.advanced_orderflow_setup import AdvancedOrderflowSetup
+from setups.base_setup import BaseSetup
 
 
 
@@ -37,28 +40,68 @@ class SetupManager:
             # IchimokuSetup(self.state_manager), # اگر این فایل را دارید، آن را هم کامنت کنید
         ]
         
+        # ایندکس رویدادها: {trigger: اندیس ستاپ‌هایی که آن را اعلام کرده‌اند}؛ هر trigger در هر کندل
+        # فقط یک بار ارزیابی می‌شود و فقط ستاپ‌هایی که trigger آن‌ها فعال شده اجرا می‌شوند
+        self.trigger_index = {}
+        for i, setup in enumerate(self.setups):
+            for trigger in setup.triggers:
+                self.trigger_index.setdefault(trigger, []).append(i)
+        # ستاپ‌هایی که وضعیت داخلی خودشان را هم (با wants_candle) بررسی می‌کنند
+        self.gated_setups = [i for i, s in enumerate(self.setups)
+                             if type(s).wants_candle is not BaseSetup.wants_candle]
+        self.trigger_evaluator = TriggerEvaluator()
+
         # چاپ نام ستاپ‌های فعال برای اطلاع در هنگام شروع ربات
         active_setup_names = [s.name for s in self.setups]
         print(f"SetupManager initialized successfully with setups: {active_setup_names}")
 
     def check_all_setups(self, **kwargs):
         """
-        تمام ستاپ‌های موجود در لیست self.setups را به ترتیب اجرا می‌کند.
+        ستاپ‌هایی که در این کندل trigger آن‌ها فعال شده (به ترتیب لیست self.setups) را اجرا می‌کند.
+        بدون context (فراخوانی قدیمی) تمام ستاپ‌ها اجرا می‌شوند.
         """
-        for setup in self.setups:
+        context = kwargs.get('context')
+        due = range(len(self.setups)) if context is None else self._due_setups(context, kwargs)
+        for i in due:
+            setup = self.setups[i]
             try:
                 signal = setup.check(**kwargs)
                 if signal:
                     return self._format_signal(signal, setup.name)
             
             except Exception as e:
-                symbol = kwargs.get('symbol', 'N/A')
-                print(f"---! ERROR in setup '{setup.name}' for symbol '{symbol}' !---")
-                print(f"Error details: {e}")
-                traceback.print_exc()
+                self._report_error(setup, kwargs, e)
         
         return None
 
+    def _due_setups(self, context, kwargs):
+        """اندیس ستاپ‌هایی که باید در این کندل اجرا شوند (مرتب)."""
+        due = set()
+        for trigger, indexes in self.trigger_index.items():
+            try:
+                if self.trigger_evaluator.fired(trigger, context):
+                    due.update(indexes)
+            except Exception as e:
+                # در صورت خطا در ارزیابی، ستاپ‌ها اجرا می‌شوند تا سیگنالی از دست نرود
+                print(f"---! ERROR evaluating trigger {trigger} for symbol '{context.symbol}' !---")
+                print(f"Error details: {e}")
+                due.update(indexes)
+        for i in self.gated_setups:
+            if i in due:
+                continue
+            try:
+                if self.setups[i].wants_candle(context):
+                    due.add(i)
+            except Exception as e:
+                self._report_error(self.setups[i], kwargs, e)
+        return sorted(due)
+
+    def _report_error(self, setup, kwargs, e):
+        symbol = kwargs.get('symbol', 'N/A')
+        print(f"---! ERROR in setup '{setup.name}' for symbol '{symbol}' !---")
+        print(f"Error details: {e}")
+        traceback.print_exc()
+
     def _format_signal(self, signal: dict, setup_name: str) -> dict:
         """
         یک متد کمکی برای اطمینان از اینکه هر سیگنال خروجی، حاوی نام ستاپی
@@ -0,0 +1,66 @@
+# setup_triggers.py
+
+import numpy as np
+
+# هر trigger یک تاپل (hashable) است تا SetupManager بتواند ستاپ‌ها را بر اساس آن ایندکس کند
+# و هر trigger مشترک فقط یک بار در هر کندل ارزیابی شود.
+EVERY_CANDLE = ('every_candle',)
+
+
+def bar_close(timeframe):
+    """با بسته شدن کندل یک تایم‌فریم (مثلا '5m') فعال می‌شود."""
+    return ('bar_close', timeframe)
+
+
+def near_level(atr_multiple=0.0, percent=0.0):
+    """
+    وقتی بازه کندل ۱ دقیقه‌ای جاری تا فاصله max(atr_multiple × ATR، percent × قیمت) از یکی از
+    سطوح کلیدی (یا dPOC/dVAH/dVAL) باشد فعال می‌شود؛ near_level() یعنی برخورد مستقیم با سطح.
+    """
+    return ('near_level', float(atr_multiple), float(percent))
+
+
+def new_swing(timeframe, left, right=None):
+    """با تایید یک سوینگ جدید در SwingDetector مشترک (timeframe, left, right) فعال می‌شود."""
+    return ('new_swing', timeframe, left, left if right is None else right)
+
+
+class TriggerEvaluator:
+    """
+    ارزیابی trigger ها روی MarketContext یک کندل. تنها حالت نگهداری شده تعداد سوینگ‌های
+    دیده شده هر SwingDetector (به ازای هر نماد) برای تشخیص «سوینگ جدید» است.
+    """
+    def __init__(self):
+        self._swing_totals = {}
+
+    def fired(self, trigger, context):
+        kind = trigger[0]
+        if kind == 'every_candle':
+            return True
+        if kind == 'bar_close':
+            return trigger[1] in context.closed_bars
+        if kind == 'near_level':
+            return self._near_level(context, trigger[1], trigger[2])
+        if kind == 'new_swing':
+            return self._new_swing(context, *trigger[1:])
+        raise ValueError(f"Unknown setup trigger: {trigger}")
+
+    def _near_level(self, context, atr_multiple, percent):
+        prices = context.level_prices
+        if len(prices) == 0:
+            return False
+        kline = context.kline_1m
+        distance = max(atr_multiple * (context.atr or 0), percent * kline['close'])
+        # اولین سطح بزرگ‌تر یا مساوی low - distance (جستجوی دودویی روی قیمت‌های مرتب)
+        i = np.searchsorted(prices, kline['low'] - distance, side='left')
+        return i < len(prices) and prices[i] <= kline['high'] + distance
+
+    def _new_swing(self, context, timeframe, left, right):
+        key = (context.symbol, timeframe, left, right)
+        # سوینگ‌ها فقط با بسته شدن کندل همان تایم‌فریم تایید می‌شوند
+        if key in self._swing_totals and timeframe not in context.closed_bars:
+            return False
+        total = context.swings(timeframe, left, right).total
+        previous = self._swing_totals.get(key)
+        self._swing_totals[key] = total
+        return previous is not None and total != previous
@@ -1,7 +1,7 @@
 import pandas as pd
 import numpy as np
-from sklearn.linear_model import LinearRegression
 from .base_setup import BaseSetup
+from streaming_indicators import RollingOLS
 from indicators import calculate_atr # برای حد ضرر پویا
 
 class AdvancedOrderflowSetup(BaseSetup):
@@ -29,11 +29,17 @@ class AdvancedOrderflowSetup(BaseSetup):
         prev_candle = price_data.iloc[-2]
         val = levels.get('val', 0)
         vah = levels.get('vah', 0)
+
+        # در صورت وجود فوت‌پرینت (استریم aggTrade)، دلتای واقعی کندل جایگزین دلتای تخمینی از kline می‌شود
+        footprint = kwargs.get('footprint')
+        if footprint is not None:
+            session_indicators = dict(session_indicators, delta=footprint.delta)
         
         # اجرای هر ستاپ
         signals = []
         signals.append(self._check_stop_hunt(symbol, current_candle, prev_candle, val, vah, atr, session_indicators))
-        signals.append(self._check_pdf_reversal(symbol, current_candle, val, vah, atr, session_indicators, price_data))
+        signals.append(self._check_pdf_reversal(symbol, current_candle, val, vah, atr, session_indicators, price_data,
+                                                kwargs.get('volume_stats')))
         signals.append(self._check_delta_regression(symbol, current_candle, atr, session_indicators))
         signals.append(self._check_vwap_deviation(symbol, current_candle, atr, session_indicators))
 
@@ -67,7 +73,7 @@ class AdvancedOrderflowSetup(BaseSetup):
             current['close'] > current['open'] and
             indicators.get('delta', 0) > 0 # تایید با دلتای مثبت
         )
-        if all(buy_conditions):
+        if buy_conditions:
             sl = prev['low'] - (atr * 0.5)
             tp = self._find_dynamic_target(current['close'], 'Buy', {'vah': vah})
             return self._create_signal('Long', symbol, current['close'], sl, tp, "Stop Hunt at VAL", [f"✅ شکار نقدینگی در VAL ({val:.2f})", f"✅ تایید با دلتای مثبت"])
@@ -79,20 +85,23 @@ class AdvancedOrderflowSetup(BaseSetup):
             current['close'] < current['open'] and
             indicators.get('delta', 0) < 0 # تایید با دلتای منفی
         )
-        if all(sell_conditions):
+        if sell_conditions:
             sl = prev['high'] + (atr * 0.5)
             tp = self._find_dynamic_target(current['close'], 'Sell', {'val': val})
             return self._create_signal('Short', symbol, current['close'], sl, tp, "Stop Hunt at VAH", [f"✅ شکار نقدینگی در VAH ({vah:.2f})", f"✅ تایید با دلتای منفی"])
         return None
 
     # ------------------------ ستاپ ۲: بازگشت با حجم غیرعادی (PDF) ------------------------
-    def _check_pdf_reversal(self, symbol, current, val, vah, atr, indicators, df):
+    def _check_pdf_reversal(self, symbol, current, val, vah, atr, indicators, df, volume_stats=None):
         if val == 0 or vah == 0: return None
         
-        # محاسبه Z-Score حجم کندل فعلی
-        mean_vol = df['volume'].mean()
-        std_vol = df['volume'].std()
-        z_score = (current['volume'] - mean_vol) / std_vol if std_vol > 0 else 0
+        # محاسبه Z-Score حجم کندل فعلی (میانگین/انحراف معیار لغزان مانیتور؛ در نبود آن از کل DataFrame)
+        if volume_stats is not None:
+            z_score = volume_stats.zscore(current['volume'])
+        else:
+            mean_vol = df['volume'].mean()
+            std_vol = df['volume'].std()
+            z_score = (current['volume'] - mean_vol) / std_vol if std_vol > 0 else 0
 
         # شرایط خرید: حجم بالا در نزدیکی VAL
         buy_conditions = (
@@ -100,7 +109,7 @@ class AdvancedOrderflowSetup(BaseSetup):
             z_score >= self.config['volume_z_score_threshold'] and
             current['close'] > current['open'] and indicators.get('delta', 0) > 0
         )
-        if all(buy_conditions):
+        if buy_conditions:
             sl = current['low'] - (atr * 0.5)
             tp = self._find_dynamic_target(current['close'], 'Buy', {'vah': vah})
             return self._create_signal('Long', symbol, current['close'], sl, tp, "PDF Reversal at VAL", [f"✅ حجم غیرعادی (Z-Score: {z_score:.2f}) در VAL", "✅ جذب سفارشات خرید"])
@@ -111,7 +120,7 @@ class AdvancedOrderflowSetup(BaseSetup):
             z_score >= self.config['volume_z_score_threshold'] and
             current['close'] < current['open'] and indicators.get('delta', 0) < 0
         )
-        if all(sell_conditions):
+        if sell_conditions:
             sl = current['high'] + (atr * 0.5)
             tp = self._find_dynamic_target(current['close'], 'Sell', {'val': val})
             return self._create_signal('Short', symbol, current['close'], sl, tp, "PDF Reversal at VAH", [f"✅ حجم غیرعادی (Z-Score: {z_score:.2f}) در VAH", "✅ جذب سفارشات فروش"])
@@ -125,17 +134,23 @@ class AdvancedOrderflowSetup(BaseSetup):
         if len(price_window) < self.config['regression_window']:
             return None
             
-        X = np.arange(len(delta_window)).reshape(-1, 1)
-        price_slope = LinearRegression().fit(X, price_window).coef_[0]
-        delta_slope = LinearRegression().fit(X, delta_window).coef_[0]
-        correlation = np.corrcoef(price_window, delta_window)[0, 1]
+        if 'price_slope' in indicators:
+            # شیب‌ها و همبستگی به صورت افزایشی در SessionIndicatorEngine نگهداری می‌شوند
+            price_slope = indicators['price_slope']
+            delta_slope = indicators['delta_slope']
+            correlation = indicators['price_delta_corr']
+        else:
+            t = np.arange(len(delta_window))
+            price_slope = RollingOLS.from_arrays(t, price_window).slope
+            delta_slope = RollingOLS.from_arrays(t, delta_window).slope
+            correlation = RollingOLS.from_arrays(price_window, delta_window).r
 
         # شرایط خرید: واگرایی صعودی
         buy_conditions = (
             price_slope < 0 and delta_slope > 0 and
-            correlation < self.config['delta_divergence_threshold'] and current['delta'] > 0
+            correlation < self.config['delta_divergence_threshold'] and indicators.get('delta', 0) > 0
         )
-        if all(buy_conditions):
+        if buy_conditions:
             sl = current['low'] - (atr * 1.5)
             tp = self._find_dynamic_target(current['close'], 'Buy', {})
             return self._create_signal('Long', symbol, current['close'], sl, tp, "Delta Bullish Divergence", [f"✅ واگرایی دلتا: قیمت 📉, دلتا 📈", f"✅ همبستگی: {correlation:.2f}"])
@@ -143,9 +158,9 @@ class AdvancedOrderflowSetup(BaseSetup):
         # شرایط فروش: واگرایی نزولی
         sell_conditions = (
             price_slope > 0 and delta_slope < 0 and
-            correlation < self.config['delta_divergence_threshold'] and current['delta'] < 0
+            correlation < self.config['delta_divergence_threshold'] and indicators.get('delta', 0) < 0
         )
-        if all(sell_conditions):
+        if sell_conditions:
             sl = current['high'] + (atr * 1.5)
             tp = self._find_dynamic_target(current['close'], 'Sell', {})
             return self._create_signal('Short', symbol, current['close'], sl, tp, "Delta Bearish Divergence", [f"✅ واگرایی دلتا: قیمت 📈, دلتا 📉", f"✅ همبستگی: {correlation:.2f}"])
@@ -164,7 +179,7 @@ class AdvancedOrderflowSetup(BaseSetup):
             current['close'] > lower_band and
             current['close'] > current['open'] and indicators.get('delta', 0) > 0
         )
-        if all(buy_conditions):
+        if buy_conditions:
             sl = current['low'] - (atr * 0.5)
             return self._create_signal('Long', symbol, current['close'], sl, vwap, "VWAP Lower Band Reversal", [f"✅ بازگشت از باند پایین VWAP ({lower_band:.2f})", "✅ هدف: بازگشت به VWAP"])
 
@@ -174,7 +189,7 @@ class AdvancedOrderflowSetup(BaseSetup):
             current['close'] < upper_band and
             current['close'] < current['open'] and indicators.get('delta', 0) < 0
         )
-        if all(sell_conditions):
+        if sell_conditions:
             sl = current['high'] + (atr * 0.5)
             return self._create_signal('Short', symbol, current['close'], sl, vwap, "VWAP Upper Band Reversal", [f"✅ بازگشت از باند بالای VWAP ({upper_band:.2f})", "✅ هدف: بازگشت به VWAP"])
         return None
@@ -184,6 +199,8 @@ class AdvancedOrderflowSetup(BaseSetup):
         return {
             'symbol': symbol,
             'type': direction,
+            'direction': 'Buy' if direction == 'Long' else 'Sell',
+            'entry_price': entry,
             'level': entry,
             'stop_loss': sl,
             'take_profit': tp,
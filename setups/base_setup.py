@@ -1,10 +1,22 @@
 # setups/base_setup.py
 
+from setup_triggers import EVERY_CANDLE
+
 class BaseSetup:
+    # رویدادهایی که ستاپ با آن‌ها اجرا می‌شود (setup_triggers)؛ پیش‌فرض: هر کندل ۱ دقیقه‌ای
+    triggers = (EVERY_CANDLE,)
+
     def __init__(self, state_manager, config=None):
         self.name = "BaseSetup"
         self.config = config or {}
         self.state_manager = state_manager
 
+    def wants_candle(self, context):
+        """
+        بررسی ارزان وضعیت داخلی ستاپ (مثلا ناحیه‌های منتظر برخورد) برای کندل‌هایی که هیچ‌کدام از
+        triggers آن فعال نشده‌اند. فقط برای ستاپ‌هایی که آن را بازنویسی کرده‌اند صدا زده می‌شود.
+        """
+        return False
+
     def check(self, **kwargs):
-        raise NotImplementedError("متد check باید در کلاس فرزند پیاده‌سازی شود.")
\ No newline at end of file
+        raise NotImplementedError("متد check باید در کلاس فرزند پیاده‌سازی شود.")
@@ -1,7 +1,9 @@
 # setups/ichimoku_setup.py (نسخه جدید بدون نیاز به pandas_ta)
 
 import pandas as pd
-from collections import deque
+from candle_buffer import CandleRingBuffer
+from market_context import MarketContext
+from streaming_indicators import rolling_max, rolling_min
 from .base_setup import BaseSetup
 
 class IchimokuSetup(BaseSetup):
@@ -21,49 +23,50 @@ class IchimokuSetup(BaseSetup):
         self.name = "IchimokuReversalOrigin"
         self.origin_zones = {}
 
-    def _calculate_tenkan_sen(self, df: pd.DataFrame) -> pd.Series:
+    def _calculate_tenkan_sen(self, highs, lows):
         """
-        خط Tenkan-sen را به صورت دستی محاسبه می‌کند.
+        خط Tenkan-sen را به صورت دستی (نسخه دسته‌ای NumPy) محاسبه می‌کند.
         فرمول: (بالاترین قیمت در ۹ دوره + پایین‌ترین قیمت در ۹ دوره) / ۲
         """
         lookback = self.config['tenkan_period']
-        high_9 = df['high'].rolling(window=lookback).max()
-        low_9 = df['low'].rolling(window=lookback).min()
-        return (high_9 + low_9) / 2
+        return (rolling_max(highs, lookback) + rolling_min(lows, lookback)) / 2
 
-    def check(self, symbol: str, kline_history: deque, **kwargs):
+    def _recent_tenkan(self, context: MarketContext, n):
+        """
+        آخرین n مقدار Tenkan-sen. ایچیموکو افزایشی مانیتور (در صورت هم‌دوره بودن) مستقیما استفاده می‌شود؛
+        در غیر این صورت فقط روی n + دوره کندل آخر محاسبه می‌شود.
+        """
+        lookback = self.config['tenkan_period']
+        ichimoku = context.ichimoku_1m
+        if ichimoku is not None and ichimoku.periods['tenkan'] == lookback:
+            return ichimoku.recent('tenkan', n)
+        size = n + lookback - 1
+        return self._calculate_tenkan_sen(context.high[-size:], context.low[-size:])[-n:]
+
+    def check(self, symbol: str, kline_history: CandleRingBuffer, context: MarketContext, **kwargs):
         if len(kline_history) < self.config['history_candles']:
             return None
 
         if symbol not in self.origin_zones:
             self.origin_zones[symbol] = []
 
-        df = pd.DataFrame(list(kline_history))
-        for col in ['open', 'high', 'low', 'close', 'volume']:
-            df[col] = pd.to_numeric(df[col], errors='coerce')
-        df['open_time'] = pd.to_datetime(df['open_time'], unit='ms')
-
-        # --- جایگزینی pandas_ta با محاسبه دستی ---
-        df['tenkan_sen'] = self._calculate_tenkan_sen(df)
-        
-        # حذف ردیف‌هایی که مقدار NaN دارند (به دلیل دوره rolling)
-        df.dropna(subset=['tenkan_sen'], inplace=True)
-        if df.empty:
+        # DataFrame مشترک context (بدون کپی، چون ستونی به آن اضافه نمی‌شود) و چهار مقدار آخر Tenkan-sen
+        df = context.price_data
+        tenkan = self._recent_tenkan(context, 4)
+        if len(tenkan) < 4 or pd.isna(tenkan).any():
             return None
-        # --- پایان جایگزینی ---
 
-        self._find_new_origin_zone(symbol, df)
+        self._find_new_origin_zone(symbol, df, tenkan)
         return self._check_for_reversal_entry(symbol, df)
 
-    def _find_new_origin_zone(self, symbol: str, df: pd.DataFrame):
+    def _find_new_origin_zone(self, symbol: str, df: pd.DataFrame, tenkan):
         if len(df) < 4: return
         
         last_candle = df.iloc[-2]
-        prev_candle = df.iloc[-3]
         
-        tenkan_now = last_candle['tenkan_sen']
-        tenkan_prev = prev_candle['tenkan_sen']
-        tenkan_before_prev = df.iloc[-4]['tenkan_sen']
+        tenkan_now = tenkan[-2]
+        tenkan_prev = tenkan[-3]
+        tenkan_before_prev = tenkan[-4]
 
         # منطق پیدا کردن ناحیه (بدون تغییر)
         is_v_shape_turn = tenkan_now > tenkan_prev and tenkan_prev < tenkan_before_prev
@@ -2,6 +2,7 @@
 
 import time
 import pandas as pd
+from setup_triggers import near_level
 from .base_setup import BaseSetup
 
 class KeyLevelTrendSetup(BaseSetup):
@@ -12,6 +13,8 @@ class KeyLevelTrendSetup(BaseSetup):
         }
         super().__init__(state_manager, config or default_config)
         self.name = "KeyLevelTrend"
+        # فقط کندل‌هایی که تا فاصله price_buffer_percent از یک سطح رسیده‌اند می‌توانند سیگنال بدهند
+        self.triggers = (near_level(percent=self.config['price_buffer_percent']),)
     
     def check(self, symbol: str, price_data: pd.DataFrame, levels: dict, daily_trend: str, **kwargs):
         if daily_trend == 'NEUTRAL' or price_data.empty:
@@ -1,7 +1,8 @@
 # setups/pinbar_setup.py
 
-from collections import defaultdict
 from datetime import datetime, timezone
+from level_index import TOUCHED, UNTOUCHED, LevelIndex
+from setup_triggers import bar_close, near_level
 from .base_setup import BaseSetup
 
 class PinbarSetup(BaseSetup):
@@ -12,9 +13,18 @@ class PinbarSetup(BaseSetup):
     def __init__(self, state_manager, config=None):
         super().__init__(state_manager, config)
         self.name = "PinbarConfirmation"
-        # این متغیرها وضعیت داخلی خود ستاپ را مدیریت می‌کنند
-        self.active_levels = defaultdict(dict)  # e.g., {'BTCUSDT': {65000: "Touched"}}
-        self.level_test_counts = defaultdict(lambda: defaultdict(int))
+        # وضعیت ستاپ فقط با برخورد قیمت به یک سطح یا بسته شدن کندل ۵ دقیقه تغییر می‌کند
+        self.triggers = (near_level(), bar_close('5m'))
+        # وضعیت داخلی ستاپ: یک ایندکس مرتب از سطوح (با وضعیت و تعداد تست) برای هر ارز
+        self.level_indexes = {}      # e.g., {'BTCUSDT': LevelIndex}
+        self._level_sources = {}     # لیست key_levels که ایندکس از آن ساخته شده است
+
+    def _get_level_index(self, symbol, key_levels):
+        """ایندکس سطوح ارز را برمی‌گرداند و در صورت تغییر لیست سطوح (مثلا پس از reinit) آن را از نو می‌سازد."""
+        if self._level_sources.get(symbol) is not key_levels:
+            self.level_indexes[symbol] = LevelIndex(key_levels)
+            self._level_sources[symbol] = key_levels
+        return self.level_indexes[symbol]
 
     def _get_trading_session(self, utc_hour):
         if 1 <= utc_hour < 8: return "Asian Session"
@@ -36,25 +46,21 @@ class PinbarSetup(BaseSetup):
             return is_pin_bar_body and upper_wick > body * 2
         return False
 
-    def _check_level_proximity(self, symbol, kline_1m, key_levels):
-        """با هر کندل ۱ دقیقه، برخورد به سطوح را چک می‌کند."""
-        for level_data in key_levels:
-            level_price = level_data['level']
-            if kline_1m['low'] <= level_price <= kline_1m['high']:
-                if self.active_levels[symbol].get(level_price) != "Touched":
-                    print(f"🎯 [{self.name}][{symbol}] Price touched level {level_data['level_type']} at {level_price}")
-                    self.active_levels[symbol][level_price] = "Touched"
-                    self.level_test_counts[symbol][level_price] += 1
-                    # آپدیت وضعیت در state_manager برای نمایش در داشبورد
-                    self.state_manager.update_symbol_state(symbol, 'level_test_counts', dict(self.level_test_counts[symbol]))
+    def _check_level_proximity(self, symbol, kline_1m, level_index):
+        """با هر کندل ۱ دقیقه، برخورد به سطوح را (با جستجوی دودویی در ایندکس سطوح) چک می‌کند."""
+        touched_idx = level_index.touch(kline_1m['low'], kline_1m['high'])
+        for i in touched_idx:
+            level_data = level_index.levels[i]
+            print(f"🎯 [{self.name}][{symbol}] Price touched level {level_data['level_type']} at {level_data['level']}")
+        if len(touched_idx):
+            # آپدیت وضعیت در state_manager برای نمایش در داشبورد
+            self.state_manager.update_symbol_state(symbol, 'level_test_counts', level_index.test_counts_by_price())
 
-    def _evaluate_level_interaction(self, symbol, kline_5m, key_levels, daily_trend):
+    def _evaluate_level_interaction(self, symbol, kline_5m, level_index, daily_trend):
         """با بسته شدن کندل ۵ دقیقه، به دنبال سیگنال پین‌بار می‌گردد."""
-        for level_price, status in list(self.active_levels.get(symbol, {}).items()):
-            if status != "Touched": continue
-            
-            level_data = next((l for l in key_levels if l['level'] == level_price), None)
-            if not level_data: continue
+        for i in level_index.with_status(TOUCHED):
+            level_data = level_index.levels[i]
+            level_price = level_data['level']
             
             trade_direction = None
             if "UP" in daily_trend and level_data['level_type'] in ['PDL', 'VAL', 'POC']:
@@ -67,7 +73,7 @@ class PinbarSetup(BaseSetup):
             if self._check_pin_bar(kline_5m, trade_direction):
                 # پکیج سیگنال را ایجاد و برگردان
                 utc_now = datetime.now(timezone.utc)
-                test_count = self.level_test_counts[symbol][level_data['level']]
+                test_count = int(level_index.test_counts[i])
                 session = self._get_trading_session(utc_now.hour)
                 reasons = [
                     f"✅ پین‌بار ۵ دقیقه‌ای در جهت روند.",
@@ -76,8 +82,8 @@ class PinbarSetup(BaseSetup):
                 ]
                 stop_loss = kline_5m['low'] if trade_direction == 'Buy' else kline_5m['high']
                 
-                # ناحیه لمس شده را از لیست فعال حذف می‌کنیم تا سیگنال تکراری ندهد
-                del self.active_levels[symbol][level_price]
+                # ناحیه لمس شده را از لیست فعال خارج می‌کنیم تا سیگنال تکراری ندهد
+                level_index.status[i] = UNTOUCHED
 
                 return {
                     "type": trade_direction,
@@ -93,11 +99,13 @@ class PinbarSetup(BaseSetup):
         # این ستاپ به هر دو کندل ۱ دقیقه و ۵ دقیقه نیاز دارد
         if not kline_1m: return None
 
+        level_index = self._get_level_index(symbol, key_levels)
+
         # بخش ۱: چک کردن برخورد با هر کندل ۱ دقیقه‌ای
-        self._check_level_proximity(symbol, kline_1m, key_levels)
+        self._check_level_proximity(symbol, kline_1m, level_index)
 
         # بخش ۲: ارزیابی اصلی فقط زمانی که کندل ۵ دقیقه جدیدی بسته شده باشد
         if not kline_5m:
             return None
         
-        return self._evaluate_level_interaction(symbol, kline_5m, key_levels, daily_trend)
\ No newline at end of file
+        return self._evaluate_level_interaction(symbol, kline_5m, level_index, daily_trend)
\ No newline at end of file
@@ -2,10 +2,15 @@
 
 import pandas as pd
 import numpy as np
-from collections import deque
+from candle_buffer import CandleRingBuffer
+from market_context import MarketContext
 from scipy.stats import linregress
-from scipy.signal import find_peaks
+from fvg_scanner import scan_fvgs
+from poi_scanner import scan_pois
+from streaming_indicators import ichimoku
+from swing_detector import SwingDetector
 from datetime import datetime, timezone
+from setup_triggers import new_swing
 from .base_setup import BaseSetup
 
 class SmartMoneySetup(BaseSetup):
@@ -28,22 +33,31 @@ class SmartMoneySetup(BaseSetup):
         # مدیریت وضعیت داخلی ستاپ برای هر ارز
         self.points_of_interest = {}
         self.last_5m_timestamp = {}
+        # سطح شکست CHOCH ساختار فعلی هر ارز به صورت (جهت، قیمت) یا None (که با هر اجرای check به‌روز می‌شود)
+        self._choch_levels = {}
+        # ساختار فقط با سوینگ جدید ۵ دقیقه تغییر می‌کند؛ در بقیه کندل‌ها ستاپ فقط با شکست سطح آن (wants_candle) اجرا می‌شود
+        self.triggers = (new_swing('5m', self.config['swing_lookback_5m']),)
+
+    def wants_candle(self, context: MarketContext):
+        """قیمت بسته شدن کندل جاری سوینگ سوم الگوی CHOCH ساختار ۵ دقیقه را شکسته است (یا سطح هنوز محاسبه نشده)."""
+        if context.symbol not in self._choch_levels:
+            return True
+        level = self._choch_levels[context.symbol]
+        if level is None:
+            return False
+        direction, price = level
+        close = context.kline_1m['close']
+        return close > price if direction == 'Buy' else close < price
 
     # ==========================================================================
     # بخش اول: توابع تحلیلی (برگرفته از اسکریپت شما)
     # ==========================================================================
 
     def _calculate_ichimoku(self, df):
-        nine_period_high = df['high'].rolling(window=9).max()
-        nine_period_low = df['low'].rolling(window=9).min()
-        df['tenkan_sen'] = (nine_period_high + nine_period_low) / 2
-        twenty_six_period_high = df['high'].rolling(window=26).max()
-        twenty_six_period_low = df['low'].rolling(window=26).min()
-        df['kijun_sen'] = (twenty_six_period_high + twenty_six_period_low) / 2
-        df['senkou_a'] = ((df['tenkan_sen'] + df['kijun_sen']) / 2).shift(26)
-        fifty_two_period_high = df['high'].rolling(window=52).max()
-        fifty_two_period_low = df['low'].rolling(window=52).min()
-        df['senkou_b'] = ((fifty_two_period_high + fifty_two_period_low) / 2).shift(26)
+        # نسخه دسته‌ای NumPy از streaming_indicators (همان مقادیر rolling پانداس)
+        lines = ichimoku(df['high'].to_numpy(dtype=float), df['low'].to_numpy(dtype=float))
+        for name, values in lines.items():
+            df[name] = values
         return df
 
     def _get_ichimoku_score(self, df_4h, last_price):
@@ -80,10 +94,11 @@ class SmartMoneySetup(BaseSetup):
             elif delta < 0: cvd_score = -1
         return pa_score + cvd_score
 
-    def _analyze_master_trend(self, df_1m, last_price):
-        # Resample data for different timeframes
-        df_4h = df_1m.resample('4H').agg({'open': 'first', 'high': 'max', 'low': 'min', 'close': 'last'}).dropna()
-        df_daily = df_1m.resample('D').agg({'open': 'first', 'high': 'max', 'low': 'min', 'close': 'last', 'taker_buy_base_asset_volume': 'sum', 'volume': 'sum'}).dropna()
+    def _analyze_master_trend(self, context: MarketContext, last_price):
+        # کندل‌های 4H و روزانه از context مشترک خوانده می‌شوند (بدون resample در هر دقیقه)
+        df_1m = context.price_data
+        df_4h = context.bars('4h')
+        df_daily = context.bars('1d')
         
         # Split daily data for PA/CVD analysis
         historical_daily_df = df_daily.iloc[:-1]
@@ -100,41 +115,15 @@ class SmartMoneySetup(BaseSetup):
         return "SIDEWAYS"
 
     def _find_swing_points(self, df, distance):
-        high_peaks, _ = find_peaks(df['high'], distance=distance)
-        df['is_swing_high'] = False
-        df.iloc[high_peaks, df.columns.get_loc('is_swing_high')] = True
-        low_peaks, _ = find_peaks(-df['low'], distance=distance)
-        df['is_swing_low'] = False
-        df.iloc[low_peaks, df.columns.get_loc('is_swing_low')] = True
+        # ستون‌های is_swing_high/is_swing_low از روی پیوت‌های SwingDetector (به جای find_peaks روی کل تاریخچه)
+        swings = SwingDetector.from_frame(df, distance, capacity=len(df) + 1).to_frame()
+        df['is_swing_high'] = df.index.isin(swings.index[swings['type'] == 'high'])
+        df['is_swing_low'] = df.index.isin(swings.index[swings['type'] == 'low'])
         return df
 
     def _find_poi_with_or_logic(self, df_htf):
-        points_of_interest = []
-        check_ob = lambda c1, c2: ('Bullish', 'OB') if c2['close'] > c1['high'] and c1['open'] > c1['close'] else (('Bearish', 'OB') if c2['close'] < c1['low'] and c1['open'] < c1['close'] else (None, None))
-        for i in range(1, len(df_htf)):
-            current_candle = df_htf.iloc[i]
-            past_swings = df_htf.iloc[:i][df_htf.iloc[:i]['is_swing_high'] | df_htf.iloc[:i]['is_swing_low']]
-            if past_swings.empty: continue
-            last_sw_high_val = past_swings[past_swings['is_swing_high']]['high'].iloc[-1] if not past_swings[past_swings['is_swing_high']].empty else None
-            last_sw_low_val = past_swings[past_swings['is_swing_low']]['low'].iloc[-1] if not past_swings[past_swings['is_swing_low']].empty else None
-            sweep_dir, sweep_type = (('Bearish', 'Liquidity Sweep') if last_sw_high_val and current_candle['high'] > last_sw_high_val and current_candle['close'] < last_sw_high_val else
-                                     (('Bullish', 'Liquidity Sweep') if last_sw_low_val and current_candle['low'] < last_sw_low_val and current_candle['close'] > last_sw_low_val else (None, None)))
-            if not sweep_dir: continue
-            bos_dir, bos_type = (('Bullish', 'BOS') if last_sw_high_val and current_candle['close'] > last_sw_high_val else 
-                                 (('Bearish', 'BOS') if last_sw_low_val and current_candle['close'] < last_sw_low_val else (None, None)))
-            ob_dir, ob_type = check_ob(df_htf.iloc[i-1], current_candle)
-            reasons = {sweep_type}
-            if sweep_dir == bos_dir: reasons.add(bos_type)
-            if sweep_dir == ob_dir: reasons.add(ob_type)
-            if len(reasons) > 1:
-                poi = {
-                    'type': f"POI 5m: {' + '.join(sorted(list(reasons)))}",
-                    'entry_price': current_candle['high'] if sweep_dir == 'Bullish' else current_candle['low'],
-                    'stop_loss': current_candle['low'] if sweep_dir == 'Bullish' else current_candle['high'],
-                    'discovery_time': current_candle.name, 'direction': sweep_dir
-                }
-                points_of_interest.append(poi)
-        return points_of_interest
+        # یک پیمایش برداری با حمل آخرین سوینگ سقف/کف (به جای برش iloc[:i] برای هر کندل)
+        return scan_pois(df_htf, lag=1, label='5m')
 
     def _get_dynamic_take_profit(self, df_15m, entry_time, direction):
         past_swings = df_15m[df_15m.index < entry_time]
@@ -146,6 +135,13 @@ class SmartMoneySetup(BaseSetup):
             if not swing_lows.empty: return swing_lows.iloc[-1]['low']
         return None
 
+    def find_fvg(self, df, direction):
+        """
+        FVG های پر نشده هم‌جهت با direction ('Buy'/'Sell') در یک بازه کندل (مثلا لگ حرکتی CHOCH)،
+        از قدیمی به جدید؛ هر گپ دیکشنری با کلیدهای top، bottom، time و status است.
+        """
+        return scan_fvgs(df, direction)
+
     def _get_trading_session(self, utc_hour):
         if 1 <= utc_hour < 8: return "Asian Session"
         elif 8 <= utc_hour < 16: return "London Session"
@@ -158,21 +154,18 @@ class SmartMoneySetup(BaseSetup):
         """
         منطق اصلی ستاپ CHOCH + FVG را در تایم فریم ۵ دقیقه بررسی می‌کند.
         """
-        swings = self._find_swing_points(df_5m.copy(), distance=self.config['swing_lookback_5m'])
+        swings = SwingDetector.from_frame(df_5m, self.config['swing_lookback_5m']).to_frame(3)
         if len(swings) < 3:
             return None
 
         # بررسی آخرین ساختار برای یافتن CHOCH
-        bos_choch_result = self.check_bos_choch(swings[-3:], df_5m['close'].iloc[-1])
+        bos_choch_result = self.check_bos_choch(swings, df_5m['close'].iloc[-1])
         if not bos_choch_result or bos_choch_result.get('type') != 'CHOCH':
             return None
 
         # اگر CHOCH رخ داده بود، حالا به دنبال FVG در همان لگ می‌گردیم
         direction = bos_choch_result['direction']
-        choch_leg_start_index = bos_choch_result['swing_to_break_index']
-        
-        # برای اطمینان، اندیس‌ها را در محدوده دیتافریم نگه می‌داریم
-        if choch_leg_start_index < 0: return None
+        choch_leg_start_index = df_5m.index.searchsorted(bos_choch_result['swing_to_break_index'])
         
         choch_leg_end_index = len(df_5m) - 1
         fvg_search_window = df_5m.iloc[choch_leg_start_index : choch_leg_end_index + 1]
@@ -245,46 +238,52 @@ class SmartMoneySetup(BaseSetup):
         
     # در فایل: setups/smart_money_setup.py (این تابع را به انتهای کلاس اضافه کنید)
 
-    def check_bos_choch(self, swings: pd.DataFrame, current_price: float) -> dict | None:
+    def _choch_pattern(self, swings: pd.DataFrame):
         """
-        با گرفتن ۳ سوینگ آخر، تشخیص می‌دهد که آیا یک تغییر ساختار (CHOCH) رخ داده است یا خیر.
+        الگوی ساختاری ۳ سوینگ آخر که با شکست سوینگ سوم CHOCH می‌سازد، به صورت (جهت، s2، s3) یا None.
         """
         if len(swings) < 3:
             return None
 
         s1, s2, s3 = swings.iloc[0], swings.iloc[1], swings.iloc[2] # <--- این خط اصلاح شد
 
-        # بررسی برای CHOCH صعودی (شکستن یک ساختار نزولی)
+        # CHOCH صعودی (شکستن یک ساختار نزولی)
         # الگو: سقف (High), کف (Low), سقف پایین‌تر (Lower High)
         if s1['type'] == 'high' and s2['type'] == 'low' and s3['type'] == 'high' and s3['price'] < s1['price']:
-            # اگر قیمت فعلی، آخرین سقف پایین‌تر را بشکند، یک CHOCH صعودی داریم
-            if current_price > s3['price']:
-                return {
-                    'type': 'CHOCH',
-                    'direction': 'Buy',
-                    'swing_to_break_index': s3.name, # استفاده از ایندکس واقعی برای دقت بیشتر
-                    'last_swing': s2 # آخرین سوینگ کف
-                }
-
-        # بررسی برای CHOCH نزولی (شکستن یک ساختار صعودی)
+            return 'Buy', s2, s3
+
+        # CHOCH نزولی (شکستن یک ساختار صعودی)
         # الگو: کف (Low), سقف (High), کف بالاتر (Higher Low)
         if s1['type'] == 'low' and s2['type'] == 'high' and s3['type'] == 'low' and s3['price'] > s1['price']:
-            # اگر قیمت فعلی، آخرین کف بالاتر را بشکند، یک CHOCH نزولی داریم
-            if current_price < s3['price']:
-                return {
-                    'type': 'CHOCH',
-                    'direction': 'Sell',
-                    'swing_to_break_index': s3.name, # استفاده از ایندکس واقعی برای دقت بیشتر
-                    'last_swing': s2 # آخرین سوینگ سقف
-                }
-        
+            return 'Sell', s2, s3
+
+        return None
+
+    def check_bos_choch(self, swings: pd.DataFrame, current_price: float) -> dict | None:
+        """
+        با گرفتن ۳ سوینگ آخر، تشخیص می‌دهد که آیا یک تغییر ساختار (CHOCH) رخ داده است یا خیر.
+        """
+        pattern = self._choch_pattern(swings)
+        if pattern is None:
+            return None
+        direction, s2, s3 = pattern
+
+        # اگر قیمت فعلی، آخرین سقف پایین‌تر (یا کف بالاتر) را بشکند، یک CHOCH داریم
+        if (direction == 'Buy' and current_price > s3['price']) or \
+        (direction == 'Sell' and current_price < s3['price']):
+            return {
+                'type': 'CHOCH',
+                'direction': direction,
+                'swing_to_break_index': s3.name, # زمان شروع کندل سوینگ (ایندکس DataFrame سوینگ‌ها)
+                'last_swing': s2 # آخرین سوینگ مخالف (کف برای خرید، سقف برای فروش)
+            }
         return None
     # ==========================================================================
     # بخش دوم: متد اصلی برای اجرا در ربات زنده
     # ==========================================================================
     # در فایل: setups/smart_money_setup.py
 
-    def check(self, symbol: str, kline_history: deque, kline_1m: dict, **kwargs):
+    def check(self, symbol: str, kline_history: CandleRingBuffer, kline_1m: dict, context: MarketContext, **kwargs):
         """
         متد اصلی برای بررسی ستاپ CHOCH + FVG در تایم فریم ۵ دقیقه.
         """
@@ -292,39 +291,28 @@ class SmartMoneySetup(BaseSetup):
             return None
 
         # --- ۱. آماده‌سازی داده‌ها ---
-        df_1m_full = pd.DataFrame(list(kline_history))
-        df_1m_full['timestamp'] = pd.to_datetime(df_1m_full['open_time'])
-        df_1m_full.set_index('timestamp', inplace=True)
-        
-        # بازنمونه‌گیری داده به تایم‌فریم ۵ دقیقه
-        # با استفاده از 'h' کوچک برای جلوگیری از هشدار
-        df_5m = df_1m_full.resample('5min').agg({
-            'open': 'first', 'high': 'max', 'low': 'min', 'close': 'last', 'volume': 'sum'
-        }).dropna()
+        # کندل‌های ۵ دقیقه (شامل کندل در حال تشکیل) از context مشترک؛ نباید تغییر داده شوند
+        df_5m = context.bars('5m')
 
         if len(df_5m) < self.config['swing_lookback_5m'] + 5: # حداقل کندل برای تحلیل
             return None
 
         # --- ۲. شناسایی ساختار و CHOCH ---
-        swings_5m = self._find_swing_points(df_5m.copy(), distance=self.config['swing_lookback_5m'])
+        # سوینگ‌های تایید شده ۵ دقیقه به صورت افزایشی در aggregator مانیتور نگهداری می‌شوند
+        swings_5m = context.swings('5m', self.config['swing_lookback_5m']).to_frame(3)
+        pattern = self._choch_pattern(swings_5m)
+        self._choch_levels[symbol] = pattern and (pattern[0], pattern[2]['price'])
         if len(swings_5m) < 3:
             return None
             
-        bos_choch_result = self.check_bos_choch(swings_5m[-3:], df_5m['close'].iloc[-1])
+        bos_choch_result = self.check_bos_choch(swings_5m, df_5m['close'].iloc[-1])
         if not bos_choch_result or bos_choch_result.get('type') != 'CHOCH':
             return None # اگر آخرین حرکت یک CHOCH معتبر نبود، خارج شو
 
         # --- ۳. جستجو برای FVG در لگ حرکتی CHOCH ---
         direction = bos_choch_result['direction']
-        choch_leg_start_index = bos_choch_result['swing_to_break_index']
-        choch_leg_end_index = len(df_5m) - 1
-
-        # برای اطمینان، اندیس‌ها را در محدوده دیتافریم نگه می‌داریم
-        if choch_leg_start_index < 0: return None
-        
-        fvg_search_window = df_5m.iloc[choch_leg_start_index : choch_leg_end_index + 1]
-        
-        fvgs = self.find_fvg(fvg_search_window, direction)
+        # گپ‌های پر نشده هم‌جهت که بعد از سوینگ شکسته شده ایجاد شده‌اند، از لیست زنده FVG های ۵ دقیقه
+        fvgs = context.fvgs('5m').open_gaps(direction, since=bos_choch_result['swing_to_break_index'])
         if not fvgs:
             return None # اگر FVG پیدا نشد، خارج شو
 
@@ -345,9 +333,13 @@ class SmartMoneySetup(BaseSetup):
         take_profit = entry_price - (risk_points * 2) if direction == 'Sell' else entry_price + (risk_points * 2)
 
         # --- ۵. بررسی همسویی با روند اصلی (فیلتر نهایی) ---
-        master_trend = self._analyze_master_trend(df_1m_full, kline_1m['close'])
-        if (direction == 'Bullish' and master_trend == 'Bearish') or \
-        (direction == 'Bearish' and master_trend == 'Bullish'):
+        # امتیاز روند از فیلتر مانیتور (سری‌های بلندمدت 4H/1D با اجزای کش شده)؛ در نبود آن محاسبه مستقیم
+        if context.trend_filter is not None:
+            master_trend = context.trend_filter.trend(kline_1m['close'])
+        else:
+            master_trend = self._analyze_master_trend(context, kline_1m['close'])
+        if (direction == 'Buy' and master_trend == 'Bearish') or \
+        (direction == 'Sell' and master_trend == 'Bullish'):
             print(f"❌ [{self.name}][{symbol}] CHOCH+FVG Signal ignored. Direction ({direction}) misaligned with Master Trend ({master_trend}).")
             return None
             
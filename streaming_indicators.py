@@ -0,0 +1,392 @@
+# streaming_indicators.py
+
+from collections import deque
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+class StreamingATR:
+    """
+    نسخه افزایشی calculate_atr در indicators.py: با هر کندل جدید در O(1) به‌روزرسانی می‌شود.
+    فرمول دقیقا همان نسخه دسته‌ای است (True Range و EWM با alpha=1/period و adjust=False)،
+    بنابراین پس از دیدن همان کندل‌ها مقدار یکسانی برمی‌گرداند.
+    """
+    def __init__(self, period=14):
+        self.period = period
+        self.alpha = 1 / period
+        self.count = 0
+        self.prev_close = None
+        self._atr = 0.0
+
+    @property
+    def value(self):
+        """مقدار فعلی ATR؛ مانند نسخه دسته‌ای تا قبل از دیدن period کندل صفر است."""
+        return self._atr if self.count >= self.period else 0
+
+    def update(self, high, low, close):
+        """یک کندل بسته شده را اعمال کرده و مقدار جدید ATR را برمی‌گرداند."""
+        tr = high - low
+        if self.prev_close is not None:
+            tr = max(tr, abs(high - self.prev_close), abs(low - self.prev_close))
+        self._atr = tr if self.count == 0 else (1 - self.alpha) * self._atr + self.alpha * tr
+        self.prev_close = close
+        self.count += 1
+        return self.value
+
+    def seed(self, highs, lows, closes):
+        """مقداردهی اولیه از آرایه‌های تاریخچه (مثلا view های CandleRingBuffer)."""
+        for high, low, close in zip(np.asarray(highs, dtype=float), np.asarray(lows, dtype=float),
+                                    np.asarray(closes, dtype=float)):
+            self.update(high, low, close)
+        return self.value
+
+    def seed_from_frame(self, df):
+        """مقداردهی اولیه از یک DataFrame کندل با ستون‌های high/low/close."""
+        if df is None or df.empty:
+            return self.value
+        return self.seed(df['high'].to_numpy(), df['low'].to_numpy(), df['close'].to_numpy())
+
+
+class RollingSum:
+    """
+    مجموع لغزان آخرین window مقدار (مثلا CVD ۲۴ ساعته روی کندل‌های ۱ دقیقه‌ای) با به‌روزرسانی O(1).
+    مقادیر در یک بافر حلقوی NumPy نگهداری می‌شوند و مجموع پس از هر دور کامل بافر از نو
+    محاسبه می‌شود تا خطای ممیز شناور انباشته نشود.
+    """
+    def __init__(self, window):
+        self.window = window
+        self._values = np.zeros(window)
+        self.count = 0
+        self.value = 0.0
+
+    def update(self, x):
+        pos = self.count % self.window
+        self.value += x - self._values[pos]
+        self._values[pos] = x
+        self.count += 1
+        if pos == self.window - 1:
+            self.value = float(self._values.sum())
+        return self.value
+
+    def seed(self, values):
+        for x in np.asarray(values, dtype=float)[-self.window:]:
+            self.update(x)
+        return self.value
+
+
+
+
+class RollingOLS:
+    """
+    رگرسیون خطی و همبستگی لغزان یک جفت سری (x, y) روی آخرین window نقطه.
+    مجموع‌های Σx، Σy، Σxy، Σx² و Σy² با هر نقطه در O(1) به‌روز می‌شوند و مانند RollingSum
+    پس از هر دور کامل بافر از نو محاسبه می‌شوند تا خطای ممیز شناور انباشته نشود.
+    """
+    def __init__(self, window):
+        self.window = window
+        self._x = np.zeros(window)
+        self._y = np.zeros(window)
+        self.count = 0
+        self._recompute()
+
+    def __len__(self):
+        return min(self.count, self.window)
+
+    def _recompute(self):
+        x, y = self._x[:len(self)], self._y[:len(self)]
+        self.sx, self.sy = float(x.sum()), float(y.sum())
+        self.sxy, self.sxx, self.syy = float(x @ y), float(x @ x), float(y @ y)
+
+    def update(self, x, y):
+        pos = self.count % self.window
+        if self.count >= self.window:
+            ox, oy = self._x[pos], self._y[pos]
+            self.sx -= ox; self.sy -= oy
+            self.sxy -= ox * oy; self.sxx -= ox * ox; self.syy -= oy * oy
+        self._x[pos], self._y[pos] = x, y
+        self.sx += x; self.sy += y
+        self.sxy += x * y; self.sxx += x * x; self.syy += y * y
+        self.count += 1
+        if pos == self.window - 1:
+            self._recompute()
+
+    @classmethod
+    def from_arrays(cls, x, y):
+        """یک accumulator پر شده با کل دو آرایه (مثلا پنجره‌های snapshot سشن)."""
+        ols = cls(max(len(x), 1))
+        for xi, yi in zip(np.asarray(x, dtype=float), np.asarray(y, dtype=float)):
+            ols.update(xi, yi)
+        return ols
+
+    def _moments(self):
+        n = len(self)
+        return n, self.sxx - self.sx * self.sx / n, self.syy - self.sy * self.sy / n, self.sxy - self.sx * self.sy / n
+
+    @property
+    def slope(self):
+        n, var_x, _, cov = self._moments() if len(self) else (0, 0, 0, 0)
+        return cov / var_x if n > 1 and var_x > 0 else np.nan
+
+    @property
+    def intercept(self):
+        slope = self.slope
+        return (self.sy - slope * self.sx) / len(self) if not np.isnan(slope) else np.nan
+
+    @property
+    def r(self):
+        """ضریب همبستگی پیرسون (مانند np.corrcoef)؛ برای سری ثابت NaN."""
+        n, var_x, var_y, cov = self._moments() if len(self) else (0, 0, 0, 0)
+        return cov / np.sqrt(var_x * var_y) if n > 1 and var_x > 0 and var_y > 0 else np.nan
+
+    def zscore(self, y=None):
+        """Z-score مقدار y (پیش‌فرض آخرین y) نسبت به میانگین و انحراف معیار نمونه‌ای y های پنجره."""
+        n, _, var_y, _ = self._moments() if len(self) else (0, 0, 0, 0)
+        if n < 2 or var_y <= 0:
+            return 0
+        y = self._y[(self.count - 1) % self.window] if y is None else y
+        return (y - self.sy / n) / np.sqrt(var_y / (n - 1))
+
+
+class RollingStats:
+    """
+    میانگین و انحراف معیار نمونه‌ای (ddof=1، مانند پانداس) آخرین window مقدار به روش Welford لغزان.
+    هر مقدار جدید در O(1) جایگزین قدیمی‌ترین مقدار می‌شود و آمار پس از هر دور کامل از نو محاسبه می‌شود.
+    """
+    def __init__(self, window):
+        self.window = window
+        self._values = np.zeros(window)
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+
+    def __len__(self):
+        return min(self.count, self.window)
+
+    def update(self, x):
+        pos = self.count % self.window
+        if self.count < self.window:
+            n = self.count + 1
+            d = x - self.mean
+            self.mean += d / n
+            self._m2 += d * (x - self.mean)
+        else:
+            old = self._values[pos]
+            new_mean = self.mean + (x - old) / self.window
+            self._m2 += (x - old) * (x - new_mean + old - self.mean)
+            self.mean = new_mean
+        self._values[pos] = x
+        self.count += 1
+        if pos == self.window - 1:
+            self.mean = float(self._values.mean())
+            self._m2 = float(((self._values - self.mean) ** 2).sum())
+        return self.mean
+
+    def seed(self, values):
+        for x in np.asarray(values, dtype=float)[-self.window:]:
+            self.update(x)
+        return self.mean
+
+    @property
+    def std(self):
+        n = len(self)
+        return float(np.sqrt(max(self._m2, 0.0) / (n - 1))) if n > 1 else np.nan
+
+    def zscore(self, x):
+        std = self.std
+        return (x - self.mean) / std if std > 0 else 0
+
+
+class RollingMax:
+    """
+    بیشینه لغزان آخرین window مقدار با صف یکنوا (monotonic deque)، با هزینه سرشکن O(1) برای هر مقدار.
+    صف فقط مقادیری را نگه می‌دارد که هنوز می‌توانند بیشینه پنجره شوند؛ مانند rolling().max() پانداس
+    تا قبل از پر شدن پنجره NaN برمی‌گرداند.
+    """
+    def __init__(self, window):
+        self.window = window
+        self.count = 0
+        self._queue = deque()   # (شماره مقدار، مقدار) با مقادیر نزولی
+
+    def _dominates(self, new, old):
+        return new >= old
+
+    @property
+    def value(self):
+        return self._queue[0][1] if self.count >= self.window else np.nan
+
+    def update(self, x):
+        queue = self._queue
+        while queue and self._dominates(x, queue[-1][1]):
+            queue.pop()
+        queue.append((self.count, x))
+        self.count += 1
+        if queue[0][0] <= self.count - 1 - self.window:
+            queue.popleft()
+        return self.value
+
+    def seed(self, values):
+        for x in np.asarray(values, dtype=float)[-self.window:]:
+            self.update(x)
+        return self.value
+
+
+class RollingMin(RollingMax):
+    """کمینه لغزان آخرین window مقدار (قرینه RollingMax)."""
+    def _dominates(self, new, old):
+        return new <= old
+
+
+def rolling_max(values, window):
+    """نسخه دسته‌ای روی آرایه NumPy (برای بک‌تست)؛ خروجی هم‌اندازه ورودی و مانند پانداس با NaN در ابتدا."""
+    values = np.asarray(values, dtype=float)
+    out = np.full(len(values), np.nan)
+    if len(values) >= window:
+        out[window - 1:] = sliding_window_view(values, window).max(axis=1)
+    return out
+
+
+def rolling_min(values, window):
+    values = np.asarray(values, dtype=float)
+    out = np.full(len(values), np.nan)
+    if len(values) >= window:
+        out[window - 1:] = sliding_window_view(values, window).min(axis=1)
+    return out
+
+
+def ichimoku(highs, lows, tenkan=9, kijun=26, senkou=52, displacement=26):
+    """
+    خطوط ایچیموکو به صورت دسته‌ای روی آرایه‌های NumPy؛ همان مقادیر rolling پانداس در _calculate_ichimoku.
+    senkou_a/senkou_b مانند نمودار displacement کندل به جلو منتقل شده‌اند (مقدار هر ردیف، ابر همان کندل است).
+    """
+    def mid(window):
+        return (rolling_max(highs, window) + rolling_min(lows, window)) / 2
+
+    def shift(values):
+        out = np.full(len(values), np.nan)
+        out[displacement:] = values[:len(values) - displacement]
+        return out
+
+    tenkan_sen, kijun_sen = mid(tenkan), mid(kijun)
+    return {
+        'tenkan_sen': tenkan_sen,
+        'kijun_sen': kijun_sen,
+        'senkou_a': shift((tenkan_sen + kijun_sen) / 2),
+        'senkou_b': shift(mid(senkou)),
+    }
+
+
+class StreamingIchimoku:
+    """
+    ایچیموکو افزایشی: هر خط از یک جفت RollingMax/RollingMin ساخته می‌شود و با هر کندل بسته شده در O(1)
+    به‌روز می‌شود. مقادیر Senkou (پیش از انتقال) برای displacement + 1 کندل اخیر نگهداری می‌شوند تا ابر
+    کندل جاری یا کندل بعدی بدون محاسبه مجدد در دسترس باشد. چند مقدار آخر Tenkan/Kijun هم نگهداری می‌شوند.
+    """
+    def __init__(self, tenkan=9, kijun=26, senkou=52, displacement=26, history=4):
+        self.displacement = displacement
+        self.periods = {'tenkan': tenkan, 'kijun': kijun, 'senkou': senkou}
+        self._highs = {name: RollingMax(period) for name, period in self.periods.items()}
+        self._lows = {name: RollingMin(period) for name, period in self.periods.items()}
+        self._leading = deque(maxlen=displacement + 1)   # (senkou_a, senkou_b) پیش از انتقال
+        self._recent = {'tenkan': deque(maxlen=history), 'kijun': deque(maxlen=history)}
+        self.tenkan = np.nan
+        self.kijun = np.nan
+
+    def update(self, high, low):
+        """یک کندل بسته شده را اعمال می‌کند."""
+        mids = {name: (self._highs[name].update(high) + self._lows[name].update(low)) / 2 for name in self.periods}
+        self.tenkan, self.kijun = mids['tenkan'], mids['kijun']
+        self._leading.append(((self.tenkan + self.kijun) / 2, mids['senkou']))
+        self._recent['tenkan'].append(self.tenkan)
+        self._recent['kijun'].append(self.kijun)
+
+    def seed(self, highs, lows):
+        highs, lows = np.asarray(highs, dtype=float), np.asarray(lows, dtype=float)
+        keep = max(self.periods.values()) + self.displacement
+        for high, low in zip(highs[-keep:], lows[-keep:]):
+            self.update(high, low)
+
+    def kumo(self, ahead=0):
+        """
+        (senkou_a, senkou_b) ابر آخرین کندل بسته شده؛ ahead=1 ابر کندل بعدی (در حال تشکیل) است.
+        تا قبل از کافی بودن داده (nan, nan).
+        """
+        i = len(self._leading) - 1 - (self.displacement - ahead)
+        return self._leading[i] if 0 <= i < len(self._leading) else (np.nan, np.nan)
+
+    @property
+    def senkou_a(self):
+        return self.kumo()[0]
+
+    @property
+    def senkou_b(self):
+        return self.kumo()[1]
+
+    def recent(self, name, n):
+        """آخرین n مقدار 'tenkan' یا 'kijun' (از قدیمی به جدید) به صورت آرایه."""
+        return np.array(list(self._recent[name])[-n:])
+
+
+class SessionIndicatorEngine:
+    """
+    نسخه افزایشی calculate_session_indicators در indicators.py برای یک سشن (روز معاملاتی نیویورک).
+    مجموع‌های تجمعی VWAP، واریانس وزنی و دلتای تجمعی نگهداری می‌شوند تا هر کندل در O(1) اعمال شود؛
+    پنجره‌های قیمت و دلتا (برای ستاپ رگرسیون) در بافرهای حلقوی با طول ثابت نگهداری می‌شوند.
+    خروجی snapshot دقیقا همان کلیدها و مقادیر نسخه دسته‌ای روی کندل‌های همان سشن است،
+    به همراه شیب قیمت/دلتا و همبستگی آن‌ها روی پنجره (از RollingOLS).
+    """
+    def __init__(self, window=14):
+        self.window = window
+        self.reset()
+
+    def reset(self, session_key=None):
+        self.session_key = session_key
+        self.count = 0
+        self.cum_volume = 0.0
+        self.cum_tp_volume = 0.0
+        self.cum_sq_dev = 0.0
+        self.cumulative_delta = 0.0
+        self.vwap = np.nan
+        self.std_dev = np.nan
+        self.delta = 0.0
+        self.price_window = deque(maxlen=self.window)
+        self.delta_window = deque(maxlen=self.window)
+        # شیب قیمت و دلتا نسبت به زمان و همبستگی آن‌ها روی همان پنجره (برای ستاپ واگرایی دلتا)
+        self.price_trend = RollingOLS(self.window)
+        self.delta_trend = RollingOLS(self.window)
+        self.price_delta = RollingOLS(self.window)
+
+    def update(self, high, low, close, volume, taker_buy_volume):
+        """یک کندل بسته شده از سشن جاری را اعمال می‌کند."""
+        tp = (high + low + close) / 3
+        self.cum_volume += volume
+        self.cum_tp_volume += tp * volume
+        self.vwap = self.cum_tp_volume / self.cum_volume if self.cum_volume != 0 else np.nan
+        # مانند نسخه دسته‌ای، انحراف هر کندل نسبت به VWAP همان لحظه محاسبه می‌شود
+        self.cum_sq_dev += (tp - self.vwap) ** 2 * volume
+        self.std_dev = np.sqrt(self.cum_sq_dev / self.cum_volume) if self.cum_volume != 0 else np.nan
+
+        self.delta = taker_buy_volume - (volume - taker_buy_volume)
+        self.cumulative_delta += self.delta
+        self.price_window.append(close)
+        self.delta_window.append(self.delta)
+        self.price_trend.update(self.count, close)
+        self.delta_trend.update(self.count, self.delta)
+        self.price_delta.update(close, self.delta)
+        self.count += 1
+
+    def snapshot(self):
+        """مقادیر فعلی با همان ساختار خروجی calculate_session_indicators."""
+        if self.count == 0:
+            return {'vwap': 0, 'vwap_upper': 0, 'vwap_lower': 0, 'delta': 0, 'cumulative_delta': 0}
+        return {
+            'vwap': self.vwap,
+            'vwap_upper': self.vwap + self.std_dev * 2,
+            'vwap_lower': self.vwap - self.std_dev * 2,
+            'delta': self.delta,
+            'cumulative_delta': self.cumulative_delta,
+            'price_window': list(self.price_window),
+            'delta_window': list(self.delta_window),
+            'price_slope': self.price_trend.slope,
+            'delta_slope': self.delta_trend.slope,
+            'price_delta_corr': self.price_delta.r,
+        }
@@ -0,0 +1,141 @@
+# swing_detector.py
+
+from collections import deque
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+from candle_buffer import to_epoch_ms
+
+SWING_HIGH = 1
+SWING_LOW = -1
+
+SWING_TYPES = {SWING_HIGH: 'high', SWING_LOW: 'low'}
+
+
+class SwingDetector:
+    """
+    تشخیص افزایشی سوینگ‌ها (پیوت‌های فرکتالی) روی کندل‌های بسته شده یک تایم‌فریم.
+    کندل c سوینگ سقف است اگر high آن از left کندل قبلی بیشتر و از right کندل بعدی کمتر نباشد
+    (در سقف‌های برابر، اولی انتخاب می‌شود)؛ سوینگ کف به صورت قرینه روی low تعریف می‌شود.
+    هر پیوت با بسته شدن right امین کندل بعد از آن تایید می‌شود و سوینگ‌ها به ترتیب زمان در یک بافر
+    حلقوی (مانند CandleRingBuffer با نوشتن دوگانه) نگهداری می‌شوند تا «آخرین n سوینگ» یک برش بدون کپی باشد.
+    """
+    def __init__(self, left, right=None, capacity=256):
+        self.left = left
+        self.right = left if right is None else right
+        self.capacity = capacity
+        self._times = np.zeros(2 * capacity, dtype=np.int64)
+        self._prices = np.zeros(2 * capacity, dtype=np.float64)
+        self._kinds = np.zeros(2 * capacity, dtype=np.int8)
+        self.total = 0
+        self.last_high = None     # آخرین سوینگ سقف تایید شده به صورت (open_time, price)
+        self.last_low = None
+        self._window = deque(maxlen=self.left + self.right + 1)
+        self._frame = None
+        self._frame_version = -1
+
+    def __len__(self):
+        return min(self.total, self.capacity)
+
+    def _push(self, open_time, price, kind):
+        pos = self.total % self.capacity
+        for arr, value in ((self._times, open_time), (self._prices, price), (self._kinds, kind)):
+            arr[pos] = value
+            arr[pos + self.capacity] = value
+        self.total += 1
+        if kind == SWING_HIGH:
+            self.last_high = (open_time, price)
+        else:
+            self.last_low = (open_time, price)
+
+    def update(self, bar):
+        """
+        یک کندل بسته شده (دیکشنری با open_time، high و low) را اضافه می‌کند و
+        سوینگ‌های تایید شده در این مرحله را به صورت لیست (open_time, price, kind) برمی‌گرداند.
+        """
+        window = self._window
+        window.append((to_epoch_ms(bar['open_time']), float(bar['high']), float(bar['low'])))
+        if len(window) < window.maxlen:
+            return []
+        open_time, high, low = window[self.left]
+        confirmed = []
+        before, after = list(window)[:self.left], list(window)[self.left + 1:]
+        if all(high > b[1] for b in before) and all(high >= a[1] for a in after):
+            confirmed.append((open_time, high, SWING_HIGH))
+        if all(low < b[2] for b in before) and all(low <= a[2] for a in after):
+            confirmed.append((open_time, low, SWING_LOW))
+        for swing in confirmed:
+            self._push(*swing)
+        return confirmed
+
+    def seed_from_frame(self, df):
+        """
+        سوینگ‌های کندل‌های بسته شده یک DataFrame را به صورت برداری پیدا می‌کند (برای مقداردهی اولیه
+        یک detector خالی) و آخرین کندل‌ها را برای تایید پیوت‌های بعدی نگه می‌دارد.
+        """
+        if df is None or df.empty:
+            return self
+        open_times = df['open_time'] if 'open_time' in df.columns else df.index
+        times = np.array([to_epoch_ms(t) for t in open_times], dtype=np.int64)
+        highs = df['high'].to_numpy(dtype=float)
+        lows = df['low'].to_numpy(dtype=float)
+        size = self.left + self.right + 1
+        if len(df) >= size:
+            hw, lw = sliding_window_view(highs, size), sliding_window_view(lows, size)
+            centre_h, centre_l = hw[:, self.left], lw[:, self.left]
+            is_high = np.ones(len(hw), dtype=bool)
+            is_low = np.ones(len(lw), dtype=bool)
+            if self.left:
+                is_high &= centre_h > hw[:, :self.left].max(axis=1)
+                is_low &= centre_l < lw[:, :self.left].min(axis=1)
+            if self.right:
+                is_high &= centre_h >= hw[:, self.left + 1:].max(axis=1)
+                is_low &= centre_l <= lw[:, self.left + 1:].min(axis=1)
+            centres = np.arange(len(hw)) + self.left
+            for i in np.flatnonzero(is_high | is_low)[-self.capacity:]:
+                if is_high[i]:
+                    self._push(int(times[centres[i]]), float(highs[centres[i]]), SWING_HIGH)
+                if is_low[i]:
+                    self._push(int(times[centres[i]]), float(lows[centres[i]]), SWING_LOW)
+        self._window.clear()
+        keep = min(size - 1, len(times))
+        for i in range(len(times) - keep, len(times)):
+            self._window.append((int(times[i]), float(highs[i]), float(lows[i])))
+        return self
+
+    @classmethod
+    def from_frame(cls, df, left, right=None, capacity=256):
+        return cls(left, right, capacity).seed_from_frame(df)
+
+    def view(self, name, n=None):
+        """آخرین n مقدار یکی از ستون‌های 'open_time'، 'price' یا 'kind' (برش فقط‌خواندنی، بدون کپی)."""
+        arr = {'open_time': self._times, 'price': self._prices, 'kind': self._kinds}[name]
+        size = len(self) if n is None else min(n, len(self))
+        end = self.total % self.capacity + self.capacity
+        view = arr[end - size:end]
+        view.flags.writeable = False
+        return view
+
+    def last_before(self, kind, open_time):
+        """قیمت آخرین سوینگ از نوع kind با زمان کمتر از open_time (یا None)."""
+        open_time = to_epoch_ms(open_time)
+        times, prices, kinds = self.view('open_time'), self.view('price'), self.view('kind')
+        for i in range(len(times) - 1, -1, -1):
+            if kinds[i] == kind and times[i] < open_time:
+                return float(prices[i])
+        return None
+
+    def to_frame(self, n=None):
+        """
+        آخرین n سوینگ به صورت DataFrame با ایندکس زمانی و ستون‌های type ('high'/'low') و price
+        (همان ساختاری که check_bos_choch انتظار دارد). نسخه کامل تا سوینگ بعدی کش می‌شود.
+        """
+        if self._frame_version != self.total:
+            index = pd.DatetimeIndex(pd.to_datetime(self.view('open_time'), unit='ms', utc=True), name='timestamp')
+            self._frame = pd.DataFrame({
+                'type': [SWING_TYPES[k] for k in self.view('kind')],
+                'price': self.view('price').copy(),
+            }, index=index)
+            self._frame_version = self.total
+        return self._frame if n is None else self._frame.tail(n)
@@ -5,16 +5,21 @@ import numpy as np
 from datetime import datetime, timedelta, timezone
 # ایمپورت توابع از فایل‌های دیگر پروژه
 from fetch_futures_binance import fetch_futures_klines
-from volume_profile import calc_daily_volume_profile
+from volume_profile import VolumeHistogram, default_profile_engine
+from mtf_bars import MultiTimeframeBars
 
-def get_price_action_score(symbol):
+def get_price_action_score(symbol, bars=None):
     """
     تحلیل روند بر اساس ساختار پرایس اکشن روزانه (Higher-Highs, Lower-Lows).
     این تابع به ساختار بازار در تایم‌فریم بالا نگاه می‌کند.
     """
     # دریافت داده‌های ۳ روز اخیر برای مقایسه روز گذشته با روز قبل از آن
-    df_daily = fetch_futures_klines(symbol, '1d', datetime.now(timezone.utc) - timedelta(days=3), datetime.now(timezone.utc))
-    if df_daily.empty or len(df_daily) < 2:
+    start = datetime.now(timezone.utc) - timedelta(days=3)
+    if bars is not None and bars.covers(start):
+        df_daily = bars.get('1d').tail(3)
+    else:
+        df_daily = fetch_futures_klines(symbol, '1d', start, datetime.now(timezone.utc))
+    if df_daily.empty or len(df_daily) < 3:
         return 0, "داده کافی برای تحلیل پرایس اکشن روزانه نیست."
     
     # آخرین کندل روزانه ممکن است کامل نشده باشد، پس ما از دو کندل قبلی استفاده می‌کنیم.
@@ -37,13 +42,17 @@ def get_price_action_score(symbol):
     
     return 0, "ساختار روزانه نامشخص"
 
-def get_cvd_score(symbol):
+def get_cvd_score(symbol, bars=None):
     """
     تحلیل روند کوتاه‌مدت بر اساس جریان سفارشات تجمعی (Cumulative Volume Delta)
     در ۲۴ ساعت گذشته.
     """
     # دریافت داده‌های ۴۸ ساعته با کندل‌های ۱۵ دقیقه‌ای برای تحلیل CVD
-    df = fetch_futures_klines(symbol, '15m', datetime.now(timezone.utc) - timedelta(hours=48), datetime.now(timezone.utc))
+    start = datetime.now(timezone.utc) - timedelta(hours=48)
+    if bars is not None and bars.covers(start):
+        df = bars.get_range('15m', start - timedelta(minutes=15), datetime.now(timezone.utc)).copy()
+    else:
+        df = fetch_futures_klines(symbol, '15m', start, datetime.now(timezone.utc))
     if df.empty:
         return 0, "داده کافی برای تحلیل CVD نیست."
 
@@ -62,30 +71,46 @@ def get_cvd_score(symbol):
     return 0, "جریان سفارشات در ۲۴ ساعت گذشته خنثی بوده است."
 
 
-def get_weekly_vp_score(symbol):
+def get_weekly_vp_score(symbol, bars=None):
     """تحلیل روند بر اساس پروفایل حجمی هفته گذشته"""
     today = datetime.now(timezone.utc)
-    start_of_this_week = today - timedelta(days=today.weekday())
+    # هفته از ابتدای روز دوشنبه (UTC) شروع می‌شود تا از هیستوگرام‌های روزانه کش شده قابل ساخت باشد
+    start_of_this_week = today.replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=today.weekday())
     start_of_last_week = start_of_this_week - timedelta(weeks=1)
     
-    df_last_week = fetch_futures_klines(symbol, '1h', start_of_last_week, start_of_this_week)
-    if df_last_week.empty: return 0, "داده کافی برای پروفایل حجمی هفتگی نیست."
-    
-    vp = calc_daily_volume_profile(df_last_week)
+    if bars is not None and bars.covers(start_of_last_week):
+        # پروفایل هفتگی = جمع هیستوگرام‌های روزانه (از کندل‌های ۱ دقیقه‌ای و کش شده در موتور پروفایل)
+        df_last_week = bars.get_range('1m', start_of_last_week, start_of_this_week)
+        if df_last_week.empty: return 0, "داده کافی برای پروفایل حجمی هفتگی نیست."
+        df_last_week = df_last_week.assign(utc_date=df_last_week['open_time'].dt.date)
+        vp = default_profile_engine.composite_profile(symbol, df_last_week, 'utc_date',
+                                                      final_dates=set(df_last_week['utc_date']))
+    else:
+        df_last_week = fetch_futures_klines(symbol, '1h', start_of_last_week, start_of_this_week)
+        if df_last_week.empty: return 0, "داده کافی برای پروفایل حجمی هفتگی نیست."
+        tick_size = default_profile_engine.tick_size_for(symbol, float(df_last_week['close'].iloc[-1]))
+        vp = VolumeHistogram.from_candles(df_last_week, tick_size).profile()
     vah, val = vp.get('vah'), vp.get('val')
     if not vah or not val or vah == 0 or val == 0: return 0, "محاسبه محدوده ارزش هفتگی ممکن نبود."
     
-    current_price_df = fetch_futures_klines(symbol, '1m', today - timedelta(minutes=5), today)
-    if current_price_df.empty: return 0, "قیمت لحظه‌ای دریافت نشد."
-    current_price = current_price_df.iloc[-1]['close']
+    if bars is not None and bars.last_price:
+        current_price = bars.last_price
+    else:
+        current_price_df = fetch_futures_klines(symbol, '1m', today - timedelta(minutes=5), today)
+        if current_price_df.empty: return 0, "قیمت لحظه‌ای دریافت نشد."
+        current_price = current_price_df.iloc[-1]['close']
     
     if current_price > vah: return 1, f"قیمت بالای محدوده ارزش هفته قبل ({vah:,.2f}) است."
     if current_price < val: return -1, f"قیمت پایین محدوده ارزش هفته قبل ({val:,.2f}) است."
     return 0, "قیمت داخل محدوده ارزش هفته قبل است."
 
-def get_linreg_score(symbol, period=100):
+def get_linreg_score(symbol, period=100, bars=None):
     """تحلیل روند با رگرسیون خطی ۴ ساعته به صورت دستی"""
-    df_4h = fetch_futures_klines(symbol, '4h', datetime.now(timezone.utc) - timedelta(days=int(period*4/6)), datetime.now(timezone.utc))
+    days = int(period*4/6)
+    if bars is not None:
+        df_4h = bars.long_range('4h', days)
+    else:
+        df_4h = fetch_futures_klines(symbol, '4h', datetime.now(timezone.utc) - timedelta(days=days), datetime.now(timezone.utc))
     if df_4h.empty or len(df_4h) < period: return 0, "داده کافی برای رگرسیون خطی نیست."
     
     points = df_4h['close'].tail(period)
@@ -113,30 +138,33 @@ def generate_master_trend_report(symbol, state_manager, df_historical, df_intrad
     
     weights = {"price_action": 1.5, "volume_profile": 1.5, "linear_regression": 1.0, "cvd": 0.5}
 
+    # کندل‌های تایم‌فریم بالاتر به جای دانلود جداگانه، از همان داده ۱ دقیقه‌ای موجود ساخته می‌شوند
+    bars = MultiTimeframeBars(symbol, pd.concat([df_historical, df_intraday], ignore_index=True))
+
     # --- تحلیل هر بخش با ثبت امتیاز دقیق ---
     try:
-        pa_score, pa_narrative = get_price_action_score(symbol)
+        pa_score, pa_narrative = get_price_action_score(symbol, bars=bars)
         weighted_pa = pa_score * weights["price_action"]
         total_score += weighted_pa
         report_lines.append(f"- **پرایس اکشن (D):** {pa_narrative} `({weighted_pa:+.1f})`")
     except Exception as e: report_lines.append(f"- **پرایس اکشن (D):** خطا - {e}")
     
     try:
-        vp_score, vp_narrative = get_weekly_vp_score(symbol)
+        vp_score, vp_narrative = get_weekly_vp_score(symbol, bars=bars)
         weighted_vp = vp_score * weights["volume_profile"]
         total_score += weighted_vp
         report_lines.append(f"- **پروفایل حجم (W):** {vp_narrative} `({weighted_vp:+.1f})`")
     except Exception as e: report_lines.append(f"- **پروفایل حجم (W):** خطا - {e}")
     
     try:
-        linreg_score, linreg_narrative = get_linreg_score(symbol)
+        linreg_score, linreg_narrative = get_linreg_score(symbol, bars=bars)
         weighted_linreg = linreg_score * weights["linear_regression"]
         total_score += weighted_linreg
         report_lines.append(f"- **رگرسیون خطی (4h):** {linreg_narrative} `({weighted_linreg:+.1f})`")
     except Exception as e: report_lines.append(f"- **رگرسیون خطی (4h):** خطا - {e}")
 
     try:
-        cvd_score, cvd_narrative = get_cvd_score(symbol)
+        cvd_score, cvd_narrative = get_cvd_score(symbol, bars=bars)
         weighted_cvd = cvd_score * weights["cvd"]
         total_score += weighted_cvd
         report_lines.append(f"- **جریان سفارشات (24h):** {cvd_narrative} `({weighted_cvd:+.1f})`")
@@ -0,0 +1,114 @@
+# trend_filter.py
+
+from datetime import datetime, timedelta, timezone
+import numpy as np
+
+from candle_buffer import CandleRingBuffer, to_epoch_ms
+from fetch_futures_binance import fetch_futures_klines
+from kline_archive import INTERVAL_MS
+from streaming_indicators import StreamingIchimoku
+
+# تاریخچه لازم: ۱۰۰ کندل 4H برای رگرسیون و ۵۲ + ۲۶ کندل برای ابر ایچیموکو (حدود ۱۷ روز)
+HISTORY_DAYS = 30
+
+
+class TrendFilter:
+    """
+    فیلتر روند اصلی یک نماد (ایچیموکو و رگرسیون خطی 4H به همراه پرایس اکشن روزانه و CVD روز جاری).
+    سری‌های بلندمدت 4H و 1D در بافرهای جداگانه نگهداری و فقط با بسته شدن کندل 4H/1D به‌روز می‌شوند؛
+    در همان لحظه اجزای امتیاز (ابر کومو، شیب رگرسیون و ساختار روزانه) محاسبه و کش می‌شوند.
+    بنابراین هزینه هر کندل ۱ دقیقه‌ای فقط جمع دلتای روز و مقایسه قیمت با ابر کش شده است.
+    """
+    def __init__(self, symbol, capacity_4h=200, capacity_1d=60, linreg_period=100):
+        self.symbol = symbol
+        self.linreg_period = linreg_period
+        self.bars = {'4h': CandleRingBuffer(capacity_4h), '1d': CandleRingBuffer(capacity_1d)}
+        self.ichimoku = StreamingIchimoku()
+        self.kumo = None            # (senkou_a, senkou_b) ابر ایچیموکو برای کندل 4H جاری
+        self.linreg_score = 0
+        self.pa_score = 0
+        self.day_delta = 0.0        # دلتای کندل‌های ۱ دقیقه‌ای روز جاری (UTC)
+        self._day = None
+
+    def seed(self, df_4h=None, df_1d=None, df_1m=None):
+        """
+        سری‌های 4H/1D را با کندل‌های بسته شده تاریخچه (مثلا از آرشیو محلی برای HISTORY_DAYS روز)
+        و دلتای روز جاری را با کندل‌های ۱ دقیقه‌ای همان روز مقداردهی می‌کند.
+        """
+        now_ms = to_epoch_ms(datetime.now(timezone.utc))
+        for tf, df in (('4h', df_4h), ('1d', df_1d)):
+            if df is None or df.empty:
+                continue
+            open_ms = df['open_time'].map(to_epoch_ms)
+            self.bars[tf].extend_from_frame(df[open_ms + INTERVAL_MS[tf] <= now_ms])
+        self.ichimoku.seed(self.bars['4h'].view('high'), self.bars['4h'].view('low'))
+        self._refresh_4h()
+        self._refresh_1d()
+        if df_1m is not None and not df_1m.empty and 'taker_buy_base_asset_volume' in df_1m.columns:
+            last_day = df_1m['open_time'].iloc[-1].date()
+            today = df_1m[df_1m['open_time'].dt.date == last_day]
+            self._day = last_day
+            self.day_delta = float((2 * today['taker_buy_base_asset_volume'] - today['volume']).sum())
+
+    def update(self, kline_1m, closed_bars=None):
+        """کندل ۱ دقیقه‌ای بسته شده و کندل‌های 4H/1D بسته شده همراه آن (از BarAggregator) را اعمال می‌کند."""
+        day = kline_1m['open_time'].date()
+        if day != self._day:
+            self._day = day
+            self.day_delta = 0.0
+        self.day_delta += 2 * kline_1m.get('taker_buy_base_asset_volume', 0) - kline_1m['volume']
+        closed_bars = closed_bars or {}
+        if '4h' in closed_bars and self.bars['4h'].append(closed_bars['4h']):
+            self.ichimoku.update(closed_bars['4h']['high'], closed_bars['4h']['low'])
+            self._refresh_4h()
+        if '1d' in closed_bars and self.bars['1d'].append(closed_bars['1d']):
+            self._refresh_1d()
+
+    def _refresh_4h(self):
+        # ابر کندل جاری 4H (هنوز بسته نشده) از ایچیموکو افزایشی کندل‌های بسته شده
+        senkou_a, senkou_b = self.ichimoku.kumo(ahead=1)
+        self.kumo = None if np.isnan(senkou_a) or np.isnan(senkou_b) else (senkou_a, senkou_b)
+
+        closes = self.bars['4h'].view('close')
+
+        self.linreg_score = 0
+        if len(closes) >= self.linreg_period:
+            points = closes[-self.linreg_period:]
+            slope = np.polyfit(np.arange(len(points)), points, 1)[0]
+            normalized_slope = slope / points.mean()
+            if normalized_slope > 0.0002: self.linreg_score = 1
+            elif normalized_slope < -0.0002: self.linreg_score = -1
+
+    def _refresh_1d(self):
+        self.pa_score = 0
+        daily = self.bars['1d']
+        if len(daily) >= 3:
+            day_2, day_3 = daily.candle_at(-2), daily.candle_at(-1)
+            if day_3['high'] > day_2['high'] and day_3['low'] > day_2['low']: self.pa_score = 2
+            elif day_3['high'] < day_2['high'] and day_3['low'] < day_2['low']: self.pa_score = -2
+
+    def ichimoku_score(self, last_price):
+        if self.kumo is None:
+            return 0
+        senkou_a, senkou_b = self.kumo
+        if last_price > senkou_a and last_price > senkou_b: return 1
+        if last_price < senkou_a and last_price < senkou_b: return -1
+        return 0
+
+    def score(self, last_price):
+        """امتیاز ترکیبی (ایچیموکو ×۱.۵، رگرسیون ×۱.۵، پرایس اکشن روزانه + CVD روز ×۱)."""
+        cvd_score = 1 if self.day_delta > 0 else (-1 if self.day_delta < 0 else 0)
+        return (self.ichimoku_score(last_price) * 1.5) + (self.linreg_score * 1.5) + (self.pa_score + cvd_score)
+
+    def trend(self, last_price):
+        total_score = self.score(last_price)
+        if total_score >= 2: return "Bullish"
+        if total_score <= -2: return "Bearish"
+        return "SIDEWAYS"
+
+
+def fetch_trend_history(symbol, days=HISTORY_DAYS):
+    """کندل‌های 4H و 1D چند هفته اخیر (از آرشیو محلی و فقط کندل‌های جدید از API) برای TrendFilter.seed."""
+    end = datetime.now(timezone.utc)
+    start = end - timedelta(days=days)
+    return fetch_futures_klines(symbol, '4h', start, end), fetch_futures_klines(symbol, '1d', start, end)
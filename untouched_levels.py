@@ -1,55 +1,83 @@
 # untouched_levels.py
+import numpy as np
 import pandas as pd
-from volume_profile import calc_daily_volume_profile
+from volume_profile import calc_daily_volume_profile, default_profile_engine
 
-def find_untouched_levels(df, date_col='ny_date', lookback_days=7):
+
+def _merge_intervals(lows, highs):
+    """بازه‌های [low, high] را مرتب و ادغام کرده و اجتماع آن‌ها را به صورت بازه‌های جدا از هم برمی‌گرداند."""
+    order = np.argsort(lows, kind='stable')
+    lows, highs = lows[order], highs[order]
+    running_high = np.maximum.accumulate(highs)
+    starts = np.flatnonzero(np.r_[True, lows[1:] > running_high[:-1]])
+    ends = np.r_[starts[1:], len(lows)] - 1
+    return lows[starts], running_high[ends]
+
+
+def _is_covered(prices, merged_lows, merged_highs):
+    """برای هر قیمت مشخص می‌کند که آیا داخل یکی از بازه‌های ادغام شده قرار دارد یا خیر."""
+    if len(merged_lows) == 0:
+        return np.zeros(len(prices), dtype=bool)
+    i = np.searchsorted(merged_lows, prices, side='right') - 1
+    return (i >= 0) & (prices <= merged_highs[np.maximum(i, 0)])
+
+
+def find_untouched_levels(df, date_col='ny_date', lookback_days=7, symbol=None):
     """
     سطوح کلیدی دست نخورده را بر اساس تاریخچه داده شده، شناسایی می‌کند.
+    یک سطح لمس شده است اگر حداقل یکی از کندل‌های روزهای بعد آن را در بازه [low, high] خود داشته باشد.
+    روزها از آخر به اول پیمایش می‌شوند و اجتماع بازه کندل‌های روزهای بعدی (نسخه دقیق min/max تجمعی
+    از انتها که gap های قیمتی را هم در نظر می‌گیرد) به صورت افزایشی نگهداری می‌شود؛ بنابراین
+    تمام سطوح کاندید با جستجوی دودویی و بدون پیمایش ردیف به ردیف بررسی می‌شوند.
+    اگر symbol داده شود، هیستوگرام حجمی روزهای کامل شده در موتور پروفایل حجمی کش می‌شود.
     """
     levels = []
-    if df.empty or len(df.groupby(date_col)) < 1:
+    if df.empty or df[date_col].nunique() < 1:
         return levels
 
-    daily_groups = df.groupby(date_col)
-    all_dates = sorted(list(daily_groups.groups.keys()))
-    
-    relevant_dates = all_dates[-lookback_days:]
+    dates = df[date_col].to_numpy()
+    order = np.argsort(dates, kind='stable')
+    sorted_dates = dates[order]
+    lows = df['low'].to_numpy(dtype=float)[order]
+    highs = df['high'].to_numpy(dtype=float)[order]
+
+    all_dates, day_starts = np.unique(sorted_dates, return_index=True)
+    day_ends = np.r_[day_starts[1:], len(sorted_dates)]
     last_day_date = all_dates[-1]
-    
-    for lvl_date in relevant_dates:
+    first_relevant = max(0, len(all_dates) - lookback_days)
+
+    # اجتماع بازه کندل‌های تمام روزهای بعد از روز k (از روز آخر به عقب ساخته می‌شود)
+    merged_lows, merged_highs = np.empty(0), np.empty(0)
+    per_day_levels = []
+    daily_groups = df.groupby(date_col)
+    for k in range(len(all_dates) - 1, first_relevant - 1, -1):
+        lvl_date = all_dates[k]
         daily_df = daily_groups.get_group(lvl_date)
-        
-        pdl = daily_df['low'].min()
-        pdh = daily_df['high'].max()
-        
-        # --- [اصلاح شد] --- فراخوانی تابع بدون پارامتر اضافی bin_size
-        profile = calc_daily_volume_profile(daily_df)
-        
-        poc = profile.get('poc')
-        vah = profile.get('vah')
-        val = profile.get('val')
-
-        potential_levels = {'PDL': pdl, 'PDH': pdh, 'POC': poc, 'VAH': vah, 'VAL': val}
-        
-        data_after = df[df[date_col] > lvl_date]
-        
-        for level_type, level_price in potential_levels.items():
-            if not level_price or pd.isna(level_price): continue
-            
-            if lvl_date == last_day_date:
-                levels.append({'date': lvl_date, 'level': level_price, 'level_type': level_type})
-                continue
-
-            is_touched = False
-            if not data_after.empty:
-                for _, future_candle in data_after.iterrows():
-                    if future_candle['low'] <= level_price <= future_candle['high']:
-                        is_touched = True
-                        break
-            
-            if not is_touched:
-                levels.append({'date': lvl_date, 'level': level_price, 'level_type': level_type})
-                
+        day_lows, day_highs = lows[day_starts[k]:day_ends[k]], highs[day_starts[k]:day_ends[k]]
+
+        if symbol:
+            profile = default_profile_engine.daily_histogram(symbol, (date_col, lvl_date), daily_df, final=lvl_date != last_day_date).profile()
+        else:
+            profile = calc_daily_volume_profile(daily_df)
+        potential_levels = {'PDL': day_lows.min(), 'PDH': day_highs.max(), 'POC': profile.get('poc'),
+                            'VAH': profile.get('vah'), 'VAL': profile.get('val')}
+        candidates = [(level_type, level_price) for level_type, level_price in potential_levels.items()
+                      if level_price and not pd.isna(level_price)]
+
+        if lvl_date == last_day_date:
+            touched = np.zeros(len(candidates), dtype=bool)
+        else:
+            prices = np.array([price for _, price in candidates], dtype=float)
+            touched = _is_covered(prices, merged_lows, merged_highs)
+
+        per_day_levels.append([{'date': lvl_date, 'level': level_price, 'level_type': level_type}
+                               for (level_type, level_price), is_touched in zip(candidates, touched) if not is_touched])
+
+        merged_lows, merged_highs = _merge_intervals(np.r_[merged_lows, day_lows], np.r_[merged_highs, day_highs])
+
+    for day_levels in reversed(per_day_levels):
+        levels.extend(day_levels)
+
     if not levels: return []
     final_levels = pd.DataFrame(levels).drop_duplicates(subset=['level']).to_dict('records')
-    return sorted(final_levels, key=lambda x: x['level'])
\ No newline at end of file
+    return sorted(final_levels, key=lambda x: x['level'])
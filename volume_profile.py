@@ -1,42 +1,243 @@
 # posmanagerfunc/volume_profile.py
 
+import math
+import threading
+import numpy as np
 import pandas as pd
 
-def calc_daily_volume_profile(daily_df):
+VALUE_AREA_RATIO = 0.70
+
+
+def auto_tick_size(reference_price, resolution=1e-4):
     """
-    پروفایل حجمی روزانه (POC, VAH, VAL) را محاسبه می‌کند.
+    اندازه پیش‌فرض هر بین: بزرگ‌ترین توان ۱۰ که از resolution × قیمت (پیش‌فرض ۰.۰۱ درصد قیمت) بیشتر نباشد؛
+    یعنی عرض هر بین بین ۰.۰۰۱ تا ۰.۰۱ درصد قیمت است (مثلا 1 برای BTC در 60000 و 0.1 برای ETH در 3000).
     """
-    if daily_df.empty:
-        return {'poc': 0, 'vah': 0, 'val': 0}
+    if not reference_price or reference_price <= 0:
+        return 1.0
+    return 10.0 ** math.floor(math.log10(reference_price * resolution))
 
-    # --- [اصلاح شد] --- پارامتر observed=True برای رفع هشدار و سازگاری با آینده اضافه شد.
-    price_volume = daily_df.groupby(pd.cut(daily_df['close'], bins=100), observed=True)['volume'].sum()
-    
-    if price_volume.empty or price_volume.sum() == 0:
-        return {'poc': 0, 'vah': 0, 'val': 0}
 
-    poc_level_cat = price_volume.idxmax()
-    poc_price = poc_level_cat.mid
-    
-    sorted_volume = price_volume.sort_values(ascending=False)
-    
-    total_volume = daily_df['volume'].sum()
-    value_area_limit = total_volume * 0.70
-    
-    cumulative_volume = 0
-    value_area_levels = []
-    
-    for level, volume in sorted_volume.items():
-        if cumulative_volume >= value_area_limit:
-            break
-        cumulative_volume += volume
-        value_area_levels.append(level.mid)
-        
-    if not value_area_levels:
-        return {'poc': poc_price, 'vah': poc_price, 'val': poc_price}
-        
-    vah = max(value_area_levels)
-    val = min(value_area_levels)
-    
-    return {'poc': poc_price, 'vah': vah, 'val': val}
+class VolumeHistogram:
+    """
+    هیستوگرام حجم معاملات روی بین‌هایی با اندازه ثابت tick_size.
+    counts[i] حجم بین شماره base + i است (بازه قیمتی [(base+i)*tick, (base+i+1)*tick)).
+    هیستوگرام‌هایی با tick یکسان را می‌توان بدون دسترسی به کندل‌ها با هم جمع کرد.
+    """
+    def __init__(self, tick_size, base=0, counts=None):
+        self.tick_size = tick_size
+        self.base = int(base)
+        self.counts = np.zeros(0) if counts is None else counts
+
+    @classmethod
+    def from_candles(cls, df, tick_size):
+        """
+        حجم هر کندل به صورت یکنواخت بین تمام بین‌های بازه high تا low آن پخش می‌شود.
+        با یک آرایه تفاضلی (دو np.bincount و یک cumsum) و بدون حلقه روی کندل‌ها ساخته می‌شود.
+        """
+        if df.empty:
+            return cls(tick_size)
+        lows = np.floor(df['low'].to_numpy(dtype=float) / tick_size).astype(np.int64)
+        highs = np.floor(df['high'].to_numpy(dtype=float) / tick_size).astype(np.int64)
+        volumes = np.nan_to_num(df['volume'].to_numpy(dtype=float))
+        lows, highs = np.minimum(lows, highs), np.maximum(lows, highs)
+        base = int(lows.min())
+        size = int(highs.max()) - base + 1
+        per_bin = volumes / (highs - lows + 1)
+        diff = (np.bincount(lows - base, weights=per_bin, minlength=size + 1)
+                - np.bincount(highs - base + 1, weights=per_bin, minlength=size + 1))
+        return cls(tick_size, base, np.cumsum(diff[:size]))
+
+    @classmethod
+    def merge(cls, histograms):
+        """جمع چند هیستوگرام با tick یکسان (مثلا هیستوگرام‌های روزانه برای پروفایل هفتگی)."""
+        histograms = [h for h in histograms if len(h.counts)]
+        if not histograms:
+            return cls(1.0)
+        tick_size = histograms[0].tick_size
+        if any(h.tick_size != tick_size for h in histograms):
+            raise ValueError("Cannot merge volume histograms with different tick sizes.")
+        base = min(h.base for h in histograms)
+        end = max(h.base + len(h.counts) for h in histograms)
+        counts = np.zeros(end - base)
+        for h in histograms:
+            counts[h.base - base:h.base - base + len(h.counts)] += h.counts
+        return cls(tick_size, base, counts)
+
+    @property
+    def total(self):
+        return float(self.counts.sum())
+
+    def price_of(self, i):
+        """قیمت وسط بین i ام."""
+        return (self.base + i + 0.5) * self.tick_size
+
+    def profile(self, value_area_ratio=VALUE_AREA_RATIO):
+        """
+        POC (پرحجم‌ترین بین) و محدوده ارزش: پرحجم‌ترین بین‌ها به ترتیب اضافه می‌شوند
+        تا حجم تجمعی به value_area_ratio از کل حجم برسد؛ VAH/VAL بالاترین و پایین‌ترین آن‌ها هستند.
+        """
+        total = self.total
+        if len(self.counts) == 0 or total == 0:
+            return {'poc': 0, 'vah': 0, 'val': 0}
+        poc_price = float(self.price_of(int(np.argmax(self.counts))))
+        order = np.argsort(self.counts, kind='stable')[::-1]
+        sorted_volume = self.counts[order]
+        volume_before = np.cumsum(sorted_volume) - sorted_volume
+        in_value_area = order[(volume_before < total * value_area_ratio) & (sorted_volume > 0)]
+        if len(in_value_area) == 0:
+            return {'poc': poc_price, 'vah': poc_price, 'val': poc_price}
+        return {'poc': poc_price, 'vah': float(self.price_of(in_value_area.max())),
+                'val': float(self.price_of(in_value_area.min()))}
+
+
+class VolumeProfileEngine:
+    """
+    هیستوگرام‌های روزانه هر نماد را کش می‌کند تا پروفایل‌های چندروزه (هفتگی یا ترکیبی)
+    فقط با جمع هیستوگرام‌های روزانه ساخته شوند و کندل‌های خام دوباره بین‌بندی نشوند.
+    اندازه tick هر نماد یک بار تعیین می‌شود تا هیستوگرام‌های آن همیشه قابل جمع باشند.
+    """
+    def __init__(self, tick_size=None, max_cached_days=400):
+        self.tick_size = tick_size
+        self.max_cached_days = max_cached_days
+        self._tick_sizes = {}
+        self._daily = {}
+        self._lock = threading.Lock()
+
+    def tick_size_for(self, symbol, reference_price):
+        with self._lock:
+            if symbol not in self._tick_sizes:
+                self._tick_sizes[symbol] = self.tick_size or auto_tick_size(reference_price)
+            return self._tick_sizes[symbol]
+
+    def daily_histogram(self, symbol, day_key, day_df, final=True):
+        """
+        هیستوگرام یک روز. day_key شامل تعریف روز هم هست (مثلا ('ny_date', date) یا ('utc_date', date)).
+        روزهای کامل شده (final=True) کش می‌شوند؛ روز جاری که هنوز کندل جدید می‌گیرد هر بار از نو ساخته می‌شود.
+        """
+        key = (symbol, day_key)
+        with self._lock:
+            cached = self._daily.get(key)
+        if cached is not None:
+            return cached
+        tick_size = self.tick_size_for(symbol, float(day_df['close'].iloc[-1]) if not day_df.empty else 0)
+        histogram = VolumeHistogram.from_candles(day_df, tick_size)
+        if final and not day_df.empty:
+            with self._lock:
+                self._daily[key] = histogram
+                if len(self._daily) > self.max_cached_days:
+                    self._daily.pop(next(iter(self._daily)))
+        return histogram
 
+    def composite_profile(self, symbol, df, date_col, final_dates=None, value_area_ratio=VALUE_AREA_RATIO):
+        """
+        پروفایل ترکیبی چند روز: df بر اساس date_col گروه‌بندی شده، هیستوگرام هر روز (در صورت وجود) از کش
+        خوانده و نتیجه جمع می‌شود. final_dates روزهای کامل شده (قابل کش) را مشخص می‌کند؛ پیش‌فرض همه به جز آخرین روز.
+        """
+        if df.empty:
+            return {'poc': 0, 'vah': 0, 'val': 0}
+        groups = df.groupby(date_col)
+        days = sorted(groups.groups.keys())
+        if final_dates is None:
+            final_dates = set(days[:-1])
+        histograms = [self.daily_histogram(symbol, (date_col, day), groups.get_group(day), final=day in final_dates)
+                      for day in days]
+        return VolumeHistogram.merge(histograms).profile(value_area_ratio)
+
+
+class DevelopingProfile:
+    """
+    پروفایل حجمی در حال تشکیل سشن جاری (dPOC/dVAH/dVAL) که با هر کندل بسته شده به‌روز می‌شود.
+    افزودن هر کندل O(range/tick) است؛ POC هنگام افزودن به‌روز می‌شود و محدوده ارزش فقط
+    هنگام درخواست (حداکثر یک بار به ازای هر کندل) از روی هیستوگرام محاسبه می‌شود.
+    """
+    GROWTH_PADDING = 256
+
+    def __init__(self, tick_size):
+        self.tick_size = tick_size
+        self.reset()
+
+    def reset(self, session_key=None):
+        """پروفایل را برای یک سشن جدید (مثلا روز معاملاتی نیویورک) خالی می‌کند."""
+        self.session_key = session_key
+        self.histogram = VolumeHistogram(self.tick_size)
+        self.candle_count = 0
+        self._poc_index = None
+        self._profile = None
+
+    def _ensure_range(self, lo, hi):
+        h = self.histogram
+        if len(h.counts) == 0:
+            h.base = lo - self.GROWTH_PADDING
+            h.counts = np.zeros(hi - lo + 1 + 2 * self.GROWTH_PADDING)
+            return
+        end = h.base + len(h.counts)
+        if lo >= h.base and hi < end:
+            return
+        new_base = min(h.base, lo - self.GROWTH_PADDING)
+        new_end = max(end, hi + 1 + self.GROWTH_PADDING)
+        counts = np.zeros(new_end - new_base)
+        counts[h.base - new_base:end - new_base] = h.counts
+        if self._poc_index is not None:
+            self._poc_index += h.base - new_base
+        h.base, h.counts = new_base, counts
+
+    def add_candle(self, high, low, volume):
+        """حجم یک کندل را به صورت یکنواخت بین بین‌های بازه high-low آن اضافه می‌کند."""
+        lo = int(math.floor(min(low, high) / self.tick_size))
+        hi = int(math.floor(max(low, high) / self.tick_size))
+        self._ensure_range(lo, hi)
+        h = self.histogram
+        start, stop = lo - h.base, hi - h.base + 1
+        h.counts[start:stop] += volume / (stop - start)
+        local = start + int(np.argmax(h.counts[start:stop]))
+        if self._poc_index is None or h.counts[local] > h.counts[self._poc_index]:
+            self._poc_index = local
+        self.candle_count += 1
+        self._profile = None
+
+    def add_footprint(self, bar):
+        """
+        حجم واقعی هر قیمت از یک کندل فوت‌پرینت (footprint.FootprintBar با همین tick_size) را اضافه می‌کند؛
+        دقیق‌تر از پخش یکنواخت حجم کندل بین high و low.
+        """
+        prices, buy, sell = bar.volumes()
+        if len(prices) == 0:
+            return
+        if bar.tick_size != self.tick_size:
+            raise ValueError("Footprint tick size does not match the developing profile.")
+        lo, hi = bar.base, bar.base + len(prices) - 1
+        self._ensure_range(lo, hi)
+        h = self.histogram
+        start, stop = lo - h.base, hi - h.base + 1
+        h.counts[start:stop] += buy + sell
+        local = start + int(np.argmax(h.counts[start:stop]))
+        if self._poc_index is None or h.counts[local] > h.counts[self._poc_index]:
+            self._poc_index = local
+        self.candle_count += 1
+        self._profile = None
+
+    def profile(self, value_area_ratio=VALUE_AREA_RATIO):
+        """dPOC و محدوده ارزش در حال تشکیل به صورت {'poc', 'vah', 'val'}."""
+        if self._profile is None:
+            if self._poc_index is None or self.histogram.total == 0:
+                self._profile = {'poc': 0, 'vah': 0, 'val': 0}
+            else:
+                self._profile = self.histogram.profile(value_area_ratio)
+                self._profile['poc'] = float(self.histogram.price_of(self._poc_index))
+        return self._profile
+
+
+# یک نمونه مشترک برای کل برنامه
+default_profile_engine = VolumeProfileEngine()
+
+
+def calc_daily_volume_profile(daily_df, tick_size=None):
+    """
+    پروفایل حجمی روزانه (POC, VAH, VAL) را محاسبه می‌کند.
+    حجم هر کندل بین تمام قیمت‌های بازه high-low آن پخش شده و با بین‌هایی به اندازه tick_size شمرده می‌شود.
+    """
+    if daily_df.empty:
+        return {'poc': 0, 'vah': 0, 'val': 0}
+    tick_size = tick_size or auto_tick_size(float(pd.to_numeric(daily_df['close']).iloc[-1]))
+    return VolumeHistogram.from_candles(daily_df, tick_size).profile()